@@ -0,0 +1,185 @@
+# analisis_offline.py
+# Análisis offline de videos / imágenes / carpetas: solo se decodifican los frames muestreados.
+#   python analisis_offline.py videos/ micro.jpg --cada 10 --salida resultados.csv [--procesos 4] [--modo grab]
+import argparse
+import csv
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+from deteccion import Detector, estado_micro
+from deteccion.fuentes import EXT_IMAGEN
+
+EXT_VIDEO = (".mp4", ".avi", ".mov", ".mkv", ".webm", ".m4v")
+MUESTRAS_POR_TAREA = 30     # los videos largos se reparten en tramos entre procesos
+# cada proceso carga su propio modelo (cientos de MB con torch): por defecto pocos procesos
+PROCESOS_DEF = min(4, max(1, (os.cpu_count() or 1) // 2))
+
+_detector = None
+_guardar_en = None
+
+
+def _init_worker(model_path, guardar_en, imgsz=640, conf=0.25, hilos=1):
+    """
+    Cada proceso carga su propio modelo una sola vez. Los hilos de torch/OpenCV se
+    limitan a `hilos` para no tener procesos x núcleos hilos compitiendo por la CPU.
+    """
+    global _detector, _guardar_en
+    cv2.setNumThreads(hilos)
+    try:
+        import torch
+        torch.set_num_threads(hilos)
+    except ImportError:
+        pass        # modelos ONNX/OpenVINO sin torch instalado
+    _detector = Detector(model_path, imgsz=imgsz, conf=conf)
+    _detector.calentar()
+    _guardar_en = guardar_en
+
+
+def _contar(frame, fuente, ts):
+    n, result = _detector.contar(frame)
+    if _guardar_en:
+        # videos con el mismo nombre en carpetas distintas no deben pisarse: hash de la ruta
+        base = os.path.splitext(os.path.basename(fuente))[0]
+        h = hashlib.sha1(os.path.abspath(fuente).encode("utf-8")).hexdigest()[:8]
+        cv2.imwrite(os.path.join(_guardar_en, f"{base}_{h}_{ts:09.2f}.jpg"), result.plot())
+    return (fuente, round(ts, 3), n, estado_micro(n))
+
+
+def listar_fuentes(rutas):
+    """Expande carpetas (recursivo) a la lista de imágenes y videos que contienen."""
+    out = []
+    for r in rutas:
+        if os.path.isdir(r):
+            for raiz, _, archivos in os.walk(r):
+                for f in sorted(archivos):
+                    if f.lower().endswith(EXT_IMAGEN + EXT_VIDEO):
+                        out.append(os.path.join(raiz, f))
+        else:
+            out.append(r)
+    return out
+
+
+def _info_video(ruta):
+    cap = cv2.VideoCapture(ruta)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+    n_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    cap.release()
+    return fps, n_frames
+
+
+def planificar(fuentes, cada):
+    """
+    Tareas (fuente, primer_frame, ultimo_frame, paso_frames, fps). Las imágenes, y los
+    videos sin FPS/duración conocidos, se analizan como una sola muestra.
+    """
+    tareas = []
+    for f in fuentes:
+        if f.lower().endswith(EXT_IMAGEN):
+            tareas.append((f, 0, 0, 1, 0.0))
+            continue
+        fps, n_frames = _info_video(f)
+        if fps <= 0 or n_frames <= 0:
+            tareas.append((f, 0, 0, 1, 0.0))
+            continue
+        paso = max(1, int(round(fps * cada)))
+        bloque = paso * MUESTRAS_POR_TAREA
+        for ini in range(0, n_frames, bloque):
+            tareas.append((f, ini, min(n_frames, ini + bloque) - 1, paso, fps))
+    return tareas
+
+
+def _procesar(tarea, modo):
+    fuente, ini, fin, paso, fps = tarea
+    if fps <= 0:
+        # imagen (o video sin metadatos): una sola muestra
+        frame = cv2.imread(fuente) if fuente.lower().endswith(EXT_IMAGEN) else None
+        if frame is None:
+            cap = cv2.VideoCapture(fuente)
+            ret, frame = cap.read()
+            cap.release()
+            if not ret:
+                return []
+        return [_contar(frame, fuente, 0.0)]
+
+    out = []
+    cap = cv2.VideoCapture(fuente)
+    if modo == "seek":
+        for idx in range(ini, fin + 1, paso):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, idx)
+            ret, frame = cap.read()
+            if not ret:
+                break
+            out.append(_contar(frame, fuente, idx / fps))
+    else:
+        # grab(): avanza sin decodificar; retrieve() solo en los frames muestreados
+        cap.set(cv2.CAP_PROP_POS_FRAMES, ini)
+        for idx in range(ini, fin + 1):
+            if not cap.grab():
+                break
+            if (idx - ini) % paso == 0:
+                ret, frame = cap.retrieve()
+                if ret:
+                    out.append(_contar(frame, fuente, idx / fps))
+    cap.release()
+    return out
+
+
+def _procesar_seek(tarea):
+    return _procesar(tarea, "seek")
+
+
+def _procesar_grab(tarea):
+    return _procesar(tarea, "grab")
+
+
+def analizar(rutas, cada=10.0, salida="resultados.csv", procesos=None, modo="seek",
+             model_path="yolov8n.pt", guardar_en=None, imgsz=640, conf=0.25):
+    """
+    Analiza todas las fuentes y escribe (source, timestamp, count, status) en CSV o Parquet.
+    procesos=None usa PROCESOS_DEF; los núcleos se reparten como hilos entre los procesos.
+    """
+    if guardar_en:
+        os.makedirs(guardar_en, exist_ok=True)
+    tareas = planificar(listar_fuentes(rutas), cada)
+    trabajo = _procesar_seek if modo == "seek" else _procesar_grab
+    filas = []
+    t0 = time.time()
+    procesos = procesos or PROCESOS_DEF
+    hilos = max(1, (os.cpu_count() or 1) // procesos)
+    with ProcessPoolExecutor(max_workers=procesos, initializer=_init_worker,
+                             initargs=(model_path, guardar_en, imgsz, conf, hilos)) as pool:
+        for res in pool.map(trabajo, tareas):
+            filas.extend(res)
+    filas.sort(key=lambda f: (f[0], f[1]))
+
+    if salida.endswith(".parquet"):
+        import pandas as pd
+        pd.DataFrame(filas, columns=["source", "timestamp", "count", "status"]).to_parquet(salida, index=False)
+    else:
+        with open(salida, "w", newline="", encoding="utf-8") as fh:
+            w = csv.writer(fh)
+            w.writerow(["source", "timestamp", "count", "status"])
+            w.writerows(filas)
+    print(f"✅ {len(filas)} muestras de {len(tareas)} tareas en {time.time() - t0:.1f} s -> {salida}")
+    return filas
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Conteo de personas offline sobre videos / imágenes / carpetas")
+    ap.add_argument("rutas", nargs="+")
+    ap.add_argument("--cada", type=float, default=10.0, help="segundos entre muestras de video")
+    ap.add_argument("--salida", default="resultados.csv", help=".csv o .parquet")
+    ap.add_argument("--procesos", type=int, default=None, help=f"procesos (un modelo cada uno); por defecto {PROCESOS_DEF}")
+    ap.add_argument("--modo", choices=("seek", "grab"), default="seek",
+                    help="seek: salta directo al frame; grab: avanza sin decodificar (códecs con seek impreciso)")
+    ap.add_argument("--modelo", default="yolov8n.pt", help=".pt, .onnx o carpeta *_openvino_model")
+    ap.add_argument("--imgsz", type=int, default=640)
+    ap.add_argument("--conf", type=float, default=0.25)
+    ap.add_argument("--guardar-frames", default=None, help="carpeta para guardar los frames anotados")
+    a = ap.parse_args()
+    analizar(a.rutas, cada=a.cada, salida=a.salida, procesos=a.procesos, modo=a.modo,
+             model_path=a.modelo, guardar_en=a.guardar_frames, imgsz=a.imgsz, conf=a.conf)
@@ -0,0 +1,102 @@
+# arrivals_cache.py
+# Caché en memoria por parada con TTL corto, stale-while-revalidate y single-flight.
+import threading, time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class _Vuelo:
+    """Una descarga en curso; los pedidos concurrentes de la misma clave esperan su resultado."""
+    __slots__ = ("listo", "valor", "error")
+
+    def __init__(self):
+        self.listo = threading.Event()
+        self.valor: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class ArrivalsCache:
+    """
+    get(key) responde:
+      "hit"   -> entrada con menos de ttl_sec
+      "stale" -> entrada vencida pero con menos de ttl_sec + stale_sec: se devuelve igual
+                 y se revalida en segundo plano (una sola descarga por clave)
+      "miss"  -> sin entrada usable: se descarga; los pedidos concurrentes de la misma
+                 clave comparten esa única llamada a fetch_fn (single-flight)
+    Si la revalidación falla se sigue sirviendo la entrada vieja hasta que supere stale_sec.
+    """
+
+    def __init__(self, fetch_fn: Callable[[str], Any], ttl_sec: float = 15.0, stale_sec: float = 120.0,
+                 max_entries: int = 2000):
+        self.fetch_fn = fetch_fn
+        self.ttl_sec = ttl_sec
+        self.stale_sec = stale_sec
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._datos: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()   # key -> (instante, valor)
+        self._vuelos: Dict[str, _Vuelo] = {}
+        self.hits = self.stale = self.misses = self.coalesced = 0
+        self.upstream_calls = self.errors = 0
+        self.upstream_ms_total = self.upstream_ms_max = 0.0
+
+    def _descargar(self, key: str, vuelo: _Vuelo):
+        t0 = time.perf_counter()
+        try:
+            vuelo.valor = self.fetch_fn(key)
+        except BaseException as e:
+            vuelo.error = e
+        ms = (time.perf_counter() - t0) * 1000
+        with self._lock:
+            self.upstream_calls += 1
+            self.upstream_ms_total += ms
+            self.upstream_ms_max = max(self.upstream_ms_max, ms)
+            if vuelo.error is None:
+                self._datos[key] = (time.time(), vuelo.valor)
+                self._datos.move_to_end(key)
+                while len(self._datos) > self.max_entries:
+                    self._datos.popitem(last=False)
+            else:
+                self.errors += 1
+            del self._vuelos[key]
+        vuelo.listo.set()
+
+    def get(self, key: str) -> Tuple[Any, str, float]:
+        """(valor, "hit"|"stale"|"miss", edad_s). En un miss fallido propaga el error de fetch_fn."""
+        now = time.time()
+        with self._lock:
+            ent = self._datos.get(key)
+            edad = now - ent[0] if ent else None
+            if ent and edad < self.ttl_sec:
+                self.hits += 1
+                self._datos.move_to_end(key)
+                return ent[1], "hit", edad
+            vuelo = self._vuelos.get(key)
+            if ent and edad < self.ttl_sec + self.stale_sec:
+                self.stale += 1
+                if vuelo is None:
+                    vuelo = self._vuelos[key] = _Vuelo()
+                    threading.Thread(target=self._descargar, args=(key, vuelo), name="arrivals-refresh",
+                                     daemon=True).start()
+                return ent[1], "stale", edad
+            self.misses += 1
+            lider = vuelo is None
+            if lider:
+                vuelo = self._vuelos[key] = _Vuelo()
+            else:
+                self.coalesced += 1
+        if lider:
+            self._descargar(key, vuelo)
+        else:
+            vuelo.listo.wait()
+        if vuelo.error is not None:
+            raise vuelo.error
+        return vuelo.valor, "miss", 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._datos), "in_flight": len(self._vuelos), "hits": self.hits,
+                    "stale": self.stale, "misses": self.misses, "coalesced": self.coalesced,
+                    "upstream_calls": self.upstream_calls, "errors": self.errors,
+                    "upstream_ms_avg": round(self.upstream_ms_total / self.upstream_calls, 1) if self.upstream_calls else 0.0,
+                    "upstream_ms_max": round(self.upstream_ms_max, 1),
+                    "ttl_sec": self.ttl_sec, "stale_sec": self.stale_sec}
@@ -0,0 +1,454 @@
+# bench.py
+# Microbenchmarks del simulador / servidor. Uso:
+#   python bench.py [eta|stops|stops_grid|geo|fleet|board|clock|ingest|yolo_batch|yolo_config ...]
+import os, sys, time, math, random, sqlite3
+from typing import List, Tuple, Callable
+
+from geopy.distance import geodesic
+from route_geometry import project_points, SegmentGrid, LocalRoute, dist_km
+from occupancy_store import OccupancyWriter, init_schema, INSERT_SQL as OCC_INSERT_SQL
+
+ORIGEN = (-33.0066285122585, -71.5451341716933)
+# Mismos valores que tracker_server. No se importa: abriría ocupacion.sqlite, el escritor y el poller RED.
+STOP_MATCH_DIST_M = 60.0
+STOP_RADIUS_KM = 0.02
+SIM_TICK_SEC = 0.25
+
+
+def _meters_per_deg(lat: float) -> Tuple[float,float]:
+    """Escala esférica simple (la que usaba el servidor antes de route_geometry), para las versiones originales."""
+    return 111_320.0, 40075000.0 * math.cos(math.radians(lat)) / 360.0
+
+
+def _ruta_sintetica(n_pts: int, largo_km: float = 20.0) -> List[Tuple[float,float]]:
+    """Polilínea en zig-zag de n_pts puntos y ~largo_km km alrededor de Viña."""
+    lat0, lon0 = ORIGEN
+    mlat, mlon = _meters_per_deg(lat0)
+    paso_m = largo_km * 1000.0 / max(1, n_pts - 1)
+    pts = []
+    for i in range(n_pts):
+        x = i * paso_m * 0.8
+        y = 0.6 * paso_m * (i % 2) + 300.0 * math.sin(i / 50.0)
+        pts.append((lat0 + y / mlat, lon0 + x / mlon))
+    return pts
+
+
+def _cum_geodesic(route) -> List[float]:
+    """Distancia acumulada con geodesic (como se calculaba antes de LocalRoute)."""
+    cum = [0.0]
+    for i in range(len(route)-1):
+        cum.append(cum[-1] + geodesic(route[i], route[i+1]).km)
+    return cum
+
+
+def _medir(fn: Callable[[], object], reps: int) -> float:
+    """Tiempo promedio por llamada (µs)."""
+    fn()
+    t0 = time.perf_counter()
+    for _ in range(reps):
+        fn()
+    return (time.perf_counter() - t0) / reps * 1e6
+
+
+# ==================== ETA / distancia restante ====================
+def _remaining_recorriendo(bus) -> float:
+    """Versión original: recorre con geodesic todos los tramos restantes."""
+    route = bus["route"]; idx = bus["idx"]
+    rem = geodesic((bus["lat"], bus["lon"]), route[idx+1]).km
+    for i in range(idx+1, len(route)-1):
+        rem += geodesic(route[i], route[i+1]).km
+    return rem
+
+
+def bench_eta():
+    print(f"{'puntos':>8} {'recorrido (µs)':>16} {'indexado (µs)':>15}")
+    for n in (100, 1000, 5000):
+        route = _ruta_sintetica(n)
+        bus = {"route": route, "idx": 0, "lat": route[0][0], "lon": route[0][1]}
+        geo = LocalRoute(route)
+        reps_lento = max(1, 2000 // n)
+        lento = _medir(lambda: _remaining_recorriendo(bus), reps_lento)
+        rapido = _medir(lambda: geo.remaining_km(bus["lat"], bus["lon"], bus["idx"]), 2000)
+        ref = _remaining_recorriendo(bus)
+        assert abs(ref - geo.remaining_km(bus["lat"], bus["lon"], 0)) < 2e-3 * ref     # escala local vs geodesic
+        print(f"{n:>8} {lento:>16.1f} {rapido:>15.1f}")
+
+
+# ==================== Proyección de paraderos ====================
+def _project_bucle(route, pt):
+    """Versión original: bucle Python con geodesic por tramo."""
+    min_d = 1e18; acc_km = 0.0; best = 0.0
+    for i in range(len(route)-1):
+        a = route[i]; b = route[i+1]
+        mlat, mlon = _meters_per_deg((a[0]+b[0])/2.0)
+        ax, ay = a[1]*mlon, a[0]*mlat
+        vx, vy = b[1]*mlon-ax, b[0]*mlat-ay
+        wx, wy = pt[1]*mlon-ax, pt[0]*mlat-ay
+        l2 = vx*vx + vy*vy
+        t = 0.0 if l2 == 0 else max(0.0, min(1.0, (wx*vx + wy*vy)/l2))
+        d = math.hypot(wx-t*vx, wy-t*vy)
+        seg_km = geodesic(a, b).km
+        if d < min_d:
+            min_d = d; best = acc_km + seg_km*t
+        acc_km += seg_km
+    return min_d, best
+
+
+def _paraderos_sinteticos(route, n: int, disp_m: float = 150.0, seed: int = 7):
+    rnd = random.Random(seed)
+    mlat, mlon = _meters_per_deg(route[0][0])
+    out = []
+    for _ in range(n):
+        lat, lon = route[rnd.randrange(len(route))]
+        out.append((lat + rnd.uniform(-disp_m, disp_m)/mlat, lon + rnd.uniform(-disp_m, disp_m)/mlon))
+    return out
+
+
+def bench_stops():
+    route = _ruta_sintetica(2000, 20.0)
+    cum = _cum_geodesic(route)
+    pts = _paraderos_sinteticos(route, 300)
+    muestra = pts[:5]
+    t0 = time.perf_counter()
+    ref = [_project_bucle(route, p) for p in muestra]
+    bucle_s = (time.perf_counter() - t0) / len(muestra) * len(pts)
+    t0 = time.perf_counter()
+    d, along = project_points(route, cum, pts)
+    vec_s = time.perf_counter() - t0
+    for (rd, ra), vd, va in zip(ref, d, along):
+        # la versión original usa escala esférica; project_points la WGS84 (~0.35 % de diferencia)
+        assert abs(rd - vd) <= 5e-3 * rd + 1e-6 and abs(ra - va) <= 5e-3 * ra + 1e-6
+    print(f"ruta 20 km / {len(route)} pts, {len(pts)} paraderos")
+    print(f"  bucle geodesic (estimado): {bucle_s:8.2f} s")
+    print(f"  vectorizado NumPy        : {vec_s*1000:8.1f} ms")
+
+
+def bench_stops_grid():
+    route = _ruta_sintetica(3000, 30.0)
+    cum = LocalRoute(route).cum_km
+    # bbox amplia (~30 x 10 km) con miles de nodos bus_stop, casi todos lejos de la ruta
+    rnd = random.Random(11)
+    lats = [p[0] for p in route]; lons = [p[1] for p in route]
+    s, w, n, e = min(lats)-0.05, min(lons)-0.01, max(lats)+0.05, max(lons)+0.01
+    print(f"{'nodos':>7} {'denso (ms)':>11} {'grilla (ms)':>12} {'match':>6}")
+    for n_nodos in (1000, 5000, 20000):
+        pts = [(rnd.uniform(s, n), rnd.uniform(w, e)) for _ in range(n_nodos)]
+        pts += _paraderos_sinteticos(route, n_nodos // 20, disp_m=50.0)
+        t0 = time.perf_counter()
+        d_ref, a_ref = project_points(route, cum, pts)
+        denso = (time.perf_counter() - t0) * 1000
+        t0 = time.perf_counter()
+        d, a = SegmentGrid(route, cum, STOP_MATCH_DIST_M).project_near(pts)
+        grilla = (time.perf_counter() - t0) * 1000
+        ok = d_ref <= STOP_MATCH_DIST_M
+        assert (ok == (d <= STOP_MATCH_DIST_M)).all()
+        assert abs(d[ok] - d_ref[ok]).max() < 1e-6 and abs(a[ok] - a_ref[ok]).max() < 1e-9
+        print(f"{len(pts):>7} {denso:>11.1f} {grilla:>12.1f} {int(ok.sum()):>6}")
+
+
+# ==================== Geodesia local (LocalRoute) ====================
+def _advance_geodesic(bus, step_km: float):
+    """Versión original de _advance_along_route: geodesic por cada vértice alcanzado."""
+    route = bus["route"]; idx = bus["idx"]; lat, lon = bus["lat"], bus["lon"]
+    while step_km > 0 and idx < len(route)-1:
+        nlat, nlon = route[idx+1]
+        d = geodesic((lat, lon), (nlat, nlon)).km
+        if step_km >= d:
+            lat, lon = nlat, nlon; step_km -= d; idx += 1
+        else:
+            lat += (nlat-lat)*step_km/d; lon += (nlon-lon)*step_km/d; step_km = 0
+    bus["lat"], bus["lon"], bus["idx"] = lat, lon, idx
+
+
+def _advance_local(bus, step_km: float):
+    """Avance por bus con LocalRoute (bucle Python por bus, antes de FleetStore)."""
+    route = bus["route"]; geo = bus["geo"]; idx = bus["idx"]; lat, lon = bus["lat"], bus["lon"]
+    while step_km > 0 and idx < len(route)-1:
+        nlat, nlon = route[idx+1]
+        d = geo.dist_to_vertex_km(lat, lon, idx+1)
+        if step_km >= d:
+            lat, lon = nlat, nlon; step_km -= d; idx += 1
+        else:
+            lat += (nlat-lat)*step_km/d; lon += (nlon-lon)*step_km/d; step_km = 0
+    bus["lat"], bus["lon"], bus["idx"] = lat, lon, idx
+
+
+def bench_geo(n_buses: int = 200, ticks: int = 20):
+    """Error de LocalRoute / dist_km frente a geodesic (las tolerancias se verifican en test_route_geometry.py) y costo por tick."""
+    rnd = random.Random(3)
+    peor_seg = peor_pt = peor_tot = 0.0
+    for largo in (5.0, 20.0, 40.0):
+        route = _ruta_sintetica(1000, largo)
+        geo = LocalRoute(route)
+        ref = _cum_geodesic(route)
+        peor_tot = max(peor_tot, abs(geo.total_km - ref[-1]) / ref[-1])
+        for i in range(0, len(route)-1, 7):
+            g = ref[i+1] - ref[i]
+            if g > 0.001:
+                peor_seg = max(peor_seg, abs(geo.seg_km[i] - g) / g)
+        for _ in range(500):
+            a = route[rnd.randrange(len(route))]
+            b = (a[0] + rnd.uniform(-0.01, 0.01), a[1] + rnd.uniform(-0.01, 0.01))
+            g = geodesic(a, b).km
+            if g > 0.001:
+                peor_pt = max(peor_pt, abs(dist_km(a, b) - g) / g)
+    print("error relativo máx vs geodesic (rutas de 5-40 km):")
+    print(f"  tramos LocalRoute: {peor_seg*100:.3f} %   largo total: {peor_tot*100:.3f} %   "
+          f"dist_km (puntos a <1.5 km): {peor_pt*100:.3f} %")
+
+    route = _ruta_sintetica(2000, 20.0)
+    cum = _cum_geodesic(route)
+    stops = [route[i] for i in range(50, len(route), 100)]
+    def flota():
+        return [{"route": route, "route_cum_km": cum, "geo": LocalRoute(route), "idx": k * 7,
+                 "lat": route[k * 7][0], "lon": route[k * 7][1], "placed": True, "stops": stops,
+                 "next_stop_idx": 0} for k in range(n_buses)]
+    step_km = 25.0 * SIM_TICK_SEC / 3600.0
+
+    buses = flota()
+    t0 = time.perf_counter()
+    for _ in range(ticks):
+        for b in buses:
+            _advance_geodesic(b, step_km)
+            if b["idx"] < len(route)-1:
+                geodesic((b["lat"], b["lon"]), route[b["idx"]+1]).km + (cum[-1] - cum[b["idx"]+1])
+            tgt = stops[b["next_stop_idx"] % len(stops)]
+            geodesic((b["lat"], b["lon"]), tgt).km
+    antes = (time.perf_counter() - t0) / ticks * 1000
+
+    buses = flota()
+    t0 = time.perf_counter()
+    for _ in range(ticks):
+        for b in buses:
+            _advance_local(b, step_km)
+            b["geo"].remaining_km(b["lat"], b["lon"], b["idx"])
+            tgt = stops[b["next_stop_idx"] % len(stops)]
+            b["geo"].dist_km((b["lat"], b["lon"]), tgt)
+    despues = (time.perf_counter() - t0) / ticks * 1000
+    print(f"tick de {n_buses} buses (ruta 20 km / {len(route)} pts):")
+    print(f"  geodesic  : {antes:8.2f} ms/tick")
+    print(f"  LocalRoute: {despues:8.2f} ms/tick")
+
+
+# ==================== Flota en arreglos (FleetStore) ====================
+def bench_fleet(ticks: int = 20):
+    """ms por tick con un bucle Python por bus (dicts) vs FleetStore.advance_all, para flotas grandes."""
+    from fleet import FleetStore
+    rutas = [_ruta_sintetica(1000, 15.0 + k) for k in range(8)]
+    geos = [LocalRoute(r) for r in rutas]
+    paradas = [[r[i] for i in range(40, len(r), 60)] for r in rutas]
+    dt = SIM_TICK_SEC
+    step_km = 25.0 * dt / 3600.0
+    print(f"{'buses':>7} {'dicts (ms)':>11} {'arreglos (ms)':>14} {'bus-ticks/s':>12}")
+    for n in (100, 1000, 5000):
+        buses = [{"route": rutas[k % 8], "geo": geos[k % 8], "idx": 0, "lat": rutas[k % 8][0][0],
+                  "lon": rutas[k % 8][0][1], "stops": paradas[k % 8], "next_stop_idx": 0} for k in range(n)]
+        t0 = time.perf_counter()
+        for _ in range(ticks):
+            for b in buses:
+                _advance_local(b, step_km)
+                b["geo"].remaining_km(b["lat"], b["lon"], b["idx"])
+                tgt = b["stops"][b["next_stop_idx"] % len(b["stops"])]
+                b["geo"].dist_km((b["lat"], b["lon"]), tgt)
+        dicts = (time.perf_counter() - t0) / ticks * 1000
+
+        flota = FleetStore(stop_radius_km=STOP_RADIUS_KM)
+        for k in range(n):
+            r = rutas[k % 8]
+            flota.add(f"bus{k:05d}", r[0][0], r[0][1], 25.0, r, stops=paradas[k % 8])
+        now = time.time()
+        t0 = time.perf_counter()
+        for i in range(ticks):
+            flota.advance_all(dt, now + i * dt)
+            flota.columnas(now + i * dt)
+        arreglos = (time.perf_counter() - t0) / ticks * 1000
+        print(f"{n:>7} {dicts:>11.2f} {arreglos:>14.2f} {n / arreglos * 1000:>12.0f}")
+
+
+# ==================== Tablero de llegadas por parada ====================
+def bench_board(ticks: int = 10):
+    """Costo del tablero por tick y de "qué llega a la parada X": recorrer la flota por consulta vs lookup."""
+    from fleet import FleetStore
+    rutas = [_ruta_sintetica(1000, 15.0 + k) for k in range(8)]
+    idx = [list(range(40, 1000, 60)) for _ in rutas]
+    dt = SIM_TICK_SEC
+    print(f"{'buses':>7} {'paradas':>8} {'tablero (ms/tick)':>18} {'recorrido (µs)':>15} {'lookup (µs)':>12}")
+    for n in (100, 1000, 5000):
+        flota = FleetStore(stop_radius_km=STOP_RADIUS_KM)
+        for k in range(n):
+            r, ii = rutas[k % 8], idx[k % 8]
+            # las rutas comparten ids de paradas de a pares, como líneas que se cruzan
+            flota.add(f"bus{k:05d}", r[0][0], r[0][1], 25.0, r, stops=[r[i] for i in ii],
+                      stop_ids=[(k % 4) * 1000 + i for i in ii])
+        now = time.time()
+        for i in range(40):
+            flota.advance_all(20.0, now + i * 20.0)
+        now += 800.0
+        t0 = time.perf_counter()
+        for _ in range(ticks):
+            board = flota.tablero(now)
+        tablero = (time.perf_counter() - t0) / ticks * 1000
+        sid = 1000 + idx[0][-1]
+
+        def recorrer():
+            # lo que haría un endpoint sin tablero: revisar cada bus y sus paradas
+            out = []
+            for s in range(len(flota.ids)):
+                if not flota.activo[s]:
+                    continue
+                for j in range(flota.stop_ini[s] + flota.next_stop[s], flota.stop_ini[s] + flota.stop_n[s]):
+                    if flota.stop_pos[j] >= 0 and flota._sid[flota.stop_pos[j]] == sid:
+                        out.append(((flota.stop_km[j] - flota.along[s]) / flota.speed[s] * 60, flota.ids[s]))
+            return sorted(out)[:10]
+        reco = _medir(recorrer, 3)
+        look = _medir(lambda: board.get(sid), 10000)
+        print(f"{n:>7} {len(board):>8} {tablero:>18.2f} {reco:>15.0f} {look:>12.2f}")
+
+
+# ==================== Reloj virtual: repetición de un día ====================
+def _dia_simulado(n: int, dt: float, rutas, paradas) -> Tuple[int, float, str]:
+    """Un día completo en modo pasos, con buses en vueltas; (ticks, segundos, huella del estado final)."""
+    import hashlib
+    from fleet import FleetStore
+    from sim_clock import SimClock, repetir
+    flota = FleetStore(stop_radius_km=STOP_RADIUS_KM)
+    for k in range(n):
+        r = rutas[k % len(rutas)]
+        flota.add(f"bus{k:05d}", r[0][0], r[0][1], 15.0 + k % 30, r, stops=paradas[k % len(rutas)])
+    reloj = SimClock("pasos", inicio=1_700_000_000.0)
+    t0 = time.perf_counter()
+    ticks = repetir(flota, reloj, 24 * 3600, dt, circular=True)
+    seg = time.perf_counter() - t0
+    huella = hashlib.sha1(b"".join(a.tobytes() for a in (flota.lat, flota.lon, flota.along, flota.next_stop)))
+    return ticks, seg, huella.hexdigest()[:12]
+
+
+def bench_clock(dt: float = 10.0):
+    """bus-ticks/s sostenidos repitiendo 24 h virtuales; dos corridas deben dar la misma huella."""
+    rutas = [_ruta_sintetica(1000, 15.0 + k) for k in range(8)]
+    paradas = [[r[i] for i in range(40, len(r), 60)] for r in rutas]
+    print(f"{'buses':>7} {'ticks':>7} {'seg':>7} {'x tiempo real':>14} {'bus-ticks/s':>12} {'huella':>14} {'determinista':>13}")
+    for n in (100, 1000, 5000):
+        ticks, seg, h1 = _dia_simulado(n, dt, rutas, paradas)
+        _, _, h2 = _dia_simulado(n, dt, rutas, paradas)
+        print(f"{n:>7} {ticks:>7} {seg:>7.2f} {24 * 3600 / seg:>14.0f} {n * ticks / seg:>12.0f} {h1:>14} {str(h1 == h2):>13}")
+
+
+# ==================== Ingesta de ocupación ====================
+def _borrar_db(path: str):
+    for suf in ("", "-wal", "-shm"):
+        if os.path.exists(path + suf):
+            os.remove(path + suf)
+
+
+def _db_temporal(path: str):
+    _borrar_db(path)
+    con = sqlite3.connect(path)
+    init_schema(con)
+    con.close()
+
+
+def bench_ingest(n: int = 3000, path: str = "bench_ingest.sqlite"):
+    """Carga sostenida: una conexión+commit por lectura (antes) vs OccupancyWriter (después)."""
+    ahora = int(time.time())
+    filas = [(f"bus{i % 100:03d}", time.strftime("%Y-%m-%d %H:%M:%S"), ahora + i, i % 45, "x", 40, (i % 45) / 40)
+             for i in range(n)]
+    _db_temporal(path)
+    t0 = time.perf_counter()
+    for f in filas:
+        con = sqlite3.connect(path)
+        con.execute(OCC_INSERT_SQL, f)
+        con.commit(); con.close()
+    antes = n / (time.perf_counter() - t0)
+
+    _db_temporal(path)
+    w = OccupancyWriter(path)
+    t0 = time.perf_counter()
+    for f in filas:
+        w.put(f)
+    w.flush()
+    despues = n / (time.perf_counter() - t0)
+    w.close()
+    print(f"{n} lecturas")
+    print(f"  conexión+commit por lectura: {antes:10.0f} upd/s")
+    print(f"  OccupancyWriter (WAL, lote): {despues:10.0f} upd/s  ({w.commits} commits)")
+    _borrar_db(path)
+
+
+# ==================== Inferencia YOLO multi-cámara ====================
+def bench_yolo_batch(model_path: str = "yolov8n.pt", reps: int = 3):
+    """frames/s (total y por núcleo) de un model() por frame vs un model() por lote, con micro.jpg / vegetita.jpg."""
+    from deteccion import Detector, FuenteImagen
+    from multicam import DetectorMulticamara
+    model = Detector(model_path).model
+    imgs = [FuenteImagen("micro.jpg"), FuenteImagen("vegetita.jpg")]
+    nucleos = os.cpu_count() or 1
+    print(f"{'fuentes':>8} {'1x1 (f/s)':>10} {'lote (f/s)':>11} {'lote f/s/núcleo':>16}")
+    for n in (1, 4, 8, 16):
+        fuentes = {f"bus{i:03d}": imgs[i % 2] for i in range(n)}
+        det = DetectorMulticamara(fuentes, lote=n, model=model)
+        det.tick()                                     # warm-up
+        frames = [imgs[i % 2].leer() for i in range(n)]
+        t0 = time.perf_counter()
+        for _ in range(reps):
+            for f in frames:
+                model(f, verbose=False)
+        uno = n * reps / (time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        for _ in range(reps):
+            det.tick()
+        lote = n * reps / (time.perf_counter() - t0)
+        print(f"{n:>8} {uno:>10.1f} {lote:>11.1f} {lote / nucleos:>16.2f}")
+
+
+# ==================== Latencia YOLO por configuración ====================
+def bench_yolo_config(model_path: str = "yolov8n.pt", reps: int = 10):
+    """ms por frame (prom / p95) y personas contadas en micro.jpg / vegetita.jpg según formato e imgsz."""
+    from deteccion import Detector, FuenteImagen, exportar_modelo
+    frames = [FuenteImagen("micro.jpg").leer(), FuenteImagen("vegetita.jpg").leer()]
+    configs = [("pt", 640), ("pt", 480), ("pt", 320), ("onnx", 320), ("openvino", 320)]
+    print(f"{'formato':>9} {'imgsz':>6} {'prom ms':>8} {'p95 ms':>8} {'personas':>9}")
+    for formato, imgsz in configs:
+        ruta = model_path
+        if formato != "pt":
+            # se exporta (.onnx / *_openvino_model/) junto al .pt y se carga con la misma API
+            try:
+                ruta = exportar_modelo(model_path, formato, imgsz)
+            except Exception as e:
+                print(f"{formato:>9} {imgsz:>6}  no disponible ({type(e).__name__}: {e})")
+                continue
+        det = Detector(ruta, imgsz=imgsz)
+        det.calentar()
+        tiempos = []
+        for _ in range(reps):
+            for f in frames:
+                t0 = time.perf_counter()
+                det.contar(f)
+                tiempos.append((time.perf_counter() - t0) * 1000)
+        tiempos.sort()
+        conteos = "/".join(str(det.contar(f)[0]) for f in frames)
+        print(f"{formato:>9} {imgsz:>6} {sum(tiempos) / len(tiempos):>8.1f} "
+              f"{tiempos[int(0.95 * (len(tiempos) - 1))]:>8.1f} {conteos:>9}")
+
+
+BENCHES = {
+    "eta": bench_eta,
+    "stops": bench_stops,
+    "stops_grid": bench_stops_grid,
+    "geo": bench_geo,
+    "fleet": bench_fleet,
+    "board": bench_board,
+    "clock": bench_clock,
+    "ingest": bench_ingest,
+    "yolo_batch": bench_yolo_batch,
+    "yolo_config": bench_yolo_config,
+}
+
+if __name__ == "__main__":
+    nombres = sys.argv[1:] or list(BENCHES)
+    for nombre in nombres:
+        if nombre not in BENCHES:
+            print(f"Benchmark desconocido: {nombre}. Opciones: {', '.join(BENCHES)}")
+            sys.exit(2)
+        print(f"\n== {nombre} ==")
+        BENCHES[nombre]()
@@ -0,0 +1,13 @@
+# deteccion/__init__.py
+# Núcleo compartido de detección de personas. Importar el paquete no carga cv2 ni
+# ultralytics: se importan dentro de las funciones que los usan.
+from .estado import estado_micro, ESTADOS, EstimadorOcupacion
+from .pipeline import UltimoFrame, ColaDescarte, LatenciaEtapa
+from .movimiento import CompuertaMovimiento
+from .sumideros import SumideroFrames
+from .fuentes import FuenteCarpeta, FuenteImagen, FuenteVideo, abrir_fuente
+from .detector import Detector, exportar_modelo
+
+__all__ = ["estado_micro", "ESTADOS", "EstimadorOcupacion", "UltimoFrame", "ColaDescarte", "LatenciaEtapa",
+           "CompuertaMovimiento", "SumideroFrames", "FuenteCarpeta", "FuenteImagen", "FuenteVideo",
+           "abrir_fuente", "Detector", "exportar_modelo"]
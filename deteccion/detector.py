@@ -0,0 +1,264 @@
+# deteccion/detector.py
+# Detector de personas con YOLO: carga perezosa del modelo, warm-up y pipeline en vivo.
+import threading
+import time
+
+from .estado import estado_micro
+from .fuentes import abrir_fuente
+from .movimiento import CompuertaMovimiento
+from .pipeline import UltimoFrame, ColaDescarte, LatenciaEtapa, _hilo
+from .sumideros import SumideroFrames
+
+CLASE_PERSONA = 0
+
+
+def exportar_modelo(model_path='yolov8n.pt', formato='onnx', imgsz=640):
+    """
+    Exporta el modelo a un formato optimizado para CPU ("onnx" -> yolov8n.onnx,
+    "openvino" -> yolov8n_openvino_model/) y devuelve la ruta, que luego se pasa
+    tal cual como model_path. Requiere los paquetes onnx / openvino.
+    """
+    from ultralytics import YOLO
+    return YOLO(model_path).export(format=formato, imgsz=imgsz)
+
+
+class Detector:
+    """
+    Envoltorio único del modelo para ia.py, multicam.py y los scripts de prueba.
+    ultralytics solo se importa la primera vez que se usa `model` (o en calentar()),
+    así importar el paquete no cuesta nada a quien no detecta.
+      model_path: .pt, .onnx o carpeta *_openvino_model (ver exportar_modelo)
+      imgsz:  lado de la imagen de entrada del modelo; 320-480 bastan para contar pasajeros
+      conf:   umbral de confianza de las cajas
+      clases: clases que el modelo devuelve (solo personas por defecto); None = todas
+      model:  instancia ya cargada (se comparte entre detectores, p.ej. en bench.py)
+    """
+
+    def __init__(self, model_path='yolov8n.pt', model=None, imgsz=640, conf=0.25, clases=(CLASE_PERSONA,)):
+        self.model_path = model_path
+        self.imgsz = imgsz
+        self.conf = conf
+        self.clases = list(clases) if clases is not None else None
+        self._model = model
+        self._lock = threading.Lock()
+        self.frames_procesados = 0
+        self.segundos_inferencia = 0.0
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from ultralytics import YOLO
+                    self._model = YOLO(self.model_path, task="detect")
+        return self._model
+
+    def calentar(self, alto=480, ancho=640):
+        """Carga el modelo y corre una inferencia sobre un frame negro para no pagarla en la primera detección."""
+        import numpy as np
+        t0 = time.perf_counter()
+        self._inferir(np.zeros((alto, ancho, 3), dtype=np.uint8))
+        return time.perf_counter() - t0
+
+    def _inferir(self, x):
+        return self.model(x, imgsz=self.imgsz, conf=self.conf, classes=self.clases, verbose=False)
+
+    def detectar(self, frames):
+        """Lista de frames -> lista de resultados de YOLO, en un único model()."""
+        t0 = time.perf_counter()
+        results = self._inferir(frames)
+        self.segundos_inferencia += time.perf_counter() - t0
+        self.frames_procesados += len(frames)
+        return results
+
+    def personas(self, result):
+        # con el filtro de clases en el modelo todas las cajas son personas
+        if self.clases == [CLASE_PERSONA]:
+            return len(result.boxes)
+        return int((result.boxes.cls == CLASE_PERSONA).sum().item())
+
+    def contar(self, frame):
+        """Conteo de personas de un frame y el resultado (para anotar)."""
+        result = self.detectar([frame])[0]
+        return self.personas(result), result
+
+    def fps(self):
+        return self.frames_procesados / self.segundos_inferencia if self.segundos_inferencia else 0.0
+
+    def correr(self, fuente=0, intervalo=10, callback=None, callback_estado=None, compuerta=True,
+               sumidero=None, estimador=None, output_folder='frames_guardados', ventana=True):
+        """
+        Detección de personas en tiempo real sobre `fuente` (índice de cámara, archivo, URL,
+        carpeta, imagen o un objeto con leer()/cerrar()).
+        Si se pasa una función callback, se llama cada vez que hay una nueva detección:
+            callback(num_personas)
+
+        Pipeline por etapas, cada una en su hilo:
+          captura    -> guarda siempre el último frame (UltimoFrame)
+          inferencia -> cada `intervalo` s corre YOLO sobre el último frame
+          frames     -> anota, codifica y guarda el JPEG según el sumidero (cola acotada, descarta el más antiguo)
+          reporte    -> ejecuta el callback, p.ej. envío HTTP (cola acotada, descarta el más antiguo)
+        Así un disco o una red lenta no congelan la cámara. Devuelve las latencias por etapa.
+
+        compuerta: True usa CompuertaMovimiento() con valores por defecto, una instancia
+        permite ajustar umbrales, False corre YOLO siempre.
+        sumidero: SumideroFrames; por defecto guarda todos en output_folder con retención de 1000 archivos.
+        estimador: EstimadorOcupacion; si se indica, los callbacks reciben el conteo suavizado
+        y solo se llaman cuando cambia el estado o toca latido. callback_estado(num_personas, estado)
+        recibe además el estado (con histéresis) que corresponde a ese conteo.
+        ventana: False = modo headless (sin imshow/waitKey, no requiere display); se detiene
+        con Ctrl+C o al agotarse la fuente.
+        """
+        if compuerta is True:
+            compuerta = CompuertaMovimiento()
+        if sumidero is None:
+            sumidero = SumideroFrames(output_folder)
+        self.model                      # carga el modelo antes de abrir la cámara
+
+        src = abrir_fuente(fuente) if isinstance(fuente, (str, int)) else fuente
+        if not src.abierta():
+            print("❌ No se pudo acceder a la cámara.")
+            return
+
+        ultimo = UltimoFrame()
+        cola_frames = ColaDescarte(maxlen=4)
+        cola_reporte = ColaDescarte(maxlen=32)
+        parar = threading.Event()
+        lat = {etapa: LatenciaEtapa() for etapa in ("captura", "inferencia", "frames", "reporte")}
+        # las fuentes de archivo devuelven frames al instante: se leen al ritmo de una cámara
+        pausa = 0.0 if getattr(src, "en_vivo", True) else 1 / 30
+
+        def captura():
+            while not parar.is_set():
+                t0 = time.perf_counter()
+                frame = src.leer()
+                if frame is None:
+                    print("⚠️ No se pudo leer el frame de la cámara.")
+                    parar.set()
+                    break
+                lat["captura"].registrar(t0)
+                ultimo.poner(frame)
+                if pausa:
+                    parar.wait(pausa)
+
+        def inferencia():
+            seq = 0
+            num_personas = None
+            last_time = time.time() - intervalo
+            try:
+                while not parar.is_set():
+                    espera = intervalo - (time.time() - last_time)
+                    if espera > 0 and parar.wait(espera):
+                        break
+                    seq, frame = ultimo.obtener(seq, timeout=1.0)
+                    if frame is None:
+                        continue
+                    last_time = time.time()
+
+                    # Escena sin cambios: se reutiliza el último conteo sin correr YOLO
+                    if compuerta and not compuerta.debe_inferir(frame, last_time) and num_personas is not None:
+                        reportar(num_personas, last_time)
+                        continue
+
+                    t0 = time.perf_counter()
+                    try:
+                        conteo, result = self.contar(frame)
+                        guardar = sumidero.ofrecer(conteo)
+                    except Exception as e:
+                        # un frame corrupto o un fallo del modelo no detiene el pipeline: se salta el ciclo
+                        print(f"⚠️ Error en inferencia: {e}")
+                        continue
+                    num_personas = conteo
+                    lat["inferencia"].registrar(t0)
+
+                    print(f"[{time.strftime('%H:%M:%S')}] {num_personas} personas detectadas.")
+                    print(estado_micro(num_personas))
+
+                    if guardar:
+                        cola_frames.poner(result)
+                    reportar(num_personas, last_time)
+            finally:
+                parar.set()     # si la etapa muere, el resto (y el modo headless) terminan en vez de colgarse
+
+        def reportar(num_personas, ahora):
+            if callback is None and callback_estado is None:
+                return
+            if estimador is None:
+                cola_reporte.poner((num_personas, estado_micro(num_personas)))
+                return
+            emitir, suavizado, estado = estimador.actualizar(num_personas, ahora)
+            if emitir:
+                cola_reporte.poner((suavizado, estado))
+
+        def frames():
+            while True:
+                result = cola_frames.sacar()
+                if result is None:
+                    break
+                t0 = time.perf_counter()
+                try:
+                    sumidero.guardar(result)
+                except Exception as e:
+                    print(f"⚠️ Error guardando frame: {e}")
+                lat["frames"].registrar(t0)
+
+        def reporte():
+            while True:
+                item = cola_reporte.sacar()
+                if item is None:
+                    break
+                num_personas, estado = item
+                t0 = time.perf_counter()
+                # Si se entregó una función externa, se llama aquí
+                try:
+                    if callback is not None:
+                        callback(num_personas)
+                    if callback_estado is not None:
+                        callback_estado(num_personas, estado)
+                except Exception as e:
+                    print(f"⚠️ Error al ejecutar callback: {e}")
+                lat["reporte"].registrar(t0)
+
+        hilos = [_hilo("captura", captura), _hilo("inferencia", inferencia)]
+        escritores = [_hilo("frames", frames), _hilo("reporte", reporte)]
+
+        if ventana:
+            import cv2
+            print("🎥 Detección iniciada... Presiona 'q' para salir.\n")
+            # La ventana de OpenCV debe manejarse desde el hilo principal
+            seq = 0
+            while not parar.is_set():
+                seq, frame = ultimo.obtener(seq, timeout=0.5)
+                if frame is not None:
+                    cv2.imshow("Detección de personas (YOLOv8)", frame)
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    break
+        else:
+            print("🎥 Detección iniciada (sin ventana)... Ctrl+C para salir.\n")
+            try:
+                while not parar.wait(0.5):
+                    pass
+            except KeyboardInterrupt:
+                pass
+
+        parar.set()
+        for t in hilos:
+            t.join()
+        cola_frames.cerrar()
+        cola_reporte.cerrar()
+        for t in escritores:
+            t.join()
+
+        src.cerrar()
+        if ventana:
+            cv2.destroyAllWindows()
+        stats = {etapa: l.resumen() for etapa, l in lat.items()}
+        stats["descartados"] = {"frames": cola_frames.descartados, "reporte": cola_reporte.descartados}
+        stats["sumidero"] = sumidero.resumen()
+        if estimador is not None:
+            stats["estimador"] = estimador.resumen()
+        if compuerta:
+            stats["compuerta"] = compuerta.resumen()
+        print("📊 Latencias por etapa:", stats)
+        print("✅ Detección finalizada. Frames guardados en:", sumidero.carpeta if sumidero.destino == "disco" else "memoria")
+        return stats
@@ -0,0 +1,84 @@
+# deteccion/estado.py
+# Estado de ocupación a partir del conteo de personas (sin dependencias de visión).
+import time
+from collections import deque
+
+
+def estado_micro(x):
+    if x <= 20:
+        return "Asientos disponibles"
+    if x <= 30:
+        return "Pasillo disponible"
+    if x > 30:
+        return "Llena"
+
+
+ESTADOS = ("Asientos disponibles", "Pasillo disponible", "Llena")
+
+
+class EstimadorOcupacion:
+    """
+    Suavizado por bus del conteo crudo (mediana de ventana deslizante o EWMA) con
+    histéresis alrededor de los umbrales de estado_micro, expresados relativos a la
+    capacidad (20/40 y 30/40 por defecto). actualizar() indica si hay que emitir:
+    solo cuando cambia el estado suavizado o cuando pasa `latido` s sin emitir.
+      histeresis: banda (en personas) que hay que cruzar para cambiar de estado
+    """
+
+    def __init__(self, capacidad=40, umbrales=(0.5, 0.75), metodo="mediana", ventana=5, alfa=0.3,
+                 histeresis=2.0, latido=60.0):
+        self.capacidad = capacidad
+        self.limites = [u * capacidad for u in umbrales]
+        self.metodo = metodo
+        self.alfa = alfa
+        self.histeresis = histeresis
+        self.latido = latido
+        self._ventana = deque(maxlen=max(1, ventana))
+        self._ewma = None
+        self.nivel = None
+        self.suavizado = None
+        self._t_emision = None
+        self.lecturas = 0
+        self.emitidas = 0
+
+    @property
+    def estado(self):
+        return ESTADOS[self.nivel] if self.nivel is not None else None
+
+    def _suavizar(self, conteo):
+        if self.metodo == "ewma":
+            self._ewma = conteo if self._ewma is None else self.alfa * conteo + (1 - self.alfa) * self._ewma
+            return self._ewma
+        self._ventana.append(conteo)
+        orden = sorted(self._ventana)
+        m = len(orden) // 2
+        return orden[m] if len(orden) % 2 else (orden[m - 1] + orden[m]) / 2.0
+
+    def _nivel_sin_histeresis(self, x):
+        return sum(1 for lim in self.limites if x > lim)
+
+    def actualizar(self, conteo, ahora=None):
+        """Registra una lectura cruda; devuelve (emitir, conteo_suavizado, estado)."""
+        ahora = time.time() if ahora is None else ahora
+        self.lecturas += 1
+        x = self._suavizar(conteo)
+        self.suavizado = int(round(x))
+        anterior = self.nivel
+        if self.nivel is None:
+            self.nivel = self._nivel_sin_histeresis(x)
+        else:
+            # subir/bajar de nivel solo al cruzar el umbral más la banda de histéresis
+            while self.nivel < len(self.limites) and x > self.limites[self.nivel] + self.histeresis:
+                self.nivel += 1
+            while self.nivel > 0 and x <= self.limites[self.nivel - 1] - self.histeresis:
+                self.nivel -= 1
+        emitir = (self.nivel != anterior or self._t_emision is None
+                  or (self.latido is not None and ahora - self._t_emision >= self.latido))
+        if emitir:
+            self._t_emision = ahora
+            self.emitidas += 1
+        return emitir, self.suavizado, self.estado
+
+    def resumen(self):
+        return {"lecturas": self.lecturas, "emitidas": self.emitidas, "estado": self.estado,
+                "suavizado": self.suavizado}
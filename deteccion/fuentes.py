@@ -0,0 +1,82 @@
+# deteccion/fuentes.py
+# Fuentes de frames intercambiables: carpeta, imagen, video / cámara / RTSP.
+# Todas exponen leer() -> frame o None, abierta() y cerrar().
+import os
+
+EXT_IMAGEN = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+class FuenteCarpeta:
+    """Imágenes de una carpeta en orden (p.ej. frames_detectados/); repite al terminar si loop=True."""
+    en_vivo = False
+
+    def __init__(self, carpeta, loop=True):
+        self.archivos = sorted(os.path.join(carpeta, f) for f in os.listdir(carpeta)
+                               if f.lower().endswith(EXT_IMAGEN))
+        self.loop = loop
+        self.i = 0
+
+    def abierta(self):
+        return bool(self.archivos)
+
+    def leer(self):
+        import cv2
+        while self.archivos:
+            if self.i >= len(self.archivos):
+                if not self.loop:
+                    return None
+                self.i = 0
+            frame = cv2.imread(self.archivos[self.i])
+            self.i += 1
+            if frame is not None:
+                return frame
+        return None
+
+    def cerrar(self):
+        pass
+
+
+class FuenteImagen:
+    """Una sola imagen (p.ej. micro.jpg) entregada en cada lectura."""
+    en_vivo = False
+
+    def __init__(self, ruta):
+        import cv2
+        self.frame = cv2.imread(ruta)
+
+    def abierta(self):
+        return self.frame is not None
+
+    def leer(self):
+        return self.frame
+
+    def cerrar(self):
+        pass
+
+
+class FuenteVideo:
+    """Video, cámara o stream RTSP vía cv2.VideoCapture."""
+    en_vivo = True
+
+    def __init__(self, spec):
+        import cv2
+        self.cap = cv2.VideoCapture(int(spec) if str(spec).isdigit() else spec)
+
+    def abierta(self):
+        return self.cap.isOpened()
+
+    def leer(self):
+        ret, frame = self.cap.read()
+        return frame if ret else None
+
+    def cerrar(self):
+        self.cap.release()
+
+
+def abrir_fuente(spec):
+    """Carpeta, imagen o cualquier cosa que entienda cv2.VideoCapture (índice de cámara, archivo, URL)."""
+    if os.path.isdir(str(spec)):
+        return FuenteCarpeta(spec)
+    if str(spec).lower().endswith(EXT_IMAGEN):
+        return FuenteImagen(spec)
+    return FuenteVideo(spec)
@@ -0,0 +1,57 @@
+# deteccion/movimiento.py
+# Compuerta de movimiento barata delante del modelo (cv2 se importa al usarla).
+import time
+
+
+class CompuertaMovimiento:
+    """
+    Detector de cambios barato frente a YOLO: compara el frame actual (reducido a gris
+    de `tam` px) con el de la última inferencia. Si la escena no cambió, se reutiliza
+    el último conteo; igual se fuerza una inferencia cada `edad_max` segundos.
+      umbral_dif:  diferencia absoluta media de píxeles (0-255)
+      umbral_hist: distancia de Bhattacharyya entre histogramas (0-1)
+    """
+
+    def __init__(self, umbral_dif=6.0, umbral_hist=0.1, edad_max=60.0, tam=(64, 48)):
+        self.umbral_dif = umbral_dif
+        self.umbral_hist = umbral_hist
+        self.edad_max = edad_max
+        self.tam = tam
+        self._ref = None
+        self._ref_hist = None
+        self._t_ref = 0.0
+        self.evaluados = 0
+        self.saltados = 0
+        self.forzados = 0
+
+    def _reducir(self, frame):
+        import cv2
+        gris = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        peq = cv2.GaussianBlur(cv2.resize(gris, self.tam, interpolation=cv2.INTER_AREA), (3, 3), 0)
+        hist = cv2.calcHist([peq], [0], None, [32], [0, 256])
+        cv2.normalize(hist, hist)
+        return peq, hist
+
+    def debe_inferir(self, frame, ahora=None):
+        """True si hay que correr el modelo; en ese caso el frame pasa a ser la nueva referencia."""
+        import cv2
+        ahora = time.time() if ahora is None else ahora
+        self.evaluados += 1
+        peq, hist = self._reducir(frame)
+        if self._ref is None:
+            cambio = True
+        elif ahora - self._t_ref >= self.edad_max:
+            cambio = True
+            self.forzados += 1
+        else:
+            dif = float(cv2.absdiff(peq, self._ref).mean())
+            dist = float(cv2.compareHist(self._ref_hist, hist, cv2.HISTCMP_BHATTACHARYYA))
+            cambio = dif > self.umbral_dif or dist > self.umbral_hist
+        if cambio:
+            self._ref, self._ref_hist, self._t_ref = peq, hist, ahora
+        else:
+            self.saltados += 1
+        return cambio
+
+    def resumen(self):
+        return {"evaluados": self.evaluados, "saltados": self.saltados, "forzados": self.forzados}
@@ -0,0 +1,87 @@
+# deteccion/pipeline.py
+# Piezas del pipeline por etapas: último frame, colas con descarte y latencias.
+import threading
+import time
+from collections import deque
+
+
+class UltimoFrame:
+    """Guarda solo el frame más reciente de la cámara (los anteriores se descartan)."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._frame = None
+        self._seq = 0
+
+    def poner(self, frame):
+        with self._cond:
+            self._frame = frame
+            self._seq += 1
+            self._cond.notify_all()
+
+    def obtener(self, despues_de=0, timeout=None):
+        """Devuelve (seq, frame) con seq > despues_de, o (seq, None) si vence el timeout."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > despues_de, timeout)
+            if self._seq <= despues_de:
+                return self._seq, None
+            return self._seq, self._frame
+
+
+class ColaDescarte:
+    """Cola acotada: si está llena, se descarta el elemento más antiguo (no bloquea al productor)."""
+
+    def __init__(self, maxlen):
+        self._items = deque(maxlen=maxlen)
+        self._cond = threading.Condition()
+        self.descartados = 0
+        self.cerrada = False
+
+    def poner(self, item):
+        with self._cond:
+            if len(self._items) == self._items.maxlen:
+                self.descartados += 1
+            self._items.append(item)
+            self._cond.notify()
+
+    def sacar(self, timeout=None):
+        """Siguiente elemento, o None si la cola se cerró y quedó vacía (o vence el timeout)."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._items or self.cerrada, timeout)
+            return self._items.popleft() if self._items else None
+
+    def cerrar(self):
+        with self._cond:
+            self.cerrada = True
+            self._cond.notify_all()
+
+
+class LatenciaEtapa:
+    """Contador de latencias de una etapa del pipeline (en milisegundos)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.n = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.ultima_ms = 0.0
+
+    def registrar(self, inicio):
+        ms = (time.perf_counter() - inicio) * 1000.0
+        with self._lock:
+            self.n += 1
+            self.total_ms += ms
+            self.max_ms = max(self.max_ms, ms)
+            self.ultima_ms = ms
+
+    def resumen(self):
+        with self._lock:
+            prom = self.total_ms / self.n if self.n else 0.0
+            return {"n": self.n, "prom_ms": round(prom, 2), "max_ms": round(self.max_ms, 2),
+                    "ultima_ms": round(self.ultima_ms, 2)}
+
+
+def _hilo(nombre, objetivo, *args):
+    t = threading.Thread(target=objetivo, args=args, name=nombre, daemon=True)
+    t.start()
+    return t
@@ -0,0 +1,115 @@
+# deteccion/sumideros.py
+# Destino de los frames anotados (disco con retención o solo subida al tracker).
+import os
+from collections import deque
+
+from .estado import estado_micro
+
+
+class SumideroFrames:
+    """
+    Qué hacer con los frames anotados:
+      modo:    "off" | "siempre" | "cada_n" (uno de cada `cada_n`) | "cambio_estado" (cuando cambia estado_micro)
+      destino: "disco" (carpeta con retención en anillo) | "memoria" (nada en disco: el JPEG
+               solo se sube al tracker, que guarda el último por bus; requiere subir_a)
+      subir_a: URL del tracker_server; si se indica, el JPEG se envía a /frames/<bus_id>
+               (con X-Frames-Token si se pasa token) y se ve en /frames/<bus_id>/latest
+    La decisión (ofrecer) es barata y corre en el hilo de inferencia; plot() + codificación
+    JPEG + escritura (guardar) corren en la etapa "frames" del pipeline.
+    Retención en disco: se borran los frame_NNNN.jpg más antiguos de la carpeta al superar
+    max_archivos o max_bytes, así que no debe apuntar a una carpeta con muestras versionadas
+    (frames_detectados/ del repo).
+    """
+
+    def __init__(self, carpeta='frames_guardados', modo="siempre", cada_n=1, destino="disco",
+                 bus_id="bus001", max_archivos=1000, max_bytes=None, calidad_jpeg=80, subir_a=None, token=None):
+        if destino == "memoria" and not subir_a and modo != "off":
+            raise ValueError('destino="memoria" requiere subir_a (URL del tracker_server)')
+        self.carpeta = carpeta
+        self.modo = modo
+        self.cada_n = max(1, int(cada_n))
+        self.destino = destino
+        self.bus_id = bus_id
+        self.max_archivos = max_archivos
+        self.max_bytes = max_bytes
+        self.calidad_jpeg = calidad_jpeg
+        self.subir_a = subir_a
+        self.token = token
+        self._n = 0
+        self._ultimo_estado = None
+        self._archivos = deque()    # (ruta, bytes) del más antiguo al más nuevo
+        self._bytes = 0
+        self._frame_id = 0
+        self.guardados = 0
+        self.borrados = 0
+        if destino == "disco" and modo != "off":
+            os.makedirs(carpeta, exist_ok=True)
+            self._cargar_existentes()
+
+    def _cargar_existentes(self):
+        """Toma en cuenta lo ya guardado para que la retención también valga entre ejecuciones."""
+        existentes = []
+        for f in os.listdir(self.carpeta):
+            if f.startswith("frame_") and f.endswith(".jpg") and f[6:-4].isdigit():
+                existentes.append((int(f[6:-4]), os.path.join(self.carpeta, f)))
+        for frame_id, ruta in sorted(existentes):
+            tam = os.path.getsize(ruta)
+            self._archivos.append((ruta, tam))
+            self._bytes += tam
+            self._frame_id = frame_id + 1
+
+    def ofrecer(self, num_personas):
+        """True si este resultado debe guardarse según el modo."""
+        if self.modo == "off":
+            return False
+        self._n += 1
+        if self.modo == "cada_n":
+            return (self._n - 1) % self.cada_n == 0
+        if self.modo == "cambio_estado":
+            estado = estado_micro(num_personas)
+            cambio = estado != self._ultimo_estado
+            self._ultimo_estado = estado
+            return cambio
+        return True
+
+    def guardar(self, result):
+        import cv2
+        annotated_frame = result.plot()
+        ok, buf = cv2.imencode(".jpg", annotated_frame, [int(cv2.IMWRITE_JPEG_QUALITY), self.calidad_jpeg])
+        if not ok:
+            return
+        datos = buf.tobytes()
+        self.guardados += 1
+        if self.destino == "disco":
+            self._escribir(datos)
+        if self.subir_a:
+            try:
+                import requests
+                headers = {"Content-Type": "image/jpeg"}
+                if self.token:
+                    headers["X-Frames-Token"] = self.token
+                r = requests.post(f"{self.subir_a}/frames/{self.bus_id}", data=datos, headers=headers, timeout=10)
+                r.raise_for_status()
+            except Exception as e:
+                print(f"⚠️ Error subiendo frame: {e}")
+
+    def _escribir(self, datos):
+        save_path = os.path.join(self.carpeta, f"frame_{self._frame_id:04d}.jpg")
+        self._frame_id += 1
+        with open(save_path, "wb") as fh:
+            fh.write(datos)
+        self._archivos.append((save_path, len(datos)))
+        self._bytes += len(datos)
+        while self._archivos and ((self.max_archivos and len(self._archivos) > self.max_archivos) or
+                                  (self.max_bytes and self._bytes > self.max_bytes)):
+            ruta, tam = self._archivos.popleft()
+            self._bytes -= tam
+            try:
+                os.remove(ruta)
+                self.borrados += 1
+            except OSError:
+                pass
+
+    def resumen(self):
+        return {"modo": self.modo, "destino": self.destino, "guardados": self.guardados,
+                "borrados": self.borrados, "archivos": len(self._archivos), "bytes": self._bytes}
@@ -0,0 +1,21 @@
+
+
+2.0M
+TU1F
+
+T1*R1"PA1"PA2"PA3"PA4M
+TU2F
+
+T2*R2"PA1"PA2"PA3"PA4M
+TU3F
+
+T3*R3"PA1"PA2"PA3"PA4M
+TU4F
+
+T4*R1"PA1"PA2"PA3"PA4M
+TU5F
+
+T5*R2"PA1"PA2"PA3"PA4M
+TU6F
+
+T6*R3"PA1"PA2"PA3"PA4
\ No newline at end of file
@@ -0,0 +1,27 @@
+
+
+2.0"
+V1"
+
+T1*R1
+("
+V2"
+
+T2*R2
+("
+V3"
+
+T3*R3
+("
+V4"
+
+T4*R1
+("
+V5"
+
+T5*R2
+(
+V6"
+
+T6
+%(
\ No newline at end of file
@@ -0,0 +1,345 @@
+# fleet.py
+# Estado de la flota simulada en arreglos NumPy (struct-of-arrays) con avance vectorizado.
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from route_geometry import LocalRoute, project_points
+
+Punto = Tuple[float, float]
+
+_GAP_KM = 1.0        # separación entre rutas en el eje global de km (mantiene el eje creciente)
+
+
+def _crecer(arr: np.ndarray, n: int, fill: Any = 0) -> np.ndarray:
+    """Copia arr en un arreglo de largo >= n (duplicando la capacidad)."""
+    if len(arr) >= n:
+        return arr
+    nuevo = np.full((max(n, 2 * len(arr), 16),) + arr.shape[1:], fill, dtype=arr.dtype)
+    nuevo[:len(arr)] = arr
+    return nuevo
+
+
+class FleetStore:
+    """
+    Buses en ranuras de arreglos paralelos (lat, lon, velocidad, km recorridos, dwell, ...).
+    Las rutas se empaquetan en un único buffer de coordenadas con offsets por ruta, y las
+    rutas repetidas se comparten. Sobre el buffer hay un eje global de km creciente
+    (km de la ruta + base de la ruta), así un searchsorted ubica el tramo de todos los buses
+    a la vez. Las paradas se guardan como km a lo largo de la ruta de cada bus.
+    Los buses sin ruta reciben una ruta recta de 2 puntos hasta el destino.
+    No es thread-safe: el llamador serializa el acceso (SIM_LOCK).
+    """
+
+    def __init__(self, stop_radius_km: float = 0.02):
+        self.stop_radius_km = stop_radius_km
+        self.ids: List[Optional[str]] = []
+        self.slot: Dict[str, int] = {}
+        self._libres: List[int] = []
+        n = 0
+        self.activo = np.zeros(n, dtype=bool)
+        self.lat = np.zeros(n); self.lon = np.zeros(n)
+        self.speed = np.zeros(n)
+        self.along = np.zeros(n)                     # km recorridos sobre su ruta
+        self.rid = np.zeros(n, dtype=np.int64)       # ruta del bus
+        self.recta = np.zeros(n, dtype=bool)         # sin ruta real (línea recta al destino)
+        self.arrived = np.zeros(n, dtype=bool)
+        self.is_dwell = np.zeros(n, dtype=bool)
+        self.dwell_until = np.zeros(n)
+        self.dwell_sec = np.zeros(n)
+        self.stop_ini = np.zeros(n, dtype=np.int64)  # paradas del bus: stop_km[stop_ini : stop_ini+stop_n]
+        self.stop_n = np.zeros(n, dtype=np.int64)
+        self.next_stop = np.zeros(n, dtype=np.int64)
+
+        # rutas empaquetadas
+        self.coords = np.zeros((0, 2))               # (lat, lon) de todas las rutas
+        self.gkm = np.zeros(0)                       # eje global de km por vértice (creciente)
+        self._n_coords = 0
+        self.r_ini: List[int] = []; self.r_len: List[int] = []
+        self.r_base: List[float] = []; self.r_total: List[float] = []
+        self.r_refs: List[int] = []
+        self._r_arr: Optional[Tuple[np.ndarray, ...]] = None   # r_* como arreglos (se invalida al cambiar)
+        self._r_por_clave: Dict[bytes, int] = {}
+        self._r_libres: List[int] = []
+        self._coords_muertas = 0
+
+        # paradas empaquetadas
+        self.stop_km = np.zeros(0)
+        self.stop_pos = np.zeros(0, dtype=np.int64)  # índice denso del id OSM de la parada (-1 = sin id)
+        self.stop_bus = np.zeros(0, dtype=np.int64)  # ranura dueña (-1 = bus eliminado)
+        self.stop_k = np.zeros(0, dtype=np.int64)    # orden de la parada dentro de su bus
+        self._n_stops = 0
+        self._stops_muertas = 0
+        self._pos_por_sid: Dict[int, int] = {}
+        self._sid: List[int] = []                    # índice denso -> id OSM
+
+    # ---------- rutas ----------
+    def _agregar_ruta(self, route: Sequence[Punto]) -> int:
+        pts = np.asarray(route, dtype=np.float64).reshape(-1, 2)
+        clave = pts.tobytes()
+        rid = self._r_por_clave.get(clave)
+        if rid is not None:
+            self.r_refs[rid] += 1
+            return rid
+        geo = LocalRoute(pts)
+        ini = self._n_coords
+        base = (self.gkm[ini - 1] + _GAP_KM) if ini else 0.0
+        self.coords = _crecer(self.coords, ini + len(pts))
+        self.gkm = _crecer(self.gkm, ini + len(pts))
+        self.coords[ini:ini + len(pts)] = pts
+        self.gkm[ini:ini + len(pts)] = base + np.asarray(geo.cum_km)
+        self._n_coords += len(pts)
+        datos = (ini, len(pts), base, geo.total_km, 1)
+        if self._r_libres:
+            rid = self._r_libres.pop()
+            self.r_ini[rid], self.r_len[rid], self.r_base[rid], self.r_total[rid], self.r_refs[rid] = datos
+        else:
+            rid = len(self.r_ini)
+            for lista, v in zip((self.r_ini, self.r_len, self.r_base, self.r_total, self.r_refs), datos):
+                lista.append(v)
+        self._r_por_clave[clave] = rid
+        self._r_arr = None
+        return rid
+
+    def _soltar_ruta(self, rid: int):
+        self.r_refs[rid] -= 1
+        if self.r_refs[rid] > 0:
+            return
+        ini, n = self.r_ini[rid], self.r_len[rid]
+        del self._r_por_clave[self.coords[ini:ini + n].tobytes()]
+        self._r_libres.append(rid)
+        self._coords_muertas += n
+        self._r_arr = None
+
+    def _rutas(self) -> Tuple[np.ndarray, ...]:
+        if self._r_arr is None:
+            self._r_arr = (np.asarray(self.r_ini, dtype=np.int64), np.asarray(self.r_len, dtype=np.int64),
+                           np.asarray(self.r_base), np.asarray(self.r_total))
+        return self._r_arr
+
+    def _compactar(self):
+        """Reempaqueta rutas y paradas vivas cuando más de la mitad de los buffers quedó libre."""
+        if self._coords_muertas > max(1024, self._n_coords // 2):
+            vivas = [r for r in range(len(self.r_ini)) if self.r_refs[r] > 0]
+            coords = self.coords[:self._n_coords]
+            rutas = {r: (coords[self.r_ini[r]:self.r_ini[r] + self.r_len[r]].copy(),
+                         self.gkm[self.r_ini[r]:self.r_ini[r] + self.r_len[r]] - self.r_base[r]) for r in vivas}
+            self._n_coords = 0; self._coords_muertas = 0
+            for r in vivas:
+                pts, cum = rutas[r]
+                ini = self._n_coords
+                base = (self.gkm[ini - 1] + _GAP_KM) if ini else 0.0
+                self.coords[ini:ini + len(pts)] = pts
+                self.gkm[ini:ini + len(pts)] = base + cum
+                self.r_ini[r], self.r_base[r] = ini, base
+                self._n_coords += len(pts)
+            self._r_arr = None
+        if self._stops_muertas > max(1024, self._n_stops // 2):
+            vivos = np.flatnonzero(self.activo)
+            cols = (self.stop_km, self.stop_pos, self.stop_bus, self.stop_k)
+            partes = [[c[self.stop_ini[s]:self.stop_ini[s] + self.stop_n[s]].copy() for c in cols] for s in vivos]
+            self._n_stops = 0; self._stops_muertas = 0
+            for s, parte in zip(vivos, partes):
+                n = len(parte[0])
+                for c, v in zip(cols, parte):
+                    c[self._n_stops:self._n_stops + n] = v
+                self.stop_ini[s] = self._n_stops
+                self._n_stops += n
+
+    # ---------- buses ----------
+    def __len__(self) -> int:
+        return len(self.slot)
+
+    def __contains__(self, bus_id: str) -> bool:
+        return bus_id in self.slot
+
+    def add(self, bus_id: str, lat: float, lon: float, speed_kmh: float, route: Optional[Sequence[Punto]],
+            stops: Sequence[Punto] = (), dwell_sec: float = 5.0, destino: Optional[Punto] = None,
+            stop_ids: Sequence[Optional[int]] = ()) -> int:
+        """
+        Agrega (o reemplaza) un bus. route=None -> ruta recta de 2 puntos hasta destino.
+        Las paradas se proyectan una vez sobre la ruta y se guardan como km recorridos;
+        stop_ids (id OSM, paralelo a stops) las hace aparecer en tablero().
+        """
+        self.remove(bus_id)
+        recta = not route or len(route) < 2
+        if recta:
+            route = [(lat, lon), tuple(destino if destino is not None else (lat, lon))]
+        if self._libres:
+            s = self._libres.pop()
+        else:
+            s = len(self.ids)
+            self.ids.append(None)
+            for nombre in ("activo", "lat", "lon", "speed", "along", "rid", "recta", "arrived", "is_dwell",
+                           "dwell_until", "dwell_sec", "stop_ini", "stop_n", "next_stop"):
+                setattr(self, nombre, _crecer(getattr(self, nombre), s + 1))
+        rid = self._agregar_ruta(route)
+        km = np.zeros(0)
+        if stops and not recta:
+            _, km = project_points(route, LocalRoute(route).cum_km, [(p[0], p[1]) for p in stops])
+        i0, i1 = self._n_stops, self._n_stops + len(km)
+        self.stop_km = _crecer(self.stop_km, i1)
+        self.stop_pos = _crecer(self.stop_pos, i1, -1)
+        self.stop_bus = _crecer(self.stop_bus, i1, -1)
+        self.stop_k = _crecer(self.stop_k, i1)
+        self.stop_km[i0:i1] = km
+        self.stop_pos[i0:i1] = [self._pos_de(x) for x in stop_ids] if len(stop_ids) == len(km) else -1
+        self.stop_bus[i0:i1] = s
+        self.stop_k[i0:i1] = np.arange(len(km))
+
+        self.ids[s] = bus_id; self.slot[bus_id] = s
+        self.activo[s] = True
+        self.lat[s], self.lon[s], self.speed[s] = lat, lon, speed_kmh
+        self.along[s] = 0.0; self.rid[s] = rid; self.recta[s] = recta
+        self.arrived[s] = False; self.is_dwell[s] = False; self.dwell_until[s] = 0.0
+        self.dwell_sec[s] = dwell_sec
+        self.stop_ini[s], self.stop_n[s], self.next_stop[s] = self._n_stops, len(km), 0
+        self._n_stops += len(km)
+        return s
+
+    def _pos_de(self, sid: Optional[int]) -> int:
+        if sid is None:
+            return -1
+        pos = self._pos_por_sid.get(int(sid))
+        if pos is None:
+            pos = self._pos_por_sid[int(sid)] = len(self._sid)
+            self._sid.append(int(sid))
+        return pos
+
+    def remove(self, bus_id: str) -> bool:
+        s = self.slot.pop(bus_id, None)
+        if s is None:
+            return False
+        self.activo[s] = False
+        self.ids[s] = None
+        self._libres.append(s)
+        self._stops_muertas += int(self.stop_n[s])
+        self.stop_bus[self.stop_ini[s]:self.stop_ini[s] + self.stop_n[s]] = -1
+        self._soltar_ruta(int(self.rid[s]))
+        self._compactar()
+        return True
+
+    def set_destino(self, destino: Punto):
+        """Los buses en línea recta pasan a apuntar al nuevo destino desde donde están."""
+        for s in np.flatnonzero(self.activo & self.recta & ~self.arrived).tolist():
+            self._soltar_ruta(int(self.rid[s]))
+            self.rid[s] = self._agregar_ruta([(self.lat[s], self.lon[s]), tuple(destino)])
+            self.along[s] = 0.0
+        self._compactar()
+
+    def route_of(self, bus_id: str) -> List[Punto]:
+        ini, n = self.r_ini[self.rid[self.slot[bus_id]]], self.r_len[self.rid[self.slot[bus_id]]]
+        return [tuple(p) for p in self.coords[ini:ini + n].tolist()]
+
+    # ---------- simulación ----------
+    def advance_all(self, dt: float, now: float):
+        """
+        Avanza todos los buses dt segundos. Los que están en dwell no se mueven; al terminar
+        el dwell esperan al siguiente tick. Al alcanzar (a menos de stop_radius_km) la
+        próxima parada el bus se detiene en ella por dwell_sec.
+        """
+        if not len(self.slot) or dt <= 0:
+            return
+        act = self.activo
+        fin_dwell = act & self.is_dwell & (now >= self.dwell_until)
+        mover = np.flatnonzero(act & ~self.is_dwell & ~self.arrived & (self.speed > 0))
+        self.is_dwell[fin_dwell] = False
+        if not len(mover):
+            return
+
+        r_ini, r_len, r_base, r_total = self._rutas()
+        rid = self.rid[mover]
+        total = r_total[rid]
+        along = np.minimum(self.along[mover] + self.speed[mover] * dt / 3600.0, total)
+
+        # próxima parada: se ancla en ella y empieza el dwell
+        con_parada = np.flatnonzero(self.next_stop[mover] < self.stop_n[mover])
+        if len(con_parada):
+            s = mover[con_parada]
+            tgt = self.stop_km[self.stop_ini[s] + self.next_stop[s]]
+            llega = along[con_parada] >= tgt - self.stop_radius_km
+            s = s[llega]; k = con_parada[llega]
+            along[k] = np.clip(tgt[llega], self.along[s], total[k])
+            self.is_dwell[s] = True
+            self.dwell_until[s] = now + np.maximum(0.0, self.dwell_sec[s])
+            self.next_stop[s] += 1
+
+        self.along[mover] = along
+        self.arrived[mover] = along >= total - 1e-9
+
+        # tramo de cada bus en el eje global y posición interpolada
+        g = r_base[rid] + along
+        seg = np.searchsorted(self.gkm[:self._n_coords], g, side="right") - 1
+        seg = np.clip(seg, r_ini[rid], r_ini[rid] + r_len[rid] - 2)
+        g0 = self.gkm[seg]; largo = self.gkm[seg + 1] - g0
+        frac = np.divide(g - g0, largo, out=np.zeros_like(g), where=largo > 0)[:, None]
+        pos = self.coords[seg] + (self.coords[seg + 1] - self.coords[seg]) * frac
+        self.lat[mover] = pos[:, 0]
+        self.lon[mover] = pos[:, 1]
+
+    def reiniciar_llegados(self) -> int:
+        """Devuelve al inicio de su ruta (y de sus paradas) a los buses que llegaron; cuántos fueron."""
+        s = np.flatnonzero(self.activo & self.arrived & ~self.is_dwell)
+        if not len(s):
+            return 0
+        ini = np.asarray(self.r_ini, dtype=np.int64)[self.rid[s]]
+        self.lat[s], self.lon[s] = self.coords[ini, 0], self.coords[ini, 1]
+        self.along[s] = 0.0
+        self.next_stop[s] = 0
+        self.arrived[s] = False
+        return len(s)
+
+    def columnas(self, now: float) -> Dict[str, list]:
+        """Estado público de los buses activos, por columnas (para armar /sim/buses)."""
+        s = np.flatnonzero(self.activo)
+        if not len(s):
+            return {"bus_id": []}
+        r_total = self._rutas()[3]
+        dist = np.maximum(0.0, r_total[self.rid[s]] - self.along[s])
+        speed = self.speed[s]
+        remain = np.maximum(0, self.stop_n[s] - self.next_stop[s])
+        dwell_rem = np.where(self.is_dwell[s], np.maximum(0.0, self.dwell_until[s] - now), 0.0)
+        eta = dist / np.maximum(speed, 1e-6) * 60.0 + (dwell_rem + remain * self.dwell_sec[s]) / 60.0
+        return {"bus_id": [self.ids[i] for i in s.tolist()],
+                "lat": self.lat[s].tolist(), "lon": self.lon[s].tolist(), "speed_kmh": speed.tolist(),
+                "distance_km": dist.tolist(), "eta_min": eta.tolist(), "arrived": self.arrived[s].tolist(),
+                "has_route": (~self.recta[s]).tolist(), "is_dwell": self.is_dwell[s].tolist(),
+                "stops_total": self.stop_n[s].tolist(), "stops_next_idx": self.next_stop[s].tolist()}
+
+    def tablero(self, now: float, por_parada: int = 10) -> Dict[int, List[Tuple[str, float, float]]]:
+        """
+        Próximos buses por parada: id OSM -> [(bus_id, eta_min, distancia_km), ...] ordenado por
+        ETA, a lo más por_parada buses. Se arma de una vez para todas las paradas pendientes
+        (las que el bus aún no alcanza) con los km de la parada y del bus sobre su ruta; la ETA
+        suma el dwell en curso y el de las paradas intermedias, igual que columnas().
+        """
+        n = self._n_stops
+        dueno = self.stop_bus[:n]
+        j = np.flatnonzero((dueno >= 0) & (self.stop_pos[:n] >= 0))
+        if not len(j):
+            return {}
+        s = dueno[j]
+        pend = (self.stop_k[j] >= self.next_stop[s]) & ~self.arrived[s] & (self.speed[s] > 0)
+        j, s = j[pend], s[pend]
+        if not len(j):
+            return {}
+        dist = np.maximum(0.0, self.stop_km[j] - self.along[s])
+        dwell_rem = np.where(self.is_dwell[s], np.maximum(0.0, self.dwell_until[s] - now), 0.0)
+        eta = dist / self.speed[s] * 60.0 + (dwell_rem + (self.stop_k[j] - self.next_stop[s]) * self.dwell_sec[s]) / 60.0
+
+        # orden por (parada, eta) con una sola clave float (mucho más rápido que lexsort)
+        # y corte a los primeros por_parada de cada parada
+        pos = self.stop_pos[j]
+        orden = np.argsort(pos * (float(eta.max()) + 1.0) + eta)
+        pos, s, eta, dist = pos[orden], s[orden], eta[orden], dist[orden]
+        inicio = np.flatnonzero(np.r_[True, pos[1:] != pos[:-1]])
+        rango = np.arange(len(pos)) - np.repeat(inicio, np.diff(np.r_[inicio, len(pos)]))
+        k = rango < por_parada
+        out: Dict[int, List[Tuple[str, float, float]]] = {}
+        for p, b, e, d in zip(pos[k].tolist(), s[k].tolist(), eta[k].tolist(), dist[k].tolist()):
+            out.setdefault(self._sid[p], []).append((self.ids[b], e, d))
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        return {"buses": len(self.slot), "slots": len(self.ids), "routes": len(self.r_ini) - len(self._r_libres),
+                "coords": self._n_coords, "stops": self._n_stops - self._stops_muertas}
@@ -1,76 +1,34 @@
-import cv2
-import os
-import time
-from ultralytics import YOLO
+# ia.py
+# Punto de entrada histórico de la detección en vivo; el código vive en el paquete deteccion/.
+from deteccion import (estado_micro, ESTADOS, EstimadorOcupacion, UltimoFrame, ColaDescarte, LatenciaEtapa,
+                       CompuertaMovimiento, SumideroFrames, Detector)
 
 
-def estado_micro(x):
-    if x <= 20:
-        return "Asientos disponibles"
-    if x <= 30:
-        return "Pasillo disponible"
-    if x > 30:
-        return "Llena"
-
-
-def iniciar_deteccion(model_path='yolov8n.pt', intervalo=10, output_folder='frames_detectados', callback=None):
+def iniciar_deteccion(model_path='yolov8n.pt', intervalo=10, output_folder='frames_guardados', callback=None, fuente=0,
+                      compuerta=True, sumidero=None, estimador=None, callback_estado=None,
+                      ventana=True, imgsz=640, conf=0.25):
     """
     Inicia la detección de personas en tiempo real con YOLO.
     Si se pasa una función callback, se llama cada vez que hay una nueva detección:
         callback(num_personas)
+    ventana=False corre sin display (headless). model_path acepta también .onnx o
+    *_openvino_model/. Ver Detector y Detector.correr para el resto de los parámetros.
     """
-    model = YOLO(model_path)
-    os.makedirs(output_folder, exist_ok=True)
-
-    cap = cv2.VideoCapture(0)
-    if not cap.isOpened():
-        print("❌ No se pudo acceder a la cámara.")
-        return
-
-    last_time = time.time()
-    frame_id = 0
-
-    print("🎥 Detección iniciada... Presiona 'q' para salir.\n")
-
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            print("⚠️ No se pudo leer el frame de la cámara.")
-            break
-
-        current_time = time.time()
-
-        # Detección cada cierto intervalo
-        if current_time - last_time >= intervalo:
-            last_time = current_time
-
-            results = model(frame)
-            num_personas = (results[0].boxes.cls == 0).sum().item()
-
-            print(f"[{time.strftime('%H:%M:%S')}] {num_personas} personas detectadas.")
-            print(estado_micro(num_personas))
-
-            # Si se entregó una función externa, se llama aquí
-            if callback is not None:
-                try:
-                    callback(num_personas)
-                except Exception as e:
-                    print(f"⚠️ Error al ejecutar callback: {e}")
-
-            annotated_frame = results[0].plot()
-            save_path = os.path.join(output_folder, f"frame_{frame_id:04d}.jpg")
-            cv2.imwrite(save_path, annotated_frame)
-            frame_id += 1
-
-        cv2.imshow("Detección de personas (YOLOv8)", frame)
-
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
-
-    cap.release()
-    cv2.destroyAllWindows()
-    print("✅ Detección finalizada. Frames guardados en:", output_folder)
+    detector = Detector(model_path, imgsz=imgsz, conf=conf)
+    return detector.correr(fuente=fuente, intervalo=intervalo, callback=callback, callback_estado=callback_estado,
+                           compuerta=compuerta, sumidero=sumidero, estimador=estimador,
+                           output_folder=output_folder, ventana=ventana)
 
 
 if __name__ == "__main__":
-    iniciar_deteccion()
+    import argparse
+    ap = argparse.ArgumentParser(description="Detección de personas en vivo")
+    ap.add_argument("--fuente", default="0", help="índice de cámara, video, URL RTSP, carpeta o imagen")
+    ap.add_argument("--modelo", default="yolov8n.pt", help=".pt, .onnx o carpeta *_openvino_model")
+    ap.add_argument("--intervalo", type=float, default=10)
+    ap.add_argument("--imgsz", type=int, default=640)
+    ap.add_argument("--conf", type=float, default=0.25)
+    ap.add_argument("--headless", action="store_true", help="sin ventana de OpenCV")
+    a = ap.parse_args()
+    iniciar_deteccion(model_path=a.modelo, intervalo=a.intervalo, fuente=a.fuente, ventana=not a.headless,
+                      imgsz=a.imgsz, conf=a.conf)
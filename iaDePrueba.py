@@ -1,81 +1,98 @@
-import cv2
-import os
 import time
-from ultralytics import YOLO
 import requests
+import ia
+from deteccion import estado_micro
 
 TRACKER_URL = "http://127.0.0.1:5000"  # donde corre tracker_server
 BUS_ID = "bus001"  # ID de la micro que estás monitoreando
 
-def estado_micro(x):
-    if x <= 20:
-        return "Asientos disponibles"
-    if x <= 30:
-        return "Pasillo disponible"
-    if x > 30:
-        return "Llena"
-
-def enviar_ocupacion(bus_id, count):
+def enviar_ocupacion(bus_id, count, estado=None):
     payload = {
         "bus_id": bus_id,
         "count": count,
-        "status": estado_micro(count),
+        "status": estado or estado_micro(count),
         "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
         "capacity": 40
     }
 
     try:
-        r = requests.post(f"{TRACKER_URL}/occupancy", json=payload)
+        r = requests.post(f"{TRACKER_URL}/occupancy", json=payload, timeout=10)
         r.raise_for_status()
         print(f"✅ Estado enviado: {payload}")
     except Exception as e:
         print(f"❌ Error enviando ocupación: {e}")
 
-def iniciar_deteccion(model_path='yolov8n.pt', intervalo=10, output_folder='frames_detectados'):
+class BufferOcupacion:
     """
-    Detección de personas en tiempo real con YOLO, actualizando ocupación en tracker_server.
+    Acumula lecturas y las envía en lote a /occupancy/batch cuando se juntan
+    max_lecturas o pasan max_espera segundos desde la primera pendiente.
+    Si el envío falla por red o error del servidor (5xx), las lecturas se conservan
+    (hasta max_pendientes) para el próximo intento; un 4xx significa que el lote es
+    inválido, así que se descarta (y se informa) en vez de reenviarlo para siempre.
     """
-    model = YOLO(model_path)
-    os.makedirs(output_folder, exist_ok=True)
-
-    cap = cv2.VideoCapture(0)
-    if not cap.isOpened():
-        print("❌ No se pudo acceder a la cámara.")
-        return
-
-    last_time = time.time()
-    frame_id = 0
-    print("🎥 Detección iniciada... Presiona 'q' para salir.\n")
-
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            print("⚠️ No se pudo leer el frame de la cámara.")
-            break
-
-        current_time = time.time()
-        if current_time - last_time >= intervalo:
-            last_time = current_time
 
-            results = model(frame)
-            num_personas = (results[0].boxes.cls == 0).sum().item()
-            print(f"[{time.strftime('%H:%M:%S')}] {num_personas} personas detectadas. {estado_micro(num_personas)}")
+    def __init__(self, tracker_url=TRACKER_URL, max_lecturas=50, max_espera=30.0, max_pendientes=10000):
+        self.url = f"{tracker_url}/occupancy/batch"
+        self.max_lecturas = max_lecturas
+        self.max_espera = max_espera
+        self.max_pendientes = max_pendientes
+        self.pendientes = []
+        self.t_primera = None
+        self.session = requests.Session()
 
-            # 🔹 Enviar automáticamente la ocupación al tracker_server
-            enviar_ocupacion(BUS_ID, num_personas)
+    def agregar(self, bus_id, count, estado=None, capacity=40):
+        self.pendientes.append({
+            "bus_id": bus_id,
+            "count": count,
+            "status": estado or estado_micro(count),
+            "capacity": capacity,
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        })
+        if self.t_primera is None:
+            self.t_primera = time.time()
+        if len(self.pendientes) >= self.max_lecturas or time.time() - self.t_primera >= self.max_espera:
+            self.flush()
 
-            annotated_frame = results[0].plot()
-            save_path = os.path.join(output_folder, f"frame_{frame_id:04d}.jpg")
-            cv2.imwrite(save_path, annotated_frame)
-            frame_id += 1
+    def flush(self):
+        if not self.pendientes:
+            return
+        lote = self.pendientes
+        try:
+            r = self.session.post(self.url, json=lote, timeout=10)
+            if 400 <= r.status_code < 500:
+                try:
+                    errores = r.json().get("errors") or [{"index": None, "error": r.json().get("error")}]
+                except ValueError:
+                    errores = [{"index": None, "error": r.text[:200]}]
+                print(f"❌ Lote rechazado ({r.status_code}), se descartan {len(lote)} lecturas")
+            else:
+                r.raise_for_status()
+                errores = r.json().get("errors", [])
+                print(f"✅ Lote enviado: {len(lote) - len(errores)} lecturas")
+            for e in errores:
+                lectura = lote[e["index"]] if isinstance(e.get("index"), int) and e["index"] < len(lote) else ""
+                print(f"⚠️ Lectura rechazada {lectura}: {e['error']}")
+            self.pendientes = []
+            self.t_primera = None
+        except Exception as e:
+            print(f"❌ Error enviando lote de ocupación: {e}")
+            self.pendientes = lote[-self.max_pendientes:]
 
-        cv2.imshow("Detección de personas (YOLOv8)", frame)
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
-
-    cap.release()
-    cv2.destroyAllWindows()
-    print("✅ Detección finalizada. Frames guardados en:", output_folder)
+def iniciar_deteccion(model_path='yolov8n.pt', intervalo=10, output_folder='frames_guardados'):
+    """
+    Detección de personas en tiempo real con YOLO, actualizando ocupación en tracker_server.
+    El envío HTTP corre en la etapa de reporte del pipeline de ia.py, sin bloquear la cámara;
+    solo se reporta cuando cambia el estado suavizado (o cada 60 s como latido) y las
+    lecturas viajan en lote a /occupancy/batch (BufferOcupacion).
+    """
+    # 🔹 Enviar automáticamente la ocupación al tracker_server
+    buffer = BufferOcupacion(max_lecturas=10, max_espera=30.0)
+    try:
+        return ia.iniciar_deteccion(model_path=model_path, intervalo=intervalo, output_folder=output_folder,
+                                    estimador=ia.EstimadorOcupacion(capacidad=40, latido=60.0),
+                                    callback_estado=lambda n, estado: buffer.agregar(BUS_ID, n, estado))
+    finally:
+        buffer.flush()
 
 if __name__ == "__main__":
     iniciar_deteccion()
@@ -0,0 +1,82 @@
+# multicam.py
+# Detección por lotes para varias micros a la vez: un solo model() por tick.
+#   python multicam.py bus001=frames_detectados bus002=video.mp4 bus003=rtsp://... --intervalo 10
+import sys
+import time
+
+from deteccion import Detector, abrir_fuente, estado_micro
+
+
+class DetectorMulticamara:
+    """
+    Lee un frame de cada fuente, los apila en lotes de hasta `lote` imágenes y corre
+    un único model() por lote, devolviendo el conteo de personas por bus_id.
+    """
+
+    def __init__(self, fuentes, model_path='yolov8n.pt', lote=16, model=None, detector=None):
+        self.detector = detector or Detector(model_path, model=model)
+        self.fuentes = {bus_id: abrir_fuente(spec) if isinstance(spec, (str, int)) else spec
+                        for bus_id, spec in fuentes.items()}
+        self.lote = lote
+
+    def contar(self, frames_por_bus):
+        """{bus_id: frame} -> {bus_id: num_personas}, en lotes de self.lote."""
+        ids = list(frames_por_bus)
+        conteos = {}
+        for i in range(0, len(ids), self.lote):
+            bloque = ids[i:i + self.lote]
+            results = self.detector.detectar([frames_por_bus[b] for b in bloque])
+            for bus_id, r in zip(bloque, results):
+                conteos[bus_id] = self.detector.personas(r)
+        return conteos
+
+    def tick(self):
+        """Un ciclo: un frame por fuente activa; las fuentes agotadas se cierran y se quitan."""
+        frames = {}
+        for bus_id, fuente in list(self.fuentes.items()):
+            frame = fuente.leer()
+            if frame is None:
+                fuente.cerrar()
+                del self.fuentes[bus_id]
+            else:
+                frames[bus_id] = frame
+        return self.contar(frames) if frames else {}
+
+    def correr(self, intervalo=10, callback=None):
+        """Repite tick() cada `intervalo` s hasta agotar las fuentes; callback(bus_id, num_personas)."""
+        while self.fuentes:
+            t0 = time.time()
+            for bus_id, n in self.tick().items():
+                print(f"[{time.strftime('%H:%M:%S')}] {bus_id}: {n} personas. {estado_micro(n)}")
+                if callback is not None:
+                    try:
+                        callback(bus_id, n)
+                    except Exception as e:
+                        print(f"⚠️ Error al ejecutar callback: {e}")
+            time.sleep(max(0.0, intervalo - (time.time() - t0)))
+
+    @property
+    def frames_procesados(self):
+        return self.detector.frames_procesados
+
+    def fps(self):
+        return self.detector.fps()
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    intervalo = 10.0
+    if "--intervalo" in args:
+        k = args.index("--intervalo")
+        intervalo = float(args[k + 1])
+        del args[k:k + 2]
+    fuentes = dict(a.split("=", 1) for a in args if "=" in a)
+    if not fuentes:
+        print("Uso: python multicam.py bus001=<carpeta|imagen|video|rtsp://...> [...] [--intervalo s]")
+        sys.exit(2)
+    det = DetectorMulticamara(fuentes)
+    try:
+        det.correr(intervalo=intervalo)
+    except KeyboardInterrupt:
+        pass
+    print(f"✅ {det.frames_procesados} frames, {det.fps():.1f} frames/s de inferencia")
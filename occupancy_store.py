@@ -0,0 +1,284 @@
+# occupancy_store.py
+# Escritura agrupada de lecturas de ocupación en SQLite (una conexión, WAL, group commit)
+# y consultas de historial sobre índices y tablas de agregados por intervalo.
+import queue, sqlite3, threading, time
+from itertools import groupby
+from operator import itemgetter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+Row = Tuple[Any, ...]   # (bus_id, ts, ts_epoch, count, status, capacity, pct)
+
+ROLLUP_BUCKETS = (60, 900, 3600)          # 1 min, 15 min, 1 h
+BUCKET_NAMES = {"1m": 60, "15m": 900, "1h": 3600}
+# Rango máximo (s) de una consulta de historial por tamaño de bucket (None = crudo), para
+# acotar filas y memoria de la respuesta. Crudo sin bus_id es toda la flota: tope más corto.
+HISTORY_MAX_SPAN = {None: 7*24*3600, 60: 7*24*3600, 900: 92*24*3600, 3600: 366*24*3600}
+HISTORY_MAX_SPAN_RAW_FLEET = 3600
+
+
+def max_span(bucket_sec: Optional[int], bus_id: Optional[str]) -> int:
+    """Rango máximo permitido para query_history con ese bucket y filtro de bus."""
+    if bucket_sec is None and not bus_id:
+        return HISTORY_MAX_SPAN_RAW_FLEET
+    return HISTORY_MAX_SPAN[bucket_sec]
+
+INSERT_SQL = "INSERT INTO ocupacion (bus_id, ts, ts_epoch, count, status, capacity, pct) VALUES (?,?,?,?,?,?,?)"
+
+ROLLUP_UPSERT_SQL = """INSERT INTO ocupacion_rollup(bucket_sec, bus_id, bucket_start, n, n_pct, sum_pct, max_pct, sum_count, max_count)
+VALUES (?,?,?,?,?,?,?,?,?)
+ON CONFLICT(bucket_sec, bus_id, bucket_start) DO UPDATE SET
+    n = n + excluded.n,
+    n_pct = n_pct + excluded.n_pct,
+    sum_pct = sum_pct + excluded.sum_pct,
+    max_pct = CASE WHEN max_pct IS NULL OR excluded.max_pct > max_pct THEN excluded.max_pct ELSE max_pct END,
+    sum_count = sum_count + excluded.sum_count,
+    max_count = MAX(max_count, excluded.max_count)"""
+
+
+def _ts_to_epoch(ts: str) -> Optional[int]:
+    """ts de la tabla ('YYYY-mm-dd HH:MM:SS' o con 'T', hora local) a epoch."""
+    try:
+        return int(time.mktime(time.strptime(str(ts).replace("T", " ")[:19], "%Y-%m-%d %H:%M:%S")))
+    except (TypeError, ValueError):
+        return None
+
+
+def _pct100(count: Any, capacity: Any) -> Optional[float]:
+    return (count / capacity) * 100.0 if count is not None and capacity else None
+
+
+def _int_o_none(v: Any) -> Optional[int]:
+    if v is None:
+        return None
+    if isinstance(v, bool) or not isinstance(v, (int, float)):
+        raise TypeError(f"se esperaba un entero: {v!r}")
+    return int(v)
+
+
+def _normalizar(row: Row) -> Row:
+    """Fila con tipos de la tabla (count/capacity/ts_epoch enteros); TypeError si no se puede."""
+    bus_id, ts, ts_epoch, count, status, capacity, pct = row
+    count, capacity = _int_o_none(count), _int_o_none(capacity)
+    return (str(bus_id), str(ts), _int_o_none(ts_epoch), count, None if status is None else str(status),
+            capacity, count / capacity if count is not None and capacity else None)
+
+
+def init_schema(con: sqlite3.Connection):
+    """Crea/migra la tabla ocupacion: columna ts_epoch, índices y agregados por intervalo."""
+    con.execute("""CREATE TABLE IF NOT EXISTS ocupacion(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        bus_id TEXT, ts TEXT, count INTEGER, status TEXT, capacity INTEGER, pct REAL, ts_epoch INTEGER
+    )""")
+    cols = {r[1] for r in con.execute("PRAGMA table_info(ocupacion)")}
+    if "ts_epoch" not in cols:
+        con.execute("ALTER TABLE ocupacion ADD COLUMN ts_epoch INTEGER")
+    pend = con.execute("SELECT id, ts FROM ocupacion WHERE ts_epoch IS NULL").fetchall()
+    if pend:
+        con.executemany("UPDATE ocupacion SET ts_epoch=? WHERE id=?", [(_ts_to_epoch(ts), i) for i, ts in pend])
+    con.execute("CREATE INDEX IF NOT EXISTS idx_ocupacion_bus_ts ON ocupacion(bus_id, ts_epoch)")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_ocupacion_ts ON ocupacion(ts_epoch)")
+
+    existe = con.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='ocupacion_rollup'").fetchone()
+    con.execute("""CREATE TABLE IF NOT EXISTS ocupacion_rollup(
+        bucket_sec INTEGER, bus_id TEXT, bucket_start INTEGER,
+        n INTEGER, n_pct INTEGER, sum_pct REAL, max_pct REAL, sum_count INTEGER, max_count INTEGER,
+        PRIMARY KEY(bucket_sec, bus_id, bucket_start)
+    ) WITHOUT ROWID""")
+    if not existe:
+        # primera vez: agregados a partir del historial ya guardado
+        filas = con.execute("SELECT bus_id, ts_epoch, count, capacity FROM ocupacion WHERE ts_epoch IS NOT NULL").fetchall()
+        con.executemany(ROLLUP_UPSERT_SQL, _rollup_rows(filas))
+    con.commit()
+
+
+def _rollup_rows(rows: Iterable[Tuple[str, int, Any, Any]], buckets: Sequence[int] = ROLLUP_BUCKETS) -> List[Tuple]:
+    """Pre-agrega (bus_id, ts_epoch, count, capacity) por intervalo para un solo upsert por celda."""
+    acc: Dict[Tuple[int, str, int], List[Any]] = {}
+    for bus_id, ep, count, capacity in rows:
+        if ep is None:
+            continue
+        pct = _pct100(count, capacity)
+        for b in buckets:
+            k = (b, bus_id, ep - ep % b)
+            a = acc.get(k)
+            if a is None:
+                a = acc[k] = [0, 0, 0.0, None, 0, 0]
+            a[0] += 1
+            if pct is not None:
+                a[1] += 1; a[2] += pct
+                a[3] = pct if a[3] is None else max(a[3], pct)
+            a[4] += count or 0
+            a[5] = max(a[5], count or 0)
+    return [k + tuple(v) for k, v in acc.items()]
+
+
+def query_history(con: sqlite3.Connection, bus_id: Optional[str], t0: int, t1: int,
+                  bucket_sec: Optional[int]) -> Dict[str, Dict[str, List[Any]]]:
+    """
+    Serie por bus en [t0, t1), en columnas ({"t": [...], "avg_pct": [...], ...}) para
+    que una semana de toda la flota se serialice rápido. bucket_sec=None devuelve las
+    lecturas crudas; si no, los buckets precalculados (avg/max de % y de conteo).
+    ValueError si t1 - t0 supera max_span(bucket_sec, bus_id).
+    """
+    if t1 - t0 > max_span(bucket_sec, bus_id):
+        raise ValueError(f"range too large (max {max_span(bucket_sec, bus_id)} s for this bucket)")
+    args: List[Any]
+    if bucket_sec is None:
+        sql = ("SELECT bus_id, ts_epoch, count, status, capacity FROM ocupacion "
+               "WHERE ts_epoch >= ? AND ts_epoch < ?")
+        args = [t0, t1]
+        orden = "ts_epoch"
+    else:
+        sql = ("SELECT bus_id, bucket_start, n, n_pct, sum_pct, max_pct, sum_count, max_count "
+               "FROM ocupacion_rollup WHERE bucket_sec = ? AND bucket_start >= ? AND bucket_start < ?")
+        args = [bucket_sec, t0 - t0 % bucket_sec, t1]
+        orden = "bucket_start"
+    if bus_id:
+        sql += " AND bus_id = ?"; args.append(bus_id)
+    rows = con.execute(sql + f" ORDER BY bus_id, {orden}", args).fetchall()
+
+    # las filas vienen ordenadas por bus: cada grupo se transpone a columnas de una vez
+    series: Dict[str, Dict[str, List[Any]]] = {}
+    for b, grupo in groupby(rows, key=itemgetter(0)):
+        cols = list(zip(*grupo))
+        if bucket_sec is None:
+            t, count, status, cap = cols[1:]
+            series[b] = {"t": list(t), "count": list(count), "status": list(status), "capacity": list(cap),
+                         "pct": [round(c * 100.0 / k, 1) if k and c is not None else None for c, k in zip(count, cap)]}
+        else:
+            t, n, n_pct, sum_pct, max_pct, sum_count, max_count = cols[1:]
+            series[b] = {"t": list(t), "n": list(n),
+                         "avg_pct": [round(s / k, 1) if k else None for s, k in zip(sum_pct, n_pct)],
+                         "max_pct": [round(m, 1) if m is not None else None for m in max_pct],
+                         "avg_count": [round(s / k, 2) for s, k in zip(sum_count, n)],
+                         "max_count": list(max_count)}
+    return series
+
+
+class OccupancyWriter:
+    """
+    Encola filas y las inserta desde un único hilo con una conexión de larga vida.
+    Se hace commit cada batch_size filas o cada flush_sec segundos, lo que ocurra primero.
+    En la misma transacción se actualizan los agregados de ocupacion_rollup.
+    Si un lote falla se reintenta fila por fila: solo se pierde (y se informa) la fila mala.
+    Con la cola llena put()/put_many() esperan a lo más put_timeout s y descartan (dropped).
+    """
+
+    def __init__(self, path: str, batch_size: int = 500, flush_sec: float = 0.5, maxsize: int = 100_000,
+                 put_timeout: float = 0.05):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_sec = flush_sec
+        self.put_timeout = put_timeout
+        self.rows_written = 0
+        self.commits = 0
+        self.rows_failed = 0
+        self.dropped = 0
+        self._q: "queue.Queue[Any]" = queue.Queue(maxsize=maxsize)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="occupancy-writer", daemon=True)
+        self._thread.start()
+
+    def _encolar(self, item: Any, n: int) -> bool:
+        if self._closed:
+            raise RuntimeError("OccupancyWriter cerrado")
+        try:
+            self._q.put(item, timeout=self.put_timeout)
+            return True
+        except queue.Full:
+            self.dropped += n
+            return False
+
+    def put(self, row: Row) -> bool:
+        """Encola una fila; False si la cola está llena y se descartó."""
+        return self._encolar(row, 1)
+
+    def put_many(self, rows: Iterable[Row]) -> bool:
+        """Encola un bloque de filas que se inserta en un mismo commit; False si se descartó."""
+        rows = list(rows)
+        return self._encolar(rows, len(rows)) if rows else True
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Bloquea hasta que todo lo encolado hasta ahora esté confirmado en disco."""
+        if not self._thread.is_alive():
+            return self._q.empty()
+        ev = threading.Event()
+        try:
+            self._q.put(ev, timeout=timeout)
+        except queue.Full:
+            return False
+        return ev.wait(timeout)
+
+    def close(self, timeout: Optional[float] = 10.0):
+        """Vacía la cola, hace el último commit y termina el hilo escritor."""
+        if self._closed:
+            return
+        self._closed = True
+        self._q.put(None)
+        self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"queued": self._q.qsize(), "rows_written": self.rows_written, "commits": self.commits,
+                "rows_failed": self.rows_failed, "dropped": self.dropped, "writer_alive": self._thread.is_alive(),
+                "batch_size": self.batch_size, "flush_sec": self.flush_sec}
+
+    def _write(self, con: sqlite3.Connection, rows: List[Row]):
+        # el rollup solo debe recibir enteros: las filas con tipos inválidos hacen fallar el lote
+        rows = [_normalizar(r) for r in rows]
+        con.executemany(INSERT_SQL, rows)
+        con.executemany(ROLLUP_UPSERT_SQL, _rollup_rows((r[0], r[2], r[3], r[5]) for r in rows))
+
+    def _escribir_lote(self, con: sqlite3.Connection, rows: List[Row]):
+        """Un commit para todo el lote; si falla, fila por fila para aislar y descartar las malas."""
+        try:
+            self._write(con, rows)
+            con.commit()
+            self.rows_written += len(rows)
+            self.commits += 1
+            return
+        except Exception as e:
+            con.rollback()
+            if len(rows) == 1:
+                self.rows_failed += 1
+                print("WARN ocupación, fila descartada:", rows[0], e)
+                return
+        for row in rows:
+            self._escribir_lote(con, [row])
+
+    def _run(self):
+        con = sqlite3.connect(self.path)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("PRAGMA synchronous=NORMAL")
+        pending = []
+        waiters = []
+        deadline = None
+        stop = False
+        while not stop:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._q.get(timeout=timeout)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                stop = True
+            elif isinstance(item, threading.Event):
+                waiters.append(item)
+            elif isinstance(item, list):
+                pending.extend(item)
+            elif item != ():
+                pending.append(item)
+            if pending and deadline is None:
+                deadline = time.monotonic() + self.flush_sec
+
+            if stop or waiters or len(pending) >= self.batch_size or (deadline is not None and time.monotonic() >= deadline):
+                if pending:
+                    try:
+                        self._escribir_lote(con, pending)
+                    except Exception as e:           # p.ej. rollback fallido: el hilo no debe morir
+                        print("WARN ocupación SQLite:", e)
+                    pending = []
+                deadline = None
+                for ev in waiters:
+                    ev.set()
+                waiters = []
+        con.close()
@@ -1,25 +1,32 @@
 # red_client.py
-import os, requests, time
-from typing import List, Dict, Any
+# Feeds GTFS-Realtime de RED: lectura puntual, poller en segundo plano con índices en memoria
+# y un servidor local de fixtures para probarlo sin la API real.
+#   python red_client.py serve fixtures/ [puerto]        (sirve vehicle_positions.pb / trip_updates.pb)
+#   python red_client.py poll http://127.0.0.1:8765/vehicle_positions.pb http://127.0.0.1:8765/trip_updates.pb
+#   python red_client.py check                           (ejercita el poller con fixtures/red/)
+import os, requests, sys, threading, time
+from bisect import bisect_left
+from typing import List, Dict, Any, Optional, Callable, Tuple
 from google.transit import gtfs_realtime_pb2
 
+def _headers() -> Dict[str, str]:
+    headers = {}
+    if os.getenv("RED_API_KEY"):
+        headers["Authorization"] = f"Bearer {os.getenv('RED_API_KEY')}"
+    return headers
+
 def _get(url_env: str) -> bytes:
     url = os.getenv(url_env)
     if not url:
         raise RuntimeError(f"Falta variable {url_env}")
-    headers = {}
-    if os.getenv("RED_API_KEY"):
-        headers["Authorization"] = f"Bearer {os.getenv('RED_API_KEY')}"
-    r = requests.get(url, headers=headers, timeout=10)
+    r = requests.get(url, headers=_headers(), timeout=10)
     r.raise_for_status()
     return r.content
 
-def vehicle_positions() -> List[Dict[str, Any]]:
-    feed = gtfs_realtime_pb2.FeedMessage()
-    feed.ParseFromString(_get("RED_VEH_POS_URL"))
+def _parse_vehicles(feed) -> List[Dict[str, Any]]:
     out = []
     for e in feed.entity:
-        if not e.HasField("vehicle"): 
+        if not e.HasField("vehicle"):
             continue
         v = e.vehicle
         d = {
@@ -38,9 +45,7 @@ def vehicle_positions() -> List[Dict[str, Any]]:
         out.append(d)
     return out
 
-def trip_updates() -> List[Dict[str, Any]]:
-    feed = gtfs_realtime_pb2.FeedMessage()
-    feed.ParseFromString(_get("RED_TRIP_UP_URL"))
+def _parse_trip_updates(feed) -> List[Dict[str, Any]]:
     out = []
     for e in feed.entity:
         if not e.HasField("trip_update"):
@@ -60,9 +65,341 @@ def trip_updates() -> List[Dict[str, Any]]:
         out.append(d)
     return out
 
+def vehicle_positions() -> List[Dict[str, Any]]:
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.ParseFromString(_get("RED_VEH_POS_URL"))
+    return _parse_vehicles(feed)
+
+def trip_updates() -> List[Dict[str, Any]]:
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.ParseFromString(_get("RED_TRIP_UP_URL"))
+    return _parse_trip_updates(feed)
+
+# ==================== Poller incremental ====================
+class FeedPoller:
+    """
+    Descarga condicional de un feed: If-None-Match / If-Modified-Since con lo último
+    recibido (304 = sin cambios) y, si el servidor igual responde 200, se compara
+    header.timestamp para no reindexar un feed que no avanzó.
+    poll() devuelve "304", "igual", "nuevo" o "error"; en "nuevo" llama on_feed(feed).
+    """
+
+    def __init__(self, url: str, on_feed: Callable[[Any], None], session: Optional[requests.Session] = None,
+                 timeout: float = 10.0):
+        self.url = url
+        self.on_feed = on_feed
+        self.session = session or requests.Session()
+        self.timeout = timeout
+        self.etag: Optional[str] = None
+        self.last_modified: Optional[str] = None
+        self.header_ts = 0
+        self.stats = {"polls": 0, "no_modificado": 0, "igual": 0, "nuevos": 0, "errores": 0,
+                      "bytes": 0, "ultimo_error": None, "ultima_ms": 0.0}
+
+    def poll(self) -> str:
+        self.stats["polls"] += 1
+        headers = _headers()
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        t0 = time.perf_counter()
+        try:
+            r = self.session.get(self.url, headers=headers, timeout=self.timeout)
+            if r.status_code == 304:
+                self.stats["no_modificado"] += 1
+                return "304"
+            r.raise_for_status()
+            self.stats["bytes"] += len(r.content)
+            feed = gtfs_realtime_pb2.FeedMessage()
+            feed.ParseFromString(r.content)
+            ts = int(feed.header.timestamp)
+            if ts and ts <= self.header_ts:
+                estado = "igual"
+            else:
+                self.on_feed(feed)
+                self.header_ts = ts
+                estado = "nuevo"
+            # los validadores se guardan recién con el feed procesado: si el parseo o el
+            # indexado fallan, el próximo poll vuelve a descargarlo en vez de recibir 304
+            self.etag = r.headers.get("ETag") or self.etag
+            self.last_modified = r.headers.get("Last-Modified") or self.last_modified
+            self.stats["igual" if estado == "igual" else "nuevos"] += 1
+            return estado
+        except Exception as e:
+            self.stats["errores"] += 1
+            self.stats["ultimo_error"] = str(e)
+            return "error"
+        finally:
+            self.stats["ultima_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+
+
+class RedRealtime:
+    """
+    Poller en segundo plano de los feeds de posiciones y de trip updates, con índices
+    por route_id, trip_id y stop_id. Cada feed nuevo arma índices nuevos y los publica
+    reemplazando la referencia (las consultas nunca ven un índice a medio armar), así
+    las consultas responden desde memoria en O(resultado).
+    """
+
+    def __init__(self, veh_url: Optional[str], trip_url: Optional[str], intervalo: float = 15.0,
+                 session: Optional[requests.Session] = None):
+        self.intervalo = intervalo
+        self.session = session or requests.Session()
+        self._veh = {"por_ruta": {}, "por_trip": {}, "n": 0, "header_ts": 0}
+        self._trips = {"por_trip": {}, "por_parada": {}, "n": 0, "header_ts": 0}
+        self.pollers: Dict[str, FeedPoller] = {}
+        if veh_url:
+            self.pollers["vehicles"] = FeedPoller(veh_url, self._indexar_vehiculos, self.session)
+        if trip_url:
+            self.pollers["trip_updates"] = FeedPoller(trip_url, self._indexar_trips, self.session)
+        self._parar = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---------- índices ----------
+    def _indexar_vehiculos(self, feed):
+        trips = self._trips["por_trip"]
+        por_ruta: Dict[str, List[Dict[str, Any]]] = {}
+        por_trip: Dict[str, Dict[str, Any]] = {}
+        vehs = _parse_vehicles(feed)
+        for v in vehs:
+            if v["route_id"] is None and v["trip_id"] in trips:
+                v["route_id"] = trips[v["trip_id"]]["route_id"]
+            if v["route_id"] is not None:
+                por_ruta.setdefault(v["route_id"], []).append(v)
+            if v["trip_id"] is not None:
+                por_trip[v["trip_id"]] = v
+        self._veh = {"por_ruta": por_ruta, "por_trip": por_trip, "n": len(vehs),
+                     "header_ts": int(feed.header.timestamp)}
+
+    def _indexar_trips(self, feed):
+        por_trip: Dict[str, Dict[str, Any]] = {}
+        llegadas: Dict[str, List[Tuple[int, str, Optional[str]]]] = {}
+        tus = _parse_trip_updates(feed)
+        for tu in tus:
+            if tu["trip_id"] is not None:
+                por_trip[tu["trip_id"]] = tu
+            for st in tu["stops"]:
+                t = st["arrival"] or st["departure"]
+                if st["stop_id"] and t:
+                    llegadas.setdefault(st["stop_id"], []).append((t, tu["trip_id"], tu["route_id"]))
+        por_parada = {}
+        for stop_id, items in llegadas.items():
+            items.sort(key=lambda x: x[0])
+            por_parada[stop_id] = ([x[0] for x in items], items)
+        self._trips = {"por_trip": por_trip, "por_parada": por_parada, "n": len(tus),
+                       "header_ts": int(feed.header.timestamp)}
+
+    # ---------- consultas ----------
+    def vehicles_on_route(self, route_id: str) -> List[Dict[str, Any]]:
+        return list(self._veh["por_ruta"].get(route_id, ()))
+
+    def vehicle_for_trip(self, trip_id: str) -> Optional[Dict[str, Any]]:
+        return self._veh["por_trip"].get(trip_id)
+
+    def trip_update(self, trip_id: str) -> Optional[Dict[str, Any]]:
+        return self._trips["por_trip"].get(trip_id)
+
+    def next_arrivals(self, stop_id: str, now: Optional[float] = None, limit: int = 10) -> List[Dict[str, Any]]:
+        """Próximas llegadas (time >= now) a la parada, ordenadas por hora."""
+        idx = self._trips["por_parada"].get(stop_id)
+        if idx is None or limit <= 0:
+            return []
+        tiempos, items = idx
+        i = bisect_left(tiempos, int(time.time() if now is None else now))
+        return [{"time": t, "trip_id": trip, "route_id": ruta} for t, trip, ruta in items[i:i + limit]]
+
+    # ---------- ciclo ----------
+    def poll_once(self) -> Dict[str, str]:
+        # trip updates primero: de ahí sale la ruta de los vehículos que no la informan
+        return {nombre: self.pollers[nombre].poll() for nombre in ("trip_updates", "vehicles") if nombre in self.pollers}
+
+    def _run(self):
+        while not self._parar.is_set():
+            t0 = time.time()
+            self.poll_once()
+            self._parar.wait(max(0.0, self.intervalo - (time.time() - t0)))
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._parar.clear()
+            self._thread = threading.Thread(target=self._run, name="red-realtime", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._parar.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"intervalo": self.intervalo,
+                "vehicles": {"n": self._veh["n"], "header_ts": self._veh["header_ts"],
+                             "rutas": len(self._veh["por_ruta"])},
+                "trip_updates": {"n": self._trips["n"], "header_ts": self._trips["header_ts"],
+                                 "paradas": len(self._trips["por_parada"])},
+                "pollers": {k: dict(p.stats) for k, p in self.pollers.items()}}
+
 # Fallback NO OFICIAL (mientras esperas acceso):
-def arrivals_by_stop_xor(stop_code: str) -> Dict[str, Any]:
+def arrivals_by_stop_xor(stop_code: str, session: Optional[requests.Session] = None) -> Dict[str, Any]:
     url = f"https://api.xor.cl/red/bus-stop/{stop_code}"
-    r = requests.get(url, timeout=10)
+    r = (session or requests).get(url, timeout=10)
     r.raise_for_status()
     return r.json()
+
+# ==================== Fixtures ====================
+FIXTURES_RED = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "red")
+FIXTURE_TS = 1760000000          # header.timestamp de los fixtures versionados
+
+def escribir_fixtures(carpeta: str, ts: int = FIXTURE_TS):
+    """
+    Escribe un par de feeds chicos y deterministas (vehicle_positions.pb / trip_updates.pb):
+    3 rutas, 6 viajes y 4 paradas; las llegadas son ts + 60..540 s. El vehículo del viaje T6
+    no informa route_id (sale del trip update).
+    """
+    os.makedirs(carpeta, exist_ok=True)
+    veh = gtfs_realtime_pb2.FeedMessage()
+    veh.header.gtfs_realtime_version = "2.0"; veh.header.timestamp = ts
+    tus = gtfs_realtime_pb2.FeedMessage()
+    tus.header.gtfs_realtime_version = "2.0"; tus.header.timestamp = ts
+    for i in range(1, 7):
+        ruta, trip = f"R{(i - 1) % 3 + 1}", f"T{i}"
+        e = veh.entity.add(); e.id = f"V{i}"
+        e.vehicle.trip.trip_id = trip
+        if i != 6:
+            e.vehicle.trip.route_id = ruta
+        e.vehicle.position.latitude = -33.0 - i * 0.001
+        e.vehicle.position.longitude = -71.55
+        e.vehicle.timestamp = ts
+        e = tus.entity.add(); e.id = f"TU{i}"
+        e.trip_update.trip.trip_id = trip; e.trip_update.trip.route_id = ruta
+        for k in range(4):
+            st = e.trip_update.stop_time_update.add()
+            st.stop_id = f"PA{k + 1}"
+            st.arrival.time = ts + 60 * (i + k * 2)
+    for nombre, feed in (("vehicle_positions.pb", veh), ("trip_updates.pb", tus)):
+        with open(os.path.join(carpeta, nombre), "wb") as fh:
+            fh.write(feed.SerializeToString())
+
+def _servidor_fixtures(carpeta: str, port: int = 8765):
+    """
+    Sirve los .pb de `carpeta` con ETag / Last-Modified y respuestas 304, como la API real.
+    Reemplazar un archivo (p.ej. con un feed de header.timestamp mayor) simula una actualización.
+    """
+    from email.utils import formatdate
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = os.path.join(carpeta, os.path.basename(self.path.split("?")[0]))
+            if not os.path.isfile(path):
+                self.send_error(404)
+                return
+            st = os.stat(path)
+            etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            with open(path, "rb") as fh:
+                data = fh.read()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-protobuf")
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", formatdate(st.st_mtime, usegmt=True))
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    return ThreadingHTTPServer(("127.0.0.1", port), Handler)
+
+def serve_fixtures(carpeta: str, port: int = 8765):
+    srv = _servidor_fixtures(carpeta, port)
+    print(f"Sirviendo {carpeta} en http://127.0.0.1:{port}/")
+    srv.serve_forever()
+
+def verificar_fixtures(carpeta: str = FIXTURES_RED) -> List[Tuple[str, Any, Any]]:
+    """
+    Ejercita RedRealtime contra una copia servida de los fixtures: feed nuevo, 304, mismo
+    header.timestamp ("igual") y feeds corruptos o cuyo indexado falla: el siguiente poll
+    debe volver a descargarlos en vez de recibir 304. Devuelve (paso, esperado, obtenido)
+    de los que fallan.
+    """
+    import shutil, tempfile
+    tmp = tempfile.mkdtemp(prefix="red_fx_")
+    for nombre in ("vehicle_positions.pb", "trip_updates.pb"):
+        shutil.copy(os.path.join(carpeta, nombre), tmp)
+    srv = _servidor_fixtures(tmp, 0)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{srv.server_address[1]}"
+    rt = RedRealtime(f"{base}/vehicle_positions.pb", f"{base}/trip_updates.pb")
+    veh = os.path.join(tmp, "vehicle_positions.pb")
+    fallos: List[Tuple[str, Any, Any]] = []
+
+    def paso(nombre, esperado, obtenido):
+        print(f"{'ok ' if esperado == obtenido else 'MAL'} {nombre}: {obtenido}")
+        if esperado != obtenido:
+            fallos.append((nombre, esperado, obtenido))
+
+    def tocar(data: Optional[bytes] = None):
+        # mismo o nuevo contenido con otro mtime: cambia el ETag del servidor
+        if data is not None:
+            with open(veh, "wb") as fh:
+                fh.write(data)
+        st = os.stat(veh)
+        os.utime(veh, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+    try:
+        nuevos = {"trip_updates": "nuevo", "vehicles": "nuevo"}
+        paso("primer poll", nuevos, rt.poll_once())
+        paso("sin cambios", {"trip_updates": "304", "vehicles": "304"}, rt.poll_once())
+        paso("indexado por ruta", ["V1", "V4"], [v["entity_id"] for v in rt.vehicles_on_route("R1")])
+        paso("ruta desde trip update", "R3", (rt.vehicle_for_trip("T6") or {}).get("route_id"))
+        paso("próximas llegadas", [FIXTURE_TS + 60 * 5, FIXTURE_TS + 60 * 6],
+             [a["time"] for a in rt.next_arrivals("PA3", now=FIXTURE_TS + 60 * 5, limit=2)])
+
+        with open(veh, "rb") as fh:
+            original = fh.read()
+        tocar()
+        paso("mismo header.timestamp", "igual", rt.pollers["vehicles"].poll())
+        tocar(b"\xff no es un feed")
+        paso("feed corrupto", "error", rt.pollers["vehicles"].poll())
+        paso("feed corrupto, sin cambios", "error", rt.pollers["vehicles"].poll())   # no 304
+
+        # feed más nuevo cuyo indexado falla una vez: el siguiente poll debe reintentarlo
+        feed = gtfs_realtime_pb2.FeedMessage()
+        feed.ParseFromString(original)
+        feed.header.timestamp = FIXTURE_TS + 30
+        feed.entity[0].vehicle.position.latitude = -33.5
+        tocar(feed.SerializeToString())
+        poller = rt.pollers["vehicles"]
+        indexar = poller.on_feed
+
+        def falla_una_vez(f):
+            poller.on_feed = indexar
+            raise RuntimeError("falla de indexado simulada")
+        poller.on_feed = falla_una_vez
+        paso("indexado fallido", "error", poller.poll())
+        paso("reintento sin cambios upstream", "nuevo", poller.poll())
+        paso("índice actualizado", -33.5, round(rt.vehicle_for_trip("T1")["lat"], 3))
+    finally:
+        srv.shutdown()
+        shutil.rmtree(tmp, ignore_errors=True)
+    return fallos
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "check":
+        sys.exit(1 if verificar_fixtures(sys.argv[2] if len(sys.argv) > 2 else FIXTURES_RED) else 0)
+    elif len(sys.argv) >= 3 and sys.argv[1] == "fixtures":
+        escribir_fixtures(sys.argv[2])
+    elif len(sys.argv) >= 3 and sys.argv[1] == "serve":
+        serve_fixtures(sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else 8765)
+    elif len(sys.argv) == 4 and sys.argv[1] == "poll":
+        rt = RedRealtime(sys.argv[2], sys.argv[3])
+        for _ in range(3):
+            print(rt.poll_once())
+        print(rt.stats())
+    else:
+        print("Uso: python red_client.py serve <carpeta> [puerto] | poll <url_vehiculos> <url_trip_updates>"
+              " | check [carpeta] | fixtures <carpeta>")
+        sys.exit(2)
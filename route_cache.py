@@ -0,0 +1,103 @@
+# route_cache.py
+# Caché persistente (SQLite) de rutas ORS/OSRM con TTL y desalojo LRU.
+import sqlite3, threading, time
+from array import array
+from typing import List, Optional, Sequence, Tuple, Dict, Any
+
+
+class RouteCache:
+    """
+    Rutas indexadas por proveedor + origen/destino cuantizados (decimals=4 ≈ 11 m).
+    Las coordenadas se guardan como un BLOB de doubles (lat, lon, lat, lon, ...).
+    Un hit no escribe en disco: last_access se acumula en memoria y se vuelca en lote
+    en put() (antes de desalojar), cada flush_sec segundos o con flush().
+    """
+
+    def __init__(self, path: str, ttl_sec: float = 7*24*3600, max_entries: int = 5000, decimals: int = 4,
+                 flush_sec: float = 30.0):
+        self.path = path
+        self.ttl_sec = ttl_sec
+        self.max_entries = max_entries
+        self.decimals = decimals
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.flush_sec = flush_sec
+        self._accesos: Dict[str, float] = {}       # key -> last_access pendiente de escribir
+        self._ultimo_volcado = time.time()
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(path, check_same_thread=False)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.execute("PRAGMA synchronous=NORMAL")
+        self._con.execute("""CREATE TABLE IF NOT EXISTS rutas(
+            key TEXT PRIMARY KEY, provider TEXT, created REAL, last_access REAL, coords BLOB
+        )""")
+        self._con.execute("CREATE INDEX IF NOT EXISTS rutas_last_access ON rutas(last_access)")
+        self._con.commit()
+
+    def _key(self, provider: str, src_lat: float, src_lon: float, dst_lat: float, dst_lon: float) -> str:
+        q = lambda v: f"{round(v, self.decimals):.{self.decimals}f}"
+        return f"{provider}:{q(src_lat)},{q(src_lon)};{q(dst_lat)},{q(dst_lon)}"
+
+    def _volcar_accesos(self):
+        """Escribe los last_access acumulados (llamar con el lock tomado)."""
+        if self._accesos:
+            self._con.executemany("UPDATE rutas SET last_access=? WHERE key=?",
+                                  [(t, k) for k, t in self._accesos.items()])
+            self._con.commit()
+            self._accesos.clear()
+        self._ultimo_volcado = time.time()
+
+    def flush(self):
+        with self._lock:
+            self._volcar_accesos()
+
+    def get(self, providers: Sequence[str], src_lat: float, src_lon: float,
+            dst_lat: float, dst_lon: float) -> Optional[Tuple[str, List[Tuple[float,float]]]]:
+        """Primer (proveedor, ruta) vigente según el orden de preferencia, o None."""
+        now = time.time()
+        with self._lock:
+            for prov in providers:
+                key = self._key(prov, src_lat, src_lon, dst_lat, dst_lon)
+                row = self._con.execute("SELECT created, coords FROM rutas WHERE key=?", (key,)).fetchone()
+                if row is None:
+                    continue
+                if now - row[0] > self.ttl_sec:
+                    self._accesos.pop(key, None)
+                    self._con.execute("DELETE FROM rutas WHERE key=?", (key,))
+                    self._con.commit()
+                    continue
+                self._accesos[key] = now
+                if now - self._ultimo_volcado >= self.flush_sec:
+                    self._volcar_accesos()
+                flat = array("d"); flat.frombytes(row[1])
+                self.hits += 1
+                return prov, list(zip(flat[0::2], flat[1::2]))
+            self.misses += 1
+            return None
+
+    def put(self, provider: str, src_lat: float, src_lon: float, dst_lat: float, dst_lon: float,
+            route: List[Tuple[float,float]]):
+        key = self._key(provider, src_lat, src_lon, dst_lat, dst_lon)
+        flat = array("d", [c for p in route for c in p])
+        now = time.time()
+        with self._lock:
+            self._accesos.pop(key, None)
+            self._volcar_accesos()               # el LRU de abajo necesita los accesos al día
+            self._con.execute("INSERT OR REPLACE INTO rutas(key, provider, created, last_access, coords) VALUES (?,?,?,?,?)",
+                              (key, provider, now, now, flat.tobytes()))
+            n = self._con.execute("SELECT COUNT(*) FROM rutas").fetchone()[0]
+            if n > self.max_entries:
+                cur = self._con.execute(
+                    "DELETE FROM rutas WHERE key IN (SELECT key FROM rutas ORDER BY last_access ASC LIMIT ?)",
+                    (n - self.max_entries,))
+                self.evictions += cur.rowcount
+            self._con.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            n = self._con.execute("SELECT COUNT(*) FROM rutas").fetchone()[0]
+        total = self.hits + self.misses
+        return {"entries": n, "max_entries": self.max_entries, "ttl_sec": self.ttl_sec,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "hit_rate": (self.hits / total) if total else None}
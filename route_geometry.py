@@ -0,0 +1,192 @@
+# route_geometry.py
+# Operaciones vectorizadas (NumPy) sobre polilíneas de ruta.
+import math
+from typing import Dict, List, Tuple, Sequence
+
+import numpy as np
+
+# Máximo de pares (punto, tramo) evaluados de una vez, para acotar memoria
+_MAX_PARES = 2_000_000
+
+# Elipsoide WGS84, para la escala local (m/grado) en una latitud dada
+_WGS84_A = 6_378_137.0
+_WGS84_E2 = 6.694379990141e-3
+
+
+def meters_per_deg(lat: float) -> Tuple[float, float]:
+    """(m por grado de latitud, m por grado de longitud) en `lat`, con los radios de curvatura WGS84."""
+    phi = math.radians(lat)
+    w = 1.0 - _WGS84_E2 * math.sin(phi) ** 2
+    rad = math.pi / 180.0
+    return _WGS84_A * (1.0 - _WGS84_E2) / (w * math.sqrt(w)) * rad, _WGS84_A / math.sqrt(w) * math.cos(phi) * rad
+
+
+def _meters_per_deg_np(lat: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """meters_per_deg para un arreglo de latitudes."""
+    phi = np.radians(lat)
+    w = 1.0 - _WGS84_E2 * np.sin(phi) ** 2
+    rad = math.pi / 180.0
+    return _WGS84_A * (1.0 - _WGS84_E2) / (w * np.sqrt(w)) * rad, _WGS84_A / np.sqrt(w) * np.cos(phi) * rad
+
+
+def dist_km(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    """Distancia (km) entre dos puntos cercanos, equirectangular en la latitud media (reemplaza geodesic)."""
+    mlat, mlon = meters_per_deg((a[0] + b[0]) / 2.0)
+    return math.hypot((b[0] - a[0]) * mlat, (b[1] - a[1]) * mlon) / 1000.0
+
+
+class LocalRoute:
+    """
+    Ruta convertida una sola vez a coordenadas métricas locales: proyección
+    equirectangular en torno al centroide para las distancias punto a punto, y el
+    largo de cada tramo (y la distancia acumulada) en la escala de su latitud media,
+    la misma de project_points. Para rutas urbanas (decenas de km) el error frente a
+    geodesic queda bajo 0.1 %; las consultas del simulador son aritmética simple por tick.
+    """
+
+    __slots__ = ("lat", "lon", "mlat", "mlon", "seg_km", "cum_km", "total_km")
+
+    def __init__(self, route: Sequence[Tuple[float,float]]):
+        r = np.asarray(route, dtype=np.float64).reshape(-1, 2)
+        self.lat: List[float] = r[:,0].tolist()
+        self.lon: List[float] = r[:,1].tolist()
+        self.mlat, self.mlon = meters_per_deg(float(r[:,0].mean()) if len(r) else 0.0)
+        mlat, mlon = _meters_per_deg_np((r[:-1,0] + r[1:,0]) / 2.0)
+        seg = np.hypot(np.diff(r[:,0]) * mlat, np.diff(r[:,1]) * mlon) / 1000.0
+        self.seg_km: List[float] = seg.tolist()
+        self.cum_km: List[float] = np.concatenate(([0.0], np.cumsum(seg))).tolist()
+        self.total_km = self.cum_km[-1]
+
+    def __len__(self) -> int:
+        return len(self.lat)
+
+    def dist_km(self, a: Tuple[float, float], b: Tuple[float, float]) -> float:
+        """Distancia (km) entre dos puntos en la escala de la ruta."""
+        return math.hypot((b[0] - a[0]) * self.mlat, (b[1] - a[1]) * self.mlon) / 1000.0
+
+    def dist_to_vertex_km(self, lat: float, lon: float, i: int) -> float:
+        """Distancia (km) desde (lat, lon) al vértice i de la ruta."""
+        return math.hypot((self.lat[i] - lat) * self.mlat, (self.lon[i] - lon) * self.mlon) / 1000.0
+
+    def remaining_km(self, lat: float, lon: float, idx: int) -> float:
+        """Km por recorrer desde (lat, lon), ubicado en el tramo idx, hasta el final."""
+        if idx >= len(self.lat) - 1:
+            return 0.0
+        return self.dist_to_vertex_km(lat, lon, idx + 1) + (self.total_km - self.cum_km[idx + 1])
+
+
+class _Tramos:
+    """Tramos de la ruta precalculados en la escala local WGS84 de cada uno (latitud media)."""
+
+    def __init__(self, route: Sequence[Tuple[float,float]], cum_km: Sequence[float]):
+        r = np.asarray(route, dtype=np.float64)
+        cum = np.asarray(cum_km, dtype=np.float64)
+        a, b = r[:-1], r[1:]
+        self.mlat, self.mlon = _meters_per_deg_np((a[:,0] + b[:,0]) / 2.0)
+        self.ax, self.ay = a[:,1]*self.mlon, a[:,0]*self.mlat
+        self.vx, self.vy = b[:,1]*self.mlon - self.ax, b[:,0]*self.mlat - self.ay
+        l2 = self.vx*self.vx + self.vy*self.vy
+        self.inv_len2 = np.divide(1.0, l2, out=np.zeros_like(l2), where=l2 > 0)
+        self.cum = cum[:-1]
+        self.seg_km = np.diff(cum)
+
+    def __len__(self) -> int:
+        return len(self.seg_km)
+
+    def evaluar(self, lat: np.ndarray, lon: np.ndarray, s) -> Tuple[np.ndarray, np.ndarray]:
+        """Distancia (m) y km recorridos al pie para puntos (lat, lon) contra tramos s (broadcast)."""
+        wx, wy = lon*self.mlon[s] - self.ax[s], lat*self.mlat[s] - self.ay[s]
+        vx, vy = self.vx[s], self.vy[s]
+        t = np.clip((wx*vx + wy*vy) * self.inv_len2[s], 0.0, 1.0)
+        return np.hypot(wx - t*vx, wy - t*vy), self.cum[s] + self.seg_km[s]*t
+
+
+def project_points(route: Sequence[Tuple[float,float]], cum_km: Sequence[float],
+                   pts: Sequence[Tuple[float,float]]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Proyecta todos los puntos sobre todos los tramos de la ruta de una vez.
+    Devuelve (dist_min_m, distancia_recorrida_km_al_pie) por punto, con la escala
+    WGS84 de meters_per_deg (la de LocalRoute) en la latitud media de cada tramo.
+    cum_km es la distancia acumulada por vértice (LocalRoute(route).cum_km).
+    """
+    n_pts = len(pts)
+    if n_pts == 0 or len(route) < 2:
+        return np.full(n_pts, np.inf), np.zeros(n_pts)
+
+    tramos = _Tramos(route, cum_km)
+    todos = slice(None)
+    p = np.asarray(pts, dtype=np.float64)
+    dist_out = np.empty(n_pts)
+    along_out = np.empty(n_pts)
+    paso = max(1, _MAX_PARES // len(tramos))
+    for i0 in range(0, n_pts, paso):
+        blk = p[i0:i0+paso]
+        d, along = tramos.evaluar(blk[:,0:1], blk[:,1:2], todos)   # (P,S)
+        best = np.argmin(d, axis=1)     # primer mínimo, igual que el bucle original
+        fila = np.arange(len(blk))
+        dist_out[i0:i0+paso] = d[fila, best]
+        along_out[i0:i0+paso] = along[fila, best]
+    return dist_out, along_out
+
+
+class SegmentGrid:
+    """
+    Grilla uniforme sobre los tramos de la ruta, en proyección equirectangular
+    centrada en la ruta. Cada tramo se registra en todas las celdas que toca su
+    caja envolvente ampliada en radius_m, así un punto solo se compara con los
+    tramos que pueden quedar a menos de radius_m de él.
+    """
+
+    def __init__(self, route: Sequence[Tuple[float,float]], cum_km: Sequence[float], radius_m: float):
+        self.tramos = _Tramos(route, cum_km)
+        r = np.asarray(route, dtype=np.float64)
+        self.lat0 = float(r[:,0].mean())
+        self.mlat0, self.mlon0 = meters_per_deg(self.lat0)
+        # Holgura por usar una sola escala para toda la ruta (la latitud varía poco en una ciudad)
+        self.radius_m = radius_m
+        self.cell_m = max(1.0, radius_m * 1.05 + 1.0)
+        x = r[:,1]*self.mlon0; y = r[:,0]*self.mlat0
+        x0 = np.minimum(x[:-1], x[1:]) - self.cell_m; x1 = np.maximum(x[:-1], x[1:]) + self.cell_m
+        y0 = np.minimum(y[:-1], y[1:]) - self.cell_m; y1 = np.maximum(y[:-1], y[1:]) + self.cell_m
+        cx0 = np.floor(x0 / self.cell_m).astype(np.int64); cx1 = np.floor(x1 / self.cell_m).astype(np.int64)
+        cy0 = np.floor(y0 / self.cell_m).astype(np.int64); cy1 = np.floor(y1 / self.cell_m).astype(np.int64)
+        celdas: Dict[Tuple[int,int], List[int]] = {}
+        for s in range(len(self.tramos)):
+            for cx in range(cx0[s], cx1[s] + 1):
+                for cy in range(cy0[s], cy1[s] + 1):
+                    celdas.setdefault((cx, cy), []).append(s)
+        self.celdas = {k: np.asarray(v, dtype=np.int64) for k, v in celdas.items()}
+
+    def project_near(self, pts: Sequence[Tuple[float,float]]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Igual que project_points pero solo contra los tramos cercanos de cada punto.
+        Los puntos sin tramos a menos de radius_m quedan con distancia inf.
+        """
+        n_pts = len(pts)
+        dist_out = np.full(n_pts, np.inf)
+        along_out = np.zeros(n_pts)
+        if n_pts == 0 or len(self.tramos) == 0:
+            return dist_out, along_out
+
+        p = np.asarray(pts, dtype=np.float64)
+        cx = np.floor(p[:,1]*self.mlon0 / self.cell_m).astype(np.int64)
+        cy = np.floor(p[:,0]*self.mlat0 / self.cell_m).astype(np.int64)
+        pi_l, si_l = [], []
+        for i, key in enumerate(zip(cx.tolist(), cy.tolist())):
+            segs = self.celdas.get(key)
+            if segs is not None:
+                pi_l.append(np.full(len(segs), i, dtype=np.int64)); si_l.append(segs)
+        if not pi_l:
+            return dist_out, along_out
+
+        pi = np.concatenate(pi_l); si = np.concatenate(si_l)
+        d, along = self.tramos.evaluar(p[pi,0], p[pi,1], si)
+        # mínimo por punto; a igual distancia gana el primer tramo (como el bucle original)
+        orden = np.lexsort((si, d, pi))
+        pi = pi[orden]
+        primero = np.ones(len(pi), dtype=bool)
+        primero[1:] = pi[1:] != pi[:-1]
+        sel = orden[primero]
+        dist_out[pi[primero]] = d[sel]
+        along_out[pi[primero]] = along[sel]
+        return dist_out, along_out
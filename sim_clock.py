@@ -0,0 +1,79 @@
+# sim_clock.py
+# Reloj inyectable de la simulación: tiempo real, acelerado o avanzado a mano (pasos).
+import threading, time
+from typing import Any, Callable, Dict, Optional
+
+MODOS = ("real", "escalado", "pasos")
+
+
+class SimClock:
+    """
+    now() devuelve el instante virtual de la simulación:
+      "real"     -> avanza al ritmo del reloj de pared
+      "escalado" -> avanza `factor` veces más rápido (p.ej. 100x)
+      "pasos"    -> solo avanza con avanzar(dt); para repeticiones deterministas y
+                    para correr tan rápido como se pueda
+    Al cambiar de modo el tiempo virtual sigue desde donde estaba (nunca salta hacia atrás).
+    `inicio` fija el instante virtual inicial (por defecto la hora actual).
+    """
+
+    def __init__(self, modo: str = "real", factor: float = 1.0, inicio: Optional[float] = None,
+                 reloj: Callable[[], float] = time.time):
+        self._reloj = reloj
+        self._lock = threading.Lock()
+        self._real0 = reloj()
+        self._virt0 = self._real0 if inicio is None else float(inicio)
+        self.modo, self.factor = "pasos", 1.0
+        self.set_modo(modo, factor)          # en "pasos" el tiempo no corre: inicio queda exacto
+
+    def _tasa(self) -> float:
+        return {"real": 1.0, "escalado": self.factor, "pasos": 0.0}[self.modo]
+
+    def _ahora(self) -> float:
+        return self._virt0 + (self._reloj() - self._real0) * self._tasa()
+
+    def now(self) -> float:
+        with self._lock:
+            return self._ahora()
+
+    def set_modo(self, modo: str, factor: Optional[float] = None):
+        if modo not in MODOS:
+            raise ValueError(f"modo desconocido: {modo} (opciones: {', '.join(MODOS)})")
+        if factor is not None and factor <= 0:
+            raise ValueError("factor debe ser > 0")
+        with self._lock:
+            self._virt0, self._real0 = self._ahora(), self._reloj()
+            self.modo = modo
+            if factor is not None:
+                self.factor = float(factor)
+
+    def avanzar(self, dt: float) -> float:
+        """Adelanta el reloj dt segundos virtuales (solo en modo "pasos") y devuelve el nuevo instante."""
+        with self._lock:
+            if self.modo != "pasos":
+                raise RuntimeError("avanzar() requiere modo 'pasos'")
+            self._virt0 += dt
+            return self._virt0
+
+    def estado(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"mode": self.modo, "speed": self._tasa(), "factor": self.factor, "now": self._ahora()}
+
+
+def repetir(flota, reloj: SimClock, segundos: float, dt: float = 1.0, circular: bool = False,
+            cada_tick: Optional[Callable[[float], None]] = None) -> int:
+    """
+    Avanza `flota` (FleetStore) `segundos` virtuales en ticks de dt, tan rápido como se pueda,
+    con el reloj en modo "pasos". circular=True devuelve al inicio de su ruta a los buses que
+    llegan (servicio en vueltas, para simular un día completo). Devuelve la cantidad de ticks.
+    Con la misma flota inicial, dt y segundos el resultado es siempre el mismo.
+    """
+    n = max(0, int(round(segundos / dt)))
+    for _ in range(n):
+        now = reloj.avanzar(dt)
+        flota.advance_all(dt, now)
+        if circular:
+            flota.reiniciar_llegados()
+        if cada_tick is not None:
+            cada_tick(now)
+    return n
@@ -0,0 +1,185 @@
+# stop_store.py
+# Almacén local de paraderos OSM por teselas fijas, persistido en SQLite.
+#   python stop_store.py prefetch valparaiso.osm      (extracto OSM local, XML)
+import math, sqlite3, sys, threading, time
+import xml.etree.ElementTree as ET
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+Tile = Tuple[int, int]
+Element = Dict[str, Any]
+
+
+def _es_paradero(tags: Dict[str, str]) -> bool:
+    if tags.get("highway") == "bus_stop":
+        return True
+    return tags.get("public_transport") == "platform" and "bus" in tags
+
+
+class StopStore:
+    """
+    Paraderos cacheados por teselas de tile_deg x tile_deg grados. Las consultas
+    por bbox se responden desde memoria; solo las teselas faltantes (o vencidas)
+    se piden a fetch_fn(s, w, n, e), en una única llamada que cubre a todas.
+    La descarga corre fuera del lock: consultas de teselas ya cargadas o de otras zonas
+    no esperan, y quien pide una tesela que ya se está descargando espera esa misma
+    descarga (single-flight por tesela) en vez de repetirla.
+    Los elementos devueltos tienen el mismo formato que Overpass (id, lat, lon, tags).
+    """
+
+    def __init__(self, path: str, fetch_fn: Callable[[float,float,float,float], List[Element]],
+                 tile_deg: float = 0.05, ttl_sec: float = 30*24*3600):
+        self.path = path
+        self.fetch_fn = fetch_fn
+        self.tile_deg = tile_deg
+        self.ttl_sec = ttl_sec
+        self.upstream_calls = 0
+        self._lock = threading.Lock()
+        self._tiles: Dict[Tile, float] = {}             # tesela -> instante de descarga
+        self._stops: Dict[Tile, List[Element]] = {}
+        self._vuelos: Dict[Tile, Future] = {}          # tesela -> descarga en curso
+        self.coalesced = 0
+        self._con = sqlite3.connect(path, check_same_thread=False)
+        self._con.execute("CREATE TABLE IF NOT EXISTS teselas(tx INTEGER, ty INTEGER, fetched REAL, PRIMARY KEY(tx, ty))")
+        self._con.execute("""CREATE TABLE IF NOT EXISTS paraderos(
+            id INTEGER, tx INTEGER, ty INTEGER, lat REAL, lon REAL, name TEXT, PRIMARY KEY(tx, ty, id)
+        )""")
+        self._con.commit()
+        self._load()
+
+    def _load(self):
+        for tx, ty, fetched in self._con.execute("SELECT tx, ty, fetched FROM teselas"):
+            self._tiles[(tx, ty)] = fetched
+            self._stops[(tx, ty)] = []
+        for sid, tx, ty, lat, lon, name in self._con.execute("SELECT id, tx, ty, lat, lon, name FROM paraderos"):
+            self._stops.setdefault((tx, ty), []).append(self._element(sid, lat, lon, name))
+
+    @staticmethod
+    def _element(sid: int, lat: float, lon: float, name: str) -> Element:
+        return {"type": "node", "id": sid, "lat": lat, "lon": lon, "tags": {"name": name} if name else {}}
+
+    def _tile_of(self, lat: float, lon: float) -> Tile:
+        return (math.floor(lon / self.tile_deg), math.floor(lat / self.tile_deg))
+
+    def _tiles_for_bbox(self, s: float, w: float, n: float, e: float) -> List[Tile]:
+        x0, y0 = self._tile_of(s, w)
+        x1, y1 = self._tile_of(n, e)
+        return [(tx, ty) for tx in range(x0, x1 + 1) for ty in range(y0, y1 + 1)]
+
+    def _store_tiles(self, tiles: Iterable[Tile], elems: List[Element]):
+        """Reemplaza el contenido de las teselas dadas con los elementos que caen en ellas."""
+        now = time.time()
+        tiles = set(tiles)
+        nuevos: Dict[Tile, List[Element]] = {t: [] for t in tiles}
+        vistos = set()
+        for el in elems:
+            sid = el.get("id")
+            if "lat" not in el or "lon" not in el or (sid is not None and sid in vistos):
+                continue
+            t = self._tile_of(float(el["lat"]), float(el["lon"]))
+            if t in nuevos:
+                vistos.add(sid)
+                name = (el.get("tags") or {}).get("name", "")
+                nuevos[t].append(self._element(int(el.get("id", 0)), float(el["lat"]), float(el["lon"]), name))
+        for t, stops in nuevos.items():
+            self._con.execute("DELETE FROM paraderos WHERE tx=? AND ty=?", t)
+            self._con.executemany("INSERT OR REPLACE INTO paraderos(id, tx, ty, lat, lon, name) VALUES (?,?,?,?,?,?)",
+                                  [(el["id"], t[0], t[1], el["lat"], el["lon"], el["tags"].get("name", "")) for el in stops])
+            self._con.execute("INSERT OR REPLACE INTO teselas(tx, ty, fetched) VALUES (?,?,?)", (t[0], t[1], now))
+            self._tiles[t] = now
+            self._stops[t] = stops
+        self._con.commit()
+
+    def _descargar(self, tiles: List[Tile], vuelo: Future):
+        d = self.tile_deg
+        fs = min(t[1] for t in tiles) * d; fn = (max(t[1] for t in tiles) + 1) * d
+        fw = min(t[0] for t in tiles) * d; fe = (max(t[0] for t in tiles) + 1) * d
+        try:
+            elems = self.fetch_fn(fs, fw, fn, fe)
+            with self._lock:
+                self._store_tiles(tiles, elems)
+            vuelo.set_result(None)
+        except BaseException as ex:
+            vuelo.set_exception(ex)
+        finally:
+            with self._lock:
+                for t in tiles:
+                    if self._vuelos.get(t) is vuelo:
+                        del self._vuelos[t]
+
+    def query(self, s: float, w: float, n: float, e: float) -> List[Element]:
+        """Paraderos dentro del bbox (S, W, N, E); descarga solo las teselas que faltan."""
+        tiles = self._tiles_for_bbox(s, w, n, e)
+        with self._lock:
+            now = time.time()
+            faltan = [t for t in tiles if now - self._tiles.get(t, -math.inf) > self.ttl_sec]
+            ajenos = {self._vuelos[t] for t in faltan if t in self._vuelos}
+            propios = [t for t in faltan if t not in self._vuelos]
+            vuelo = None
+            if propios:
+                vuelo = Future()
+                for t in propios:
+                    self._vuelos[t] = vuelo
+                self.upstream_calls += 1
+            if ajenos:
+                self.coalesced += 1
+        if vuelo is not None:
+            self._descargar(propios, vuelo)
+            vuelo.result()
+        for v in ajenos:
+            v.result()
+        with self._lock:
+            out = []
+            for t in tiles:
+                for el in self._stops.get(t, ()):
+                    if s <= el["lat"] <= n and w <= el["lon"] <= e:
+                        out.append(el)
+            return out
+
+    def prefetch_osm_file(self, path: str) -> int:
+        """
+        Carga masiva desde un extracto OSM (.osm XML). Se marcan como descargadas
+        solo las teselas completamente dentro de <bounds> (o de la extensión de los nodos).
+        """
+        elems: List[Element] = []
+        bounds = None
+        lat_min = lon_min = math.inf; lat_max = lon_max = -math.inf
+        for _, node in ET.iterparse(path, events=("end",)):
+            if node.tag == "bounds":
+                bounds = tuple(float(node.get(k)) for k in ("minlat", "minlon", "maxlat", "maxlon"))
+            elif node.tag == "node":
+                lat = float(node.get("lat")); lon = float(node.get("lon"))
+                lat_min = min(lat_min, lat); lat_max = max(lat_max, lat)
+                lon_min = min(lon_min, lon); lon_max = max(lon_max, lon)
+                tags = {t.get("k"): t.get("v") for t in node.findall("tag")}
+                if _es_paradero(tags):
+                    elems.append({"id": int(node.get("id")), "lat": lat, "lon": lon, "tags": tags})
+            if node.tag in ("node", "way", "relation"):
+                node.clear()
+        if bounds is None:
+            if not math.isfinite(lat_min):
+                return 0
+            bounds = (lat_min, lon_min, lat_max, lon_max)
+        s, w, n, e = bounds
+        d = self.tile_deg
+        completas = [(tx, ty) for tx, ty in self._tiles_for_bbox(s, w, n, e)
+                     if tx*d >= w and (tx+1)*d <= e and ty*d >= s and (ty+1)*d <= n]
+        with self._lock:
+            self._store_tiles(completas, elems)
+        return sum(len(self._stops[t]) for t in completas)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"tiles": len(self._tiles), "stops": sum(len(v) for v in self._stops.values()),
+                    "tile_deg": self.tile_deg, "upstream_calls": self.upstream_calls,
+                    "in_flight": len(set(self._vuelos.values())), "coalesced": self.coalesced}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "prefetch":
+        import tracker_server
+        n = tracker_server.STOP_STORE.prefetch_osm_file(sys.argv[2])
+        print(f"✅ {n} paraderos cargados en {tracker_server.STOP_STORE_DB}")
+    else:
+        print("Uso: python stop_store.py prefetch <extracto.osm>")
+        sys.exit(2)
@@ -0,0 +1,129 @@
+# test_route_geometry.py
+# Exactitud de la geometría local (route_geometry) y de FleetStore frente a geodesic.
+# Solo importa route_geometry/fleet: no abre ocupacion.sqlite ni toca el servidor.
+#   python -m pytest -q test_route_geometry.py
+import math
+import random
+
+import numpy as np
+from geopy.distance import geodesic
+
+from fleet import FleetStore
+from route_geometry import LocalRoute, SegmentGrid, dist_km, meters_per_deg, project_points
+
+TOL = 1e-3          # error relativo máx frente a geodesic (lo que promete LocalRoute: ~0.1 %)
+LATITUDES = (-33.0, -53.0, 0.5, 60.0)   # Viña, Punta Arenas, ecuador y latitud alta
+
+
+def _ruta(lat0: float, lon0: float, n: int = 400, largo_km: float = 20.0, seed: int = 1):
+    """Polilínea urbana sintética: rumbo que cambia de a poco, tramos de ~largo_km/n."""
+    rnd = random.Random(seed)
+    mlat, mlon = meters_per_deg(lat0)
+    paso = largo_km * 1000.0 / (n - 1)
+    rumbo, lat, lon = 0.3, lat0, lon0
+    pts = [(lat, lon)]
+    for _ in range(n - 1):
+        rumbo += rnd.uniform(-0.4, 0.4)
+        lat += paso * math.cos(rumbo) / mlat
+        lon += paso * math.sin(rumbo) / mlon
+        pts.append((lat, lon))
+    return pts
+
+
+def _cum_geodesic(route):
+    cum = [0.0]
+    for a, b in zip(route, route[1:]):
+        cum.append(cum[-1] + geodesic(a, b).km)
+    return cum
+
+
+def _rel(x: float, ref: float) -> float:
+    return abs(x - ref) / ref
+
+
+def _ruta_norte_sur(lat0: float, largo_km: float, n: int = 400):
+    """Ruta recta hacia el sur: el peor caso para una sola escala en el centroide."""
+    mlat, _ = meters_per_deg(lat0)
+    return [(lat0 - largo_km * 1000.0 * i / (n - 1) / mlat, -71.5 + 0.001 * (i % 2)) for i in range(n)]
+
+
+def test_tramos_y_largo_total():
+    for lat0 in LATITUDES:
+        for route, largo in ((_ruta(lat0, -71.5, largo_km=5.0), 5.0), (_ruta(lat0, -71.5, largo_km=40.0), 40.0),
+                             (_ruta_norte_sur(lat0, 40.0), "40 N-S")):
+            geo = LocalRoute(route)
+            ref = _cum_geodesic(route)
+            assert _rel(geo.total_km, ref[-1]) < TOL, (lat0, largo)
+            seg = np.asarray(geo.seg_km)
+            g = np.diff(ref)
+            assert (np.abs(seg - g) / g).max() < TOL, (lat0, largo)
+            assert abs(geo.cum_km[-1] - geo.total_km) < 1e-9
+
+
+def test_dist_km_puntos_cercanos():
+    rnd = random.Random(5)
+    for lat0 in LATITUDES:
+        for _ in range(300):
+            a = (lat0 + rnd.uniform(-0.05, 0.05), -71.5 + rnd.uniform(-0.05, 0.05))
+            b = (a[0] + rnd.uniform(-0.01, 0.01), a[1] + rnd.uniform(-0.01, 0.01))
+            g = geodesic(a, b).km
+            if g > 0.01:
+                assert _rel(dist_km(a, b), g) < TOL, (a, b)
+
+
+def test_project_points_distancia_y_avance():
+    for lat0 in LATITUDES:
+        route = _ruta(lat0, -71.5, n=200, largo_km=10.0)
+        geo = LocalRoute(route)
+        # puntos a 40 m del punto medio de cada tramo, en perpendicular al tramo
+        pts, pies, esperado_km = [], [], []
+        for i in range(0, len(route) - 1, 9):
+            (alat, alon), (blat, blon) = route[i], route[i + 1]
+            pie = ((alat + blat) / 2, (alon + blon) / 2)
+            mlat, mlon = meters_per_deg(pie[0])
+            vx, vy = (blon - alon) * mlon, (blat - alat) * mlat
+            n = math.hypot(vx, vy)
+            pts.append((pie[0] + 40.0 * vx / n / mlat, pie[1] - 40.0 * vy / n / mlon))
+            pies.append(pie)
+            esperado_km.append(geo.cum_km[i] + geo.seg_km[i] / 2)
+        d, along = project_points(route, geo.cum_km, pts)
+        for dm, p, pie in zip(d, pts, pies):
+            assert _rel(dm, geodesic(p, pie).m) < TOL, lat0
+        assert np.abs(along - np.asarray(esperado_km)).max() < 1e-6
+
+        d2, along2 = SegmentGrid(route, geo.cum_km, 60.0).project_near(pts)
+        assert np.abs(d2 - d).max() < 1e-9 and np.abs(along2 - along).max() < 1e-12
+
+
+def test_fleet_avance_sobre_la_ruta():
+    route = _ruta(-33.0, -71.5, n=300, largo_km=15.0)
+    ref = _cum_geodesic(route)
+    flota = FleetStore()
+    flota.add("b1", route[0][0], route[0][1], 36.0, route)       # 36 km/h = 10 m/s
+    assert _rel(flota.columnas(0.0)["distance_km"][0], ref[-1]) < TOL
+
+    for t in range(1, 121):                                         # 20 min en ticks de 10 s
+        flota.advance_all(10.0, float(t * 10))
+    col = flota.columnas(1200.0)
+    recorrido_km = 12.0
+    assert abs(col["distance_km"][0] - (flota._rutas()[3][0] - recorrido_km)) < 1e-9
+
+    # la posición reportada está sobre la ruta, a recorrido_km (geodesic) del inicio
+    pos = (col["lat"][0], col["lon"][0])
+    i = int(np.searchsorted(ref, recorrido_km)) - 1
+    desde_inicio = ref[i] + geodesic(route[i], pos).km
+    assert _rel(desde_inicio, recorrido_km) < TOL
+
+
+def test_fleet_se_detiene_en_la_parada():
+    route = _ruta(-33.0, -71.5, n=100, largo_km=5.0)
+    parada = route[60]
+    flota = FleetStore(stop_radius_km=0.02)
+    flota.add("b1", route[0][0], route[0][1], 30.0, route, stops=[parada], dwell_sec=30.0)
+    t = 0.0
+    while not flota.columnas(t)["is_dwell"][0]:
+        t += 1.0
+        flota.advance_all(1.0, t)
+        assert t < 3600
+    col = flota.columnas(t)
+    assert geodesic(parada, (col["lat"][0], col["lon"][0])).m < 1.0
@@ -1,9 +1,17 @@
 # tracker_server.py
-import os, time, math, sqlite3, requests
+import os, time, json, uuid, atexit, sqlite3, threading, requests
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
 from typing import Dict, Any, List, Tuple, Optional
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, render_template
 from flask_cors import CORS
-from geopy.distance import geodesic
+from route_geometry import SegmentGrid, LocalRoute
+from fleet import FleetStore
+from sim_clock import SimClock, repetir
+from arrivals_cache import ArrivalsCache
+from route_cache import RouteCache
+from stop_store import StopStore
+from occupancy_store import OccupancyWriter, init_schema, query_history, max_span, BUCKET_NAMES
 
 # (opcional) gtfs-realtime
 _HAS_GTFS = True
@@ -18,49 +26,89 @@ CORS(app)
 # ==================== Config / Estado ====================
 DESTINO = (-33.01295911698026, -71.54156995287777)              # Paradero destino (editable desde la UI)
 OCUPACION: Dict[str, Dict[str, Any]] = {}   # Ocupación por bus
-BUSES: Dict[str, Dict[str, Any]] = {}       # Estado de buses simulados
+OCC_LOCK = threading.Lock()                  # protege OCUPACION
+OCC_BATCH_MAX = int(os.getenv("OCC_BATCH_MAX", 10000))   # lecturas máx por request
+OCC_VALUE_MAX = 10000                        # tope de count/capacity aceptados
 
 # Ruta: ORS si hay API key; si no, OSRM público
 ORS_API_KEY = os.getenv("ORS_API_KEY", "").strip()
+OSRM_URL = os.getenv("OSRM_URL", "https://router.project-osrm.org").rstrip("/")
+ORS_URL = os.getenv("ORS_URL", "https://api.openrouteservice.org").rstrip("/")
+
+# Caché de rutas en disco (junto a ocupacion.sqlite); offline = solo responde desde caché
+ROUTE_CACHE_DB = os.getenv("ROUTE_CACHE_DB", "rutas_cache.sqlite")
+ROUTE_CACHE_TTL_SEC = float(os.getenv("ROUTE_CACHE_TTL_SEC", 7*24*3600))
+ROUTE_CACHE_MAX = int(os.getenv("ROUTE_CACHE_MAX", 5000))
+ROUTE_CACHE_OFFLINE = os.getenv("ROUTE_CACHE_OFFLINE", "") not in ("", "0")
 
 # Paradas reales (OSM)
 STOP_MATCH_DIST_M = 60.0          # distancia máx (m) de un paradero a la ruta
 AUTOSTOPS_DWELL_SEC = 5           # dwell (s) por parada
 STOP_RADIUS_KM = 0.02             # 20 m para considerar "llegada" a la parada
+OVERPASS_URL = os.getenv("OVERPASS_URL", "https://overpass-api.de/api/interpreter")
+STOP_STORE_DB = os.getenv("STOP_STORE_DB", "paraderos_cache.sqlite")
+STOP_TILE_DEG = float(os.getenv("STOP_TILE_DEG", 0.05))   # teselas de ~5 km
+RED_VEH_POS_URL = os.getenv("RED_VEH_POS_URL", "")
+RED_TRIP_UP_URL = os.getenv("RED_TRIP_UP_URL", "")
+RED_POLL_SEC = float(os.getenv("RED_POLL_SEC", 15))
+XOR_URL = os.getenv("XOR_URL", "https://api.xor.cl/red/bus-stop").rstrip("/")
+ARRIVALS_TTL_SEC = float(os.getenv("ARRIVALS_TTL_SEC", 15))       # respuesta fresca
+ARRIVALS_STALE_SEC = float(os.getenv("ARRIVALS_STALE_SEC", 120))  # se sirve vencida mientras se revalida
+
+# Sesión HTTP compartida (keep-alive) para todas las llamadas a servicios externos
+HTTP = requests.Session()
+HTTP.mount("https://", requests.adapters.HTTPAdapter(pool_connections=8, pool_maxsize=32))
+HTTP.mount("http://", requests.adapters.HTTPAdapter(pool_connections=8, pool_maxsize=32))
 
 DB = "ocupacion.sqlite"
 def init_db():
-    con = sqlite3.connect(DB); cur = con.cursor()
-    cur.execute("""CREATE TABLE IF NOT EXISTS ocupacion(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        bus_id TEXT, ts TEXT, count INTEGER, status TEXT, capacity INTEGER, pct REAL
-    )""")
-    con.commit(); con.close()
+    con = sqlite3.connect(DB)
+    init_schema(con)
+    con.close()
 init_db()
 
+# Escritor único de ocupación: cola en memoria + commits agrupados; se vacía al cerrar
+OCC_WRITER = OccupancyWriter(DB, batch_size=int(os.getenv("OCC_BATCH_SIZE", 500)),
+                             flush_sec=float(os.getenv("OCC_FLUSH_SEC", 0.5)))
+atexit.register(OCC_WRITER.close)
+
+ROUTE_CACHE = RouteCache(ROUTE_CACHE_DB, ttl_sec=ROUTE_CACHE_TTL_SEC, max_entries=ROUTE_CACHE_MAX)
+atexit.register(ROUTE_CACHE.flush)
+
 # ==================== Rutas (ORS/OSRM) ====================
 def _route_generate_osrm(src_lat: float, src_lon: float, dst_lat: float, dst_lon: float) -> List[Tuple[float,float]]:
-    url = f"https://router.project-osrm.org/route/v1/driving/{src_lon},{src_lat};{dst_lon},{dst_lat}?overview=full&geometries=geojson"
-    r = requests.get(url, timeout=20)
+    url = f"{OSRM_URL}/route/v1/driving/{src_lon},{src_lat};{dst_lon},{dst_lat}?overview=full&geometries=geojson"
+    r = HTTP.get(url, timeout=20)
     r.raise_for_status()
     coords = r.json()["routes"][0]["geometry"]["coordinates"]  # [lon,lat]
     return [(lat, lon) for lon, lat in coords]
 
 def _route_generate_ors(src_lat: float, src_lon: float, dst_lat: float, dst_lon: float) -> List[Tuple[float,float]]:
-    url = "https://api.openrouteservice.org/v2/directions/driving-car"
+    url = f"{ORS_URL}/v2/directions/driving-car"
     params = {"api_key": ORS_API_KEY, "start": f"{src_lon},{src_lat}", "end": f"{dst_lon},{dst_lat}"}
-    r = requests.get(url, params=params, timeout=20)
+    r = HTTP.get(url, params=params, timeout=20)
     r.raise_for_status()
     coords = r.json()["features"][0]["geometry"]["coordinates"]  # [lon,lat]
     return [(lat, lon) for lon, lat in coords]
 
 def _generate_route(src_lat: float, src_lon: float, dst_lat: float, dst_lon: float) -> List[Tuple[float,float]]:
+    providers = ["ors", "osrm"] if ORS_API_KEY else ["osrm"]
+    hit = ROUTE_CACHE.get(providers, src_lat, src_lon, dst_lat, dst_lon)
+    if hit is not None:
+        return hit[1]
+    if ROUTE_CACHE_OFFLINE:
+        raise RuntimeError("ruta no disponible en caché (modo offline)")
+
     if ORS_API_KEY:
         try:
-            return _route_generate_ors(src_lat, src_lon, dst_lat, dst_lon)
+            route = _route_generate_ors(src_lat, src_lon, dst_lat, dst_lon)
+            ROUTE_CACHE.put("ors", src_lat, src_lon, dst_lat, dst_lon, route)
+            return route
         except Exception:
             pass
-    return _route_generate_osrm(src_lat, src_lon, dst_lat, dst_lon)
+    route = _route_generate_osrm(src_lat, src_lon, dst_lat, dst_lon)
+    ROUTE_CACHE.put("osrm", src_lat, src_lon, dst_lat, dst_lon, route)
+    return route
 
 # ==================== Paraderos OSM a lo largo de la ruta ====================
 def _bbox_for_route(route: List[Tuple[float,float]], margin_deg: float = 0.01) -> Tuple[float,float,float,float]:
@@ -76,67 +124,34 @@ def _overpass_fetch_bus_stops(south: float, west: float, north: float, east: flo
     );
     out body;
     """
-    r = requests.post("https://overpass-api.de/api/interpreter", data={"data": q}, timeout=30)
+    r = HTTP.post(OVERPASS_URL, data={"data": q}, timeout=30)
     r.raise_for_status()
     data = r.json()
     return data.get("elements", [])
 
-def _meters_per_deg(lat: float) -> Tuple[float,float]:
-    m_per_deg_lat = 111_320.0
-    m_per_deg_lon = 40075000.0 * math.cos(math.radians(lat)) / 360.0
-    return m_per_deg_lat, m_per_deg_lon
-
-def _project_dist_along(route: List[Tuple[float,float]], pt: Tuple[float,float]) -> Tuple[float,float]:
-    """(dist_min_m, distancia_recorrida_km_al_pie) del punto respecto a la polilínea."""
-    px_lat, px_lon = pt
-    min_d = 1e18
-    acc_km = 0.0
-    best_along_km = 0.0
-    for i in range(len(route)-1):
-        a = route[i]; b = route[i+1]
-        lat_ref = (a[0]+b[0])/2.0
-        mlat, mlon = _meters_per_deg(lat_ref)
-        ax, ay = (a[1]*mlon, a[0]*mlat)
-        bx, by = (b[1]*mlon, b[0]*mlat)
-        px, py = (px_lon*mlon, px_lat*mlat)
-
-        vx, vy = (bx-ax, by-ay); wx, wy = (px-ax, py-ay)
-        seg_len2 = vx*vx + vy*vy
-        t = 0.0 if seg_len2==0 else max(0.0, min(1.0, (wx*vx + wy*vy)/seg_len2))
-        projx, projy = (ax + t*vx, ay + t*vy)
-        dist_m = math.hypot(px-projx, py-projy)
-        if dist_m < min_d:
-            min_d = dist_m
-            seg_km = geodesic(a, b).km
-            best_along_km = acc_km + seg_km * t
-        acc_km += geodesic(a, b).km
-    return min_d, best_along_km
-
-def _polyline_total_km(route: List[Tuple[float,float]]) -> float:
-    tot = 0.0
-    for i in range(len(route)-1):
-        tot += geodesic(route[i], route[i+1]).km
-    return tot
-
-def _osm_stops_along_route(route: List[Tuple[float,float]]) -> List[Tuple[float,float,str]]:
-    """Paraderos reales (lat, lon, name) ordenados según sentido de la ruta."""
+STOP_STORE = StopStore(STOP_STORE_DB, _overpass_fetch_bus_stops, tile_deg=STOP_TILE_DEG)
+
+def _osm_stops_along_route(route: List[Tuple[float,float]]) -> List[Tuple[float,float,str,int]]:
+    """Paraderos reales (lat, lon, name, osm_id) ordenados según sentido de la ruta."""
     if not route or len(route)<2:
         return []
     s,w,n,e = _bbox_for_route(route, margin_deg=0.01)
     try:
-        elems = _overpass_fetch_bus_stops(s,w,n,e)
+        elems = STOP_STORE.query(s,w,n,e)
     except Exception as e:
         print("WARN Overpass:", e)
         return []
 
-    total_km = _polyline_total_km(route)
+    cum_km = LocalRoute(route).cum_km
+    total_km = cum_km[-1]
+    pts = [(float(el.get("lat")), float(el.get("lon"))) for el in elems]
+    # Índice espacial de tramos: cada paradero solo se proyecta contra los tramos cercanos
+    dists, alongs = SegmentGrid(route, cum_km, STOP_MATCH_DIST_M).project_near(pts)
     items = []
-    for el in elems:
-        lat = float(el.get("lat")); lon = float(el.get("lon"))
-        name = (el.get("tags") or {}).get("name","Paradero")
-        d_m, along_km = _project_dist_along(route, (lat,lon))
+    for el, (lat, lon), d_m, along_km in zip(elems, pts, dists.tolist(), alongs.tolist()):
         if d_m <= STOP_MATCH_DIST_M and 0.0 <= along_km <= total_km:
-            items.append((d_m, along_km, lat, lon, name))
+            name = (el.get("tags") or {}).get("name","Paradero")
+            items.append((d_m, along_km, lat, lon, name, el.get("id")))
 
     # Orden por distancia a lo largo
     items.sort(key=lambda x: x[1])
@@ -151,121 +166,147 @@ def _osm_stops_along_route(route: List[Tuple[float,float]]) -> List[Tuple[float,
         else:
             dedup.append(it)
 
-    return [(lat, lon, name) for (_, _, lat, lon, name) in dedup]
+    return [(lat, lon, name, sid) for (_, _, lat, lon, name, sid) in dedup]
+
+# ==================== Motor de simulación ====================
+SIM_TICK_SEC = float(os.getenv("SIM_TICK_SEC", 0.25))   # período del loop de simulación
+SIM_LOCK = threading.Lock()                             # protege FLEET
+# Reloj de la simulación: real | escalado (SIM_SPEED veces más rápido) | pasos (POST /sim/clock)
+SIM_CLOCK = SimClock(os.getenv("SIM_CLOCK_MODE", "real"), factor=float(os.getenv("SIM_SPEED", 1.0)))
+SIM_REPLAY_MAX_TICKS = int(os.getenv("SIM_REPLAY_MAX_TICKS", 200000))
+FLEET = FleetStore(stop_radius_km=STOP_RADIUS_KM)       # estado de los buses simulados
+# Última instantánea publicada por el loop; se reemplaza entera en cada tick y no se modifica
+SIM_SNAPSHOT: Dict[str, Any] = {"seq": 0, "ts": 0.0, "destino": DESTINO, "buses": (), "board": {}}
+SIM_SNAPSHOT_COND = threading.Condition()               # avisa de una nueva instantánea
+SSE_KEEPALIVE_SEC = 15.0
+SSE_PUSH_SEC = float(os.getenv("SSE_PUSH_SEC", 1.0))    # período mínimo entre eventos de /sim/stream
+# Último evento de /sim/stream: delta ya serializado una vez para todos los clientes.
+# "snap" es la instantánea que refleja; "full" (lazy) es esa instantánea completa serializada.
+SSE_EVENT: Dict[str, Any] = {"seq": 0, "data": b"", "snap": SIM_SNAPSHOT, "full": None}
+SSE_COND = threading.Condition()                        # protege SSE_EVENT y avisa a los streams
+_SSE_SENT: Dict[str, tuple] = {}                        # bus_id -> _view_key publicada
+_SSE_STATE = {"t": 0.0, "destino": None}
+_SSE_LOCK = threading.Lock()                            # serializa _sse_publicar
+BOARD_PER_STOP = int(os.getenv("BOARD_PER_STOP", 10))   # buses por parada en /sim/stops/<id>/arrivals
+SIM_STOPS: Dict[int, Tuple[float,float,str]] = {}       # id OSM -> (lat, lon, name) de paraderos en uso
+_SIM_THREAD: Optional[threading.Thread] = None
+_SIM_THREAD_LOCK = threading.Lock()
+
+def _bus_views(now: float) -> List[Dict[str, Any]]:
+    """Estado público de los buses (formato de /sim/buses), con ETA y ocupación."""
+    c = FLEET.columnas(now)
+    out = []
+    for i, bus_id in enumerate(c["bus_id"]):
+        # ---- OCUPACIÓN UNIDA AQUÍ ----
+        occ = OCUPACION.get(bus_id, {})
+        occ_count = occ.get("count")
+        occ_capacity = occ.get("capacity", 40)
+        occ_pct = None
+        if occ_count is not None and occ_capacity:
+            occ_pct = round((occ_count / occ_capacity) * 100)
+        has_route = c["has_route"][i]
+        out.append({
+            "bus_id": bus_id,
+            "lat": c["lat"][i],
+            "lon": c["lon"][i],
+            "speed_kmh": c["speed_kmh"][i],
+            "distance_km": c["distance_km"][i],
+            "eta_min": c["eta_min"][i],
+            "arrived": c["arrived"][i],
+            "has_route": has_route,
+            "distance_kind": "route" if has_route else "straight",
+            "is_dwell": c["is_dwell"][i],
+            "stops_total": c["stops_total"][i],
+            "stops_next_idx": c["stops_next_idx"][i],
 
-# ==================== Distancias / movimiento ====================
-def _remaining_route_km(bus: Dict[str, Any]) -> Optional[float]:
-    route = bus.get("route") or []
-    if not route or len(route)<2:
-        return None
-    idx = int(bus.get("idx",0))
-    lat, lon = bus["lat"], bus["lon"]
-    rem = 0.0
-    if idx < len(route)-1:
-        rem += geodesic((lat,lon), route[idx+1]).km
-        for i in range(idx+1, len(route)-1):
-            rem += geodesic(route[i], route[i+1]).km
-    return rem
-
-def _advance_along_route(bus: Dict[str, Any], step_km: float):
-    route = bus.get("route") or []
-    if not route or len(route)<2:
-        return False
-    idx = int(bus.get("idx",0))
-    lat, lon = bus["lat"], bus["lon"]
-    if idx==0 and geodesic((lat,lon), route[0]).km>0.01 and not bus.get("placed"):
-        lat, lon = route[0]
-        bus["placed"]=True
-    while step_km>0 and idx < len(route)-1:
-        nlat,nlon = route[idx+1]
-        dist_km = geodesic((lat,lon),(nlat,nlon)).km
-        if dist_km < 1e-6:
-            idx+=1
-            continue
-        if step_km >= dist_km:
-            lat,lon = nlat,nlon
-            step_km -= dist_km
-            idx+=1
-        else:
-            frac = step_km/dist_km
-            lat = lat+(nlat-lat)*frac
-            lon = lon+(nlon-lon)*frac
-            step_km=0
-    bus["lat"], bus["lon"], bus["idx"] = lat, lon, idx
-    if idx >= len(route)-1:
-        bus["arrived"]=True
-    return True
-
-def _advance_straight(bus: Dict[str, Any], destino: tuple, step_km: float):
-    lat,lon = bus["lat"], bus["lon"]
-    lat2,lon2 = destino
-    mlat, mlon = _meters_per_deg(lat if lat else lat2)
-    dlat,dlon = (lat2-lat, lon2-lon)
-    vx,vy = (dlon*mlon, dlat*mlat)
-    dist_km = math.hypot(vx,vy)/1000.0
-    if dist_km < 0.02:
-        bus["lat"],bus["lon"]=lat2,lon2
-        bus["arrived"]=True
-        return
-    ux,uy = (vx/(dist_km*1000), vy/(dist_km*1000))
-    move_km = min(step_km, dist_km)
-    lon += (move_km*1000*ux)/mlon
-    lat += (move_km*1000*uy)/mlat
-    bus["lat"],bus["lon"]=lat,lon
-
-def _check_stop_and_dwell(bus: Dict[str, Any], now: float):
-    """Si el bus llegó a la próxima parada, se detiene (dwell) y reinicia el reloj."""
-    stops = bus.get("stops") or []
-    next_idx = int(bus.get("next_stop_idx", 0))
-    dwell_sec = int(bus.get("dwell_sec", AUTOSTOPS_DWELL_SEC))
-    if not stops or next_idx >= len(stops):
-        return
-
-    tgt = stops[next_idx]  # (lat, lon)
-    # ¿está dentro del radio de llegada?
-    if geodesic((bus["lat"], bus["lon"]), (tgt[0], tgt[1])).km <= STOP_RADIUS_KM and not bus.get("is_dwell", False):
-        # anclar posición exactamente en la parada
-        bus["lat"], bus["lon"] = tgt[0], tgt[1]
-        # activar dwell y avanzar el índice de la siguiente parada
-        bus["is_dwell"] = True
-        bus["dwell_until"] = now + max(0, dwell_sec)
-        bus["next_stop_idx"] = next_idx + 1
-        # MUY IMPORTANTE: reiniciar el reloj para que no se acumule tiempo de movimiento
-        bus["t"] = now
-
-def _advance_bus(bus: Dict[str, Any], destino: tuple):
-    """Avanza el bus por su ruta o en línea recta, respetando dwell en paradas."""
-    now = time.time()
-
-    # Si está detenido por dwell, mantener el reloj actualizado y no moverlo
-    if bus.get("is_dwell", False):
-        bus["t"] = now  # evitar acumulación de dt mientras está detenido
-        if now < float(bus.get("dwell_until", 0)):
+            # 👇 CAMPOS OCUPACIÓN
+            "occ_count": occ_count,
+            "occ_capacity": occ_capacity if occ_count is not None else None,
+            "occ_pct": occ_pct,
+            "occ_status": occ.get("status")
+        })
+    return out
+
+_SIM_LAST_T: Optional[float] = None
+
+def _sim_tick():
+    """Avanza todos los buses un tick (vectorizado) y publica una nueva instantánea."""
+    global SIM_SNAPSHOT, _SIM_LAST_T
+    with SIM_LOCK:
+        destino = DESTINO
+        now = SIM_CLOCK.now()
+        dt = 0.0 if _SIM_LAST_T is None else now - _SIM_LAST_T
+        _SIM_LAST_T = now
+        FLEET.advance_all(dt, now)
+        out = _bus_views(now)
+        board = FLEET.tablero(now, BOARD_PER_STOP)
+    with SIM_SNAPSHOT_COND:
+        SIM_SNAPSHOT = {"seq": SIM_SNAPSHOT["seq"] + 1, "ts": now, "destino": destino, "buses": tuple(out),
+                        "board": board}
+        SIM_SNAPSHOT_COND.notify_all()
+    _sse_publicar(SIM_SNAPSHOT)
+
+def _view_key(v: Dict[str, Any]) -> tuple:
+    """Campos cuyo cambio amerita reenviar el bus por el stream (posición, dwell, ocupación)."""
+    return (v["lat"], v["lon"], v["is_dwell"], v["arrived"], v["stops_next_idx"],
+            v["occ_count"], v["occ_status"], v["occ_capacity"])
+
+def _sse_bytes(payload: Dict[str, Any], seq: int) -> bytes:
+    return f"event: delta\nid: {seq}\ndata: {json.dumps(payload)}\n\n".encode()
+
+def _sse_publicar(snap: Dict[str, Any]):
+    """
+    A lo más cada SSE_PUSH_SEC (reloj de pared, independiente del tick): calcula una sola vez
+    el delta contra lo último publicado y lo deja serializado en SSE_EVENT para todos los streams.
+    """
+    with _SSE_LOCK:
+        t = time.monotonic()
+        if t - _SSE_STATE["t"] < SSE_PUSH_SEC:
             return
-        # terminó el dwell: limpiar flags y esperar al siguiente ciclo para mover
-        bus["is_dwell"] = False
-        bus["dwell_until"] = None
-        bus["t"] = now
-        return
-
-    # Movimiento normal
-    dt = now - bus.get("t", now)
-    bus["t"] = now
-    if dt <= 0:
-        return
-
-    speed = float(bus.get("speed_kmh", 25.0))
-    if speed <= 0:
-        return
-
-    step_km = speed * dt / 3600.0
-
-    used_route = _advance_along_route(bus, step_km)
-    if not used_route:
-        _advance_straight(bus, destino, step_km)
+        _SSE_STATE["t"] = t
+        changed, vivos = [], set()
+        for v in snap["buses"]:
+            vivos.add(v["bus_id"])
+            k = _view_key(v)
+            if _SSE_SENT.get(v["bus_id"]) != k:
+                _SSE_SENT[v["bus_id"]] = k
+                changed.append(v)
+        removed = [b for b in _SSE_SENT if b not in vivos]
+        for b in removed:
+            del _SSE_SENT[b]
+        if not (changed or removed or snap["destino"] != _SSE_STATE["destino"]):
+            return
+        _SSE_STATE["destino"] = snap["destino"]
+        seq = SSE_EVENT["seq"] + 1
+        data = _sse_bytes({"full": False, "destino": snap["destino"], "buses": changed, "removed": removed}, seq)
+        with SSE_COND:
+            SSE_EVENT.update(seq=seq, data=data, snap=snap, full=None)
+            SSE_COND.notify_all()
+
+def _sse_full(ev: Dict[str, Any]) -> bytes:
+    """Instantánea completa del evento, serializada una vez y compartida (llamar con SSE_COND tomado)."""
+    if ev["full"] is None:
+        snap = ev["snap"]
+        ev["full"] = _sse_bytes({"full": True, "destino": snap["destino"], "buses": list(snap["buses"]),
+                                 "removed": []}, ev["seq"])
+    return ev["full"]
+
+def _sim_loop():
+    while True:
+        t0 = time.time()
+        try:
+            _sim_tick()
+        except Exception as e:
+            print("WARN simulación:", e)
+        time.sleep(max(0.0, SIM_TICK_SEC - (time.time() - t0)))
 
-    # Chequear si toca detenerse en la próxima parada
-    _check_stop_and_dwell(bus, now)
+def _ensure_sim_loop():
+    """Arranca el loop de simulación la primera vez que se necesita (una vez por proceso)."""
+    global _SIM_THREAD
+    with _SIM_THREAD_LOCK:
+        if _SIM_THREAD is None or not _SIM_THREAD.is_alive():
+            _SIM_THREAD = threading.Thread(target=_sim_loop, name="sim-loop", daemon=True)
+            _SIM_THREAD.start()
 
 # ==================== Endpoints básicos ====================
 @app.route("/")
@@ -281,176 +322,573 @@ def set_destination():
     global DESTINO
     d = request.get_json(force=True)
     DESTINO = (float(d["lat"]), float(d["lon"]))
+    with SIM_LOCK:
+        FLEET.set_destino(DESTINO)
     return jsonify({"message":"ok","destino":DESTINO})
 
 # ==================== Ocupación ====================
 @app.route("/occupancy", methods=["POST"])
 @app.route("/occupancy/update", methods=["POST"])
 def occupancy_update():
-    data = request.get_json(force=True)
-
-    bus_id = data.get("bus_id")
-    count = data.get("count")
-    status = data.get("status", "unknown")    # <--- NUEVO
-    capacity = data.get("capacity", 40)
-
-    if not bus_id:
-        return jsonify({"ok": False, "error": "bus_id missing"}), 400
-    if count is None:
-        return jsonify({"ok": False, "error": "count missing"}), 400
+    data = request.get_json(force=True, silent=True)
+    try:
+        # misma validación que /occupancy/batch; el ts lo pone el servidor
+        row = _parse_reading({**data, "ts": None} if isinstance(data, dict) else data, int(time.time()))
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    bus_id, ts, ts_epoch, count, status, capacity, pct = row
 
-    ts = time.strftime("%Y-%m-%d %H:%M:%S")
+    # --- Guardar en SQLite (encolado; lo confirma el escritor en lote) ---
+    # Primero se encola: una lectura rechazada (503) no debe quedar visible en memoria.
+    if not OCC_WRITER.put(row):
+        return jsonify({"ok": False, "error": "writer queue full, reading dropped"}), 503
 
     # --- Guardar en memoria ---
-    OCUPACION[bus_id] = {
-        "count": count,
-        "status": status,   # <--- NUEVO
-        "capacity": capacity,
-        "ts": ts
-    }
-
-    # --- Guardar en SQLite ---
-    con = sqlite3.connect(DB)
-    cur = con.cursor()
-    cur.execute(
-        "INSERT INTO ocupacion (bus_id, ts, count, status, capacity, pct) VALUES (?,?,?,?,?,?)",
-        (bus_id, ts, count, status, capacity, count / capacity if capacity else None)
-    )
-    con.commit()
-    con.close()
+    with OCC_LOCK:
+        OCUPACION[bus_id] = {
+            "count": count,
+            "status": status,   # <--- NUEVO
+            "capacity": capacity,
+            "ts": ts
+        }
 
     return jsonify({"ok": True})
 
+def _parse_ts(v: Any) -> int:
+    """ts (epoch o ISO 'YYYY-mm-ddTHH:MM:SS', hora local) a epoch en segundos."""
+    if isinstance(v, (int, float)) and not isinstance(v, bool):
+        return int(v)
+    if str(v).strip().isdigit():
+        return int(str(v).strip())
+    return int(time.mktime(time.strptime(str(v).strip().replace("T", " ")[:19], "%Y-%m-%d %H:%M:%S")))
+
+def _parse_reading(d: Any, default_epoch: int) -> Tuple:
+    """Valida una lectura y la convierte en fila (bus_id, ts, ts_epoch, count, status, capacity, pct)."""
+    if not isinstance(d, dict):
+        raise ValueError("record must be an object")
+    bus_id = d.get("bus_id")
+    if not bus_id:
+        raise ValueError("bus_id missing")
+    count = d.get("count")
+    if count is None:
+        raise ValueError("count missing")
+    try:
+        count = int(count)
+        capacity = int(d.get("capacity", 40))
+    except (TypeError, ValueError):
+        raise ValueError("count/capacity must be integers")
+    if not (0 <= count <= OCC_VALUE_MAX and 0 <= capacity <= OCC_VALUE_MAX):
+        raise ValueError(f"count/capacity must be between 0 and {OCC_VALUE_MAX}")
+    try:
+        ts_epoch = _parse_ts(d["ts"]) if d.get("ts") is not None else default_epoch
+        ts = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts_epoch))
+    except (ValueError, OverflowError, OSError):
+        raise ValueError("invalid ts")
+    status = str(d.get("status", "unknown"))[:32]
+    return (str(bus_id), ts, ts_epoch, count, status, capacity, count / capacity if capacity else None)
+
+@app.route("/occupancy/batch", methods=["POST"])
+def occupancy_batch():
+    """
+    Lote de lecturas: arreglo JSON (o {"readings": [...]}) o NDJSON
+    (Content-Type: application/x-ndjson). Devuelve errores por índice de registro.
+    """
+    errors = []
+    if "ndjson" in (request.content_type or ""):
+        records = []
+        for i, line in enumerate(request.get_data(as_text=True).splitlines()):
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                records.append(None)
+                errors.append({"index": len(records)-1, "error": f"invalid JSON on line {i+1}"})
+    else:
+        data = request.get_json(force=True, silent=True)
+        records = data.get("readings") if isinstance(data, dict) else data
+        if not isinstance(records, list):
+            return jsonify({"ok": False, "error": "expected a JSON array of readings"}), 400
+    if len(records) > OCC_BATCH_MAX:
+        return jsonify({"ok": False, "error": f"too many readings (max {OCC_BATCH_MAX})"}), 413
+
+    default_epoch = int(time.time())
+    rows = []
+    con_error = {e["index"] for e in errors}
+    # Validación registro a registro: vienen como dicts JSON heterogéneos y hay que reportar
+    # el error por índice; pasarlos a columnas NumPy costaría el mismo recorrido en Python.
+    for i, rec in enumerate(records):
+        if i in con_error:
+            continue
+        try:
+            rows.append(_parse_reading(rec, default_epoch))
+        except ValueError as e:
+            errors.append({"index": i, "error": str(e)})
+    errors.sort(key=lambda e: e["index"])
+
+    # --- Un solo bloque para el escritor (executemany + commit) ---
+    # Primero se encola: si el lote se rechaza (503) la memoria no cambia.
+    if not OCC_WRITER.put_many(rows):
+        return jsonify({"ok": False, "error": "writer queue full, readings dropped", "accepted": 0,
+                        "errors": errors}), 503
+
+    # Última lectura por bus (según ts) y un solo reemplazo en memoria; un lote atrasado
+    # (p.ej. el buffer de un bus que estuvo sin red) no pisa una lectura más reciente.
+    latest: Dict[str, Tuple] = {}
+    for r in rows:
+        if r[0] not in latest or r[2] >= latest[r[0]][2]:
+            latest[r[0]] = r
+    with OCC_LOCK:
+        for b, r in latest.items():
+            actual = OCUPACION.get(b)
+            if actual is None or r[1] >= actual["ts"]:     # ts "%Y-%m-%d %H:%M:%S": orden lexicográfico = cronológico
+                OCUPACION[b] = {"count": r[3], "status": r[4], "capacity": r[5], "ts": r[1]}
+
+    return jsonify({"ok": bool(rows) or not records, "accepted": len(rows), "errors": errors}), (200 if rows or not records else 400)
+
 @app.route("/occupancy/list")
 def occupancy_list():
     return jsonify(OCUPACION)
 
-# ==================== Simulador ====================
-@app.route("/sim/start", methods=["POST"])
-def sim_start():
-    d=request.get_json(force=True)
-    bus_id=str(d.get("bus_id","bus001"))
-    lat=float(d["lat"])
-    lon=float(d["lon"])
-    speed=float(d.get("speed_kmh",25.0))
+@app.route("/occupancy/history")
+def occupancy_history():
+    """
+    Historial de ocupación: ?bus_id=&from=&to=&bucket=raw|1m|15m|1h
+    (from/to en epoch o ISO; por defecto las últimas 24 h, bucket=15m, toda la flota;
+    bucket=raw sin bus_id, por defecto la última hora). El rango máximo depende del
+    bucket (occupancy_store.max_span); más allá responde 400.
+    """
+    bucket = request.args.get("bucket", "15m")
+    if bucket != "raw" and bucket not in BUCKET_NAMES:
+        return jsonify({"ok": False, "error": f"bucket must be raw or one of {', '.join(BUCKET_NAMES)}"}), 400
+    bus_id = request.args.get("bus_id") or None
+    bucket_sec = None if bucket == "raw" else BUCKET_NAMES[bucket]
+    tope = max_span(bucket_sec, bus_id)
+    try:
+        now = int(time.time())
+        t1 = _parse_ts(request.args["to"]) if request.args.get("to") else now + 1
+        t0 = _parse_ts(request.args["from"]) if request.args.get("from") else t1 - min(24*3600, tope)
+    except (ValueError, OverflowError):
+        return jsonify({"ok": False, "error": "invalid from/to"}), 400
+    if t1 - t0 > tope:
+        return jsonify({"ok": False, "error": f"range too large for bucket={bucket}"
+                        f"{' without bus_id' if bucket_sec is None and not bus_id else ''}: max {tope} s"}), 400
 
-    BUSES[bus_id]={"lat":lat,"lon":lon,"speed_kmh":speed,"t":time.time(),
-                   "arrived":False,"route":None,"idx":0,
-                   "stops":[], "stop_names":[], "next_stop_idx":0,
-                   "dwell_sec":AUTOSTOPS_DWELL_SEC,"is_dwell":False,"dwell_until":None}
+    con = sqlite3.connect(DB)
+    try:
+        series = query_history(con, bus_id, t0, t1, bucket_sec)
+    finally:
+        con.close()
+    return jsonify({"ok": True, "bucket": bucket, "from": t0, "to": t1, "series": series})
+
+@app.route("/occupancy/writer")
+def occupancy_writer():
+    return jsonify({"ok": True, **OCC_WRITER.stats()})
+
+# ==================== Frames anotados (en memoria) ====================
+# Último JPEG anotado por bus, acotado a FRAMES_MAX_BUSES (se descarta el bus que subió hace
+# más tiempo). Si FRAMES_TOKEN está definido, las subidas deben traer X-Frames-Token.
+FRAMES: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+FRAMES_LOCK = threading.Lock()
+FRAME_MAX_BYTES = 2_000_000
+FRAMES_MAX_BUSES = int(os.getenv("FRAMES_MAX_BUSES", 200))
+FRAMES_TOKEN = os.getenv("FRAMES_TOKEN", "")
+
+@app.route("/frames/<bus_id>", methods=["POST"])
+def frames_upload(bus_id: str):
+    if FRAMES_TOKEN and request.headers.get("X-Frames-Token") != FRAMES_TOKEN:
+        return jsonify({"ok": False, "error": "invalid token"}), 401
+    if len(bus_id) > 64:
+        return jsonify({"ok": False, "error": "bus_id too long"}), 400
+    if (request.content_length or 0) > FRAME_MAX_BYTES:
+        return jsonify({"ok": False, "error": "frame too large"}), 413
+    data = request.get_data()
+    if not data:
+        return jsonify({"ok": False, "error": "empty body"}), 400
+    if len(data) > FRAME_MAX_BYTES:
+        return jsonify({"ok": False, "error": "frame too large"}), 413
+    with FRAMES_LOCK:
+        FRAMES[bus_id] = (time.time(), data)
+        FRAMES.move_to_end(bus_id)
+        while len(FRAMES) > FRAMES_MAX_BUSES:
+            FRAMES.popitem(last=False)
+    return jsonify({"ok": True})
+
+@app.route("/frames/<bus_id>/latest")
+def frames_latest(bus_id: str):
+    with FRAMES_LOCK:
+        fr = FRAMES.get(bus_id)
+    if fr is None:
+        return jsonify({"ok": False, "error": "no frame"}), 404
+    ts, data = fr
+    return Response(data, mimetype="image/jpeg",
+                    headers={"Cache-Control": "no-store", "X-Frame-Ts": f"{ts:.3f}"})
 
+# ==================== Simulador ====================
+def _resolve_route_stops(lat: float, lon: float, destino: Tuple[float,float]):
+    """Ruta OSRM/ORS y paraderos OSM sobre ella; sin ruta el bus anda en línea recta."""
     # 1) Ruta
     points: List[Tuple[float,float]] = []
     try:
-        points = _generate_route(lat,lon, DESTINO[0],DESTINO[1])
-        if points and len(points)>=2:
-            BUSES[bus_id]["route"]=points
-            BUSES[bus_id]["idx"]=0
-            BUSES[bus_id]["placed"]=False
+        points = _generate_route(lat,lon, destino[0],destino[1])
     except Exception as e:
         print("WARN ruta:", e)
 
     # 2) Paraderos reales OSM sobre la ruta
-    auto_stops: List[Tuple[float,float,str]] = []
+    auto_stops: List[Tuple[float,float,str,int]] = []
     if points and len(points)>=2:
         try:
             auto_stops = _osm_stops_along_route(points)
         except Exception as e:
             print("WARN paraderos OSM:", e)
+    return points or [], auto_stops
+
+# Arranque asíncrono: la resolución de ruta + paraderos corre en un pool y el request
+# solo crea un trabajo. Orígenes/destinos iguales (cuantizados) comparten el mismo future.
+SIM_START_WORKERS = int(os.getenv("SIM_START_WORKERS", 16))
+SIM_BULK_MAX = int(os.getenv("SIM_BULK_MAX", 500))
+SIM_START_WAIT_SEC = float(os.getenv("SIM_START_WAIT_SEC", 30))   # tope de espera de /sim/start?wait=1
+SIM_JOBS_MAX = 200                                       # trabajos terminados que se recuerdan
+SIM_POOL = ThreadPoolExecutor(max_workers=SIM_START_WORKERS, thread_name_prefix="sim-start")
+SIM_JOBS: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+SIM_JOBS_LOCK = threading.Lock()                         # protege SIM_JOBS y _RESOLVE_INFLIGHT
+_RESOLVE_INFLIGHT: Dict[tuple, Future] = {}
+
+def _resolve_key(lat: float, lon: float, destino: Tuple[float,float]) -> tuple:
+    # misma cuantización que ROUTE_CACHE (4 decimales ≈ 11 m)
+    return (round(lat, 4), round(lon, 4), round(destino[0], 4), round(destino[1], 4))
+
+def _resolve_async(lat: float, lon: float, destino: Tuple[float,float]) -> Tuple[tuple, Future]:
+    """Future de (points, auto_stops); si ya hay uno en curso para el mismo par se reutiliza."""
+    key = _resolve_key(lat, lon, destino)
+    with SIM_JOBS_LOCK:
+        fut = _RESOLVE_INFLIGHT.get(key)
+        nuevo = fut is None
+        if nuevo:
+            fut = _RESOLVE_INFLIGHT[key] = SIM_POOL.submit(_resolve_route_stops, lat, lon, destino)
+    if nuevo:
+        # fuera del lock: si el future ya terminó el callback corre aquí mismo
+        fut.add_done_callback(lambda f, k=key: _resolve_done(k, f))
+    return key, fut
+
+def _resolve_done(key: tuple, fut: Future):
+    with SIM_JOBS_LOCK:
+        if _RESOLVE_INFLIGHT.get(key) is fut:
+            del _RESOLVE_INFLIGHT[key]
+
+def _new_job(buses: List[Dict[str, Any]], destino: Tuple[float,float]) -> Dict[str, Any]:
+    job = {"job_id": uuid.uuid4().hex[:12], "state": "running", "created": time.time(), "finished": None,
+           "destino": destino, "total": len(buses), "done": 0, "errors": 0,
+           "buses": {b["bus_id"]: {"state": "pending"} for b in buses}, "routes": {}, "evento": threading.Event()}
+    with SIM_JOBS_LOCK:
+        SIM_JOBS[job["job_id"]] = job
+        while len(SIM_JOBS) > SIM_JOBS_MAX:
+            viejo = next(iter(SIM_JOBS.values()))
+            if viejo["state"] == "running":
+                break
+            SIM_JOBS.popitem(last=False)
+    return job
+
+def _bus_resolved(job: Dict[str, Any], bus: Dict[str, Any], key: tuple, fut: Future):
+    """Callback del future: el bus entra a la simulación recién con ruta y paradas resueltas."""
+    rkey = "%.4f,%.4f" % key[:2]
+    try:
+        points, auto_stops = fut.result()
+        with SIM_LOCK:
+            for a in auto_stops:
+                if a[3] is not None:
+                    SIM_STOPS[a[3]] = (a[0], a[1], a[2])
+            FLEET.add(bus["bus_id"], bus["lat"], bus["lon"], bus["speed_kmh"],
+                      points if len(points)>=2 else None,
+                      stops=[(a[0],a[1]) for a in auto_stops], dwell_sec=AUTOSTOPS_DWELL_SEC, destino=job["destino"],
+                      stop_ids=[a[3] for a in auto_stops])
+        res = {"state": "done", "route": rkey, "points": len(points), "auto_stops": len(auto_stops)}
+    except Exception as e:
+        print("WARN sim start:", bus["bus_id"], e)
+        points, auto_stops, res = None, None, {"state": "error", "error": str(e)}
+    with SIM_JOBS_LOCK:
+        job["buses"][bus["bus_id"]] = res
+        if points is not None:
+            job["routes"][rkey] = {"points": points, "auto_stops": auto_stops}
+        job["done"] += 1
+        job["errors"] += res["state"] == "error"
+        terminado = job["done"] == job["total"]
+        if terminado:
+            job["state"] = "error" if job["errors"] == job["total"] else "done"
+            job["finished"] = time.time()
+    if terminado:
+        job["evento"].set()
+    _ensure_sim_loop()
+
+def _start_job(buses: List[Dict[str, Any]]) -> Dict[str, Any]:
+    destino = DESTINO
+    job = _new_job(buses, destino)
+    futs = set()
+    for b in buses:
+        key, fut = _resolve_async(b["lat"], b["lon"], destino)
+        futs.add(fut)
+        fut.add_done_callback(lambda f, b=b, k=key: _bus_resolved(job, b, k, f))
+    job["unique"] = len(futs)
+    return job
+
+def _job_view(job: Dict[str, Any], detail: bool = False) -> Dict[str, Any]:
+    with SIM_JOBS_LOCK:
+        out = {k: job[k] for k in ("job_id", "state", "created", "finished", "destino", "total", "done", "errors")}
+        out["unique_routes"] = job.get("unique")
+        out["elapsed_s"] = round((job["finished"] or time.time()) - job["created"], 3)
+        out["buses"] = dict(job["buses"])
+        if detail:
+            out["routes"] = dict(job["routes"])
+    return out
+
+def _parse_bus(d: Dict[str, Any], default_id: str) -> Dict[str, Any]:
+    return {"bus_id": str(d.get("bus_id", default_id)), "lat": float(d["lat"]), "lon": float(d["lon"]),
+            "speed_kmh": float(d.get("speed_kmh", 25.0))}
 
-    if auto_stops:
-        BUSES[bus_id]["stops"] = [(a[0],a[1]) for a in auto_stops]
-        BUSES[bus_id]["stop_names"] = [a[2] for a in auto_stops]
-        BUSES[bus_id]["next_stop_idx"] = 0
-
-    return jsonify({"ok":True,"bus_id":bus_id,"points":points,"auto_stops":auto_stops,"dwell_sec":AUTOSTOPS_DWELL_SEC})
+@app.route("/sim/start", methods=["POST"])
+def sim_start():
+    """
+    Crea el bus en segundo plano y responde al instante (202) con job_id; el estado
+    y la ruta se consultan en /sim/jobs/<job_id>?detail=1. Con ?wait=1 espera al
+    trabajo (a lo más SIM_START_WAIT_SEC; si no alcanza responde 202 igual) y responde
+    como antes (points, auto_stops).
+    """
+    d=request.get_json(force=True)
+    try:
+        bus = _parse_bus(d, "bus001")
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"ok": False, "error": "lat/lon requeridos"}), 400
+    job = _start_job([bus])
+
+    if request.args.get("wait") == "1" and job["evento"].wait(SIM_START_WAIT_SEC):
+        v = _job_view(job, detail=True)
+        res = v["buses"][bus["bus_id"]]
+        ruta = v["routes"].get(res.get("route"), {"points": [], "auto_stops": []})
+        return jsonify({"ok": res["state"] == "done", "bus_id": bus["bus_id"], "job_id": job["job_id"],
+                        "points": ruta["points"], "auto_stops": ruta["auto_stops"], "dwell_sec": AUTOSTOPS_DWELL_SEC})
+
+    return jsonify({"ok":True,"bus_id":bus["bus_id"],"job_id":job["job_id"],"dwell_sec":AUTOSTOPS_DWELL_SEC}), 202
+
+@app.route("/sim/start_bulk", methods=["POST"])
+def sim_start_bulk():
+    """
+    Arranca N buses a la vez. Body:
+      {"buses": [{"bus_id","lat","lon","speed_kmh"?}, ...]}
+    o {"origins": [[lat,lon], ...], "prefix": "bus", "speed_kmh": 25}
+    Los orígenes repetidos resuelven ruta y paraderos una sola vez.
+    """
+    d=request.get_json(force=True, silent=True) or {}
+    try:
+        if "buses" in d:
+            buses = [_parse_bus(b, f"bus{i:03d}") for i, b in enumerate(d["buses"], 1)]
+        else:
+            prefix = str(d.get("prefix", "bus"))
+            speed = d.get("speed_kmh", 25.0)
+            buses = [_parse_bus({"lat": o[0], "lon": o[1], "speed_kmh": speed}, f"{prefix}{i:03d}")
+                     for i, o in enumerate(d.get("origins", []), 1)]
+    except (KeyError, IndexError, TypeError, ValueError):
+        return jsonify({"ok": False, "error": "buses/origins inválidos"}), 400
+    if not buses:
+        return jsonify({"ok": False, "error": "sin buses"}), 400
+    if len(buses) > SIM_BULK_MAX:
+        return jsonify({"ok": False, "error": f"máximo {SIM_BULK_MAX} buses por lote"}), 413
+    if len({b["bus_id"] for b in buses}) != len(buses):
+        return jsonify({"ok": False, "error": "bus_id repetido"}), 400
+    job = _start_job(buses)
+    return jsonify({"ok": True, "job_id": job["job_id"], "total": len(buses), "unique_routes": job["unique"]}), 202
+
+@app.route("/sim/jobs/<job_id>")
+def sim_job(job_id: str):
+    with SIM_JOBS_LOCK:
+        job = SIM_JOBS.get(job_id)
+    if job is None:
+        return jsonify({"ok": False, "error": "job no encontrado"}), 404
+    return jsonify({"ok": True, **_job_view(job, detail=request.args.get("detail") == "1")})
 
 @app.route("/sim/stop", methods=["POST"])
 def sim_stop():
     d=request.get_json(force=True, silent=True) or {}
     bus_id=str(d.get("bus_id",""))
-    if bus_id in BUSES:
-        del BUSES[bus_id]
+    with SIM_LOCK:
+        FLEET.remove(bus_id)
     return jsonify({"ok":True})
 
 @app.route("/sim/buses")
 def sim_buses():
-    out = []
-    now = time.time()
-
-    for bus_id, bus in list(BUSES.items()):
-        _advance_bus(bus, DESTINO)
-
-        dist_route = _remaining_route_km(bus)
-        if dist_route is None:
-            dist_km = geodesic((bus["lat"], bus["lon"]), DESTINO).km
-            distance_kind = "straight"
-        else:
-            dist_km = max(0.0, dist_route)
-            distance_kind = "route"
-
-        speed = max(float(bus.get("speed_kmh", 25.0)), 1e-6)
-        eta_min = (dist_km / speed) * 60.0
-
-        dwell_remaining = 0.0
-        if bus.get("is_dwell", False) and bus.get("dwell_until"):
-            dwell_remaining = max(0.0, float(bus["dwell_until"]) - now)
-
-        total = len(bus.get("stops") or [])
-        nxt = int(bus.get("next_stop_idx", 0))
-        remain = max(0, total - nxt)
-        dwell_each = int(bus.get("dwell_sec", AUTOSTOPS_DWELL_SEC))
-
-        eta_min += (dwell_remaining + remain * dwell_each) / 60.0
-
-        # ---- OCUPACIÓN UNIDA AQUÍ ----
-        occ = OCUPACION.get(bus_id, {})
-        occ_count = occ.get("count")
-        occ_status = occ.get("status")
-        occ_capacity = occ.get("capacity", 40)
-
-        occ_pct = None
-        if occ_count is not None and occ_capacity:
-            occ_pct = round((occ_count / occ_capacity) * 100)
-
-        out.append({
-            "bus_id": bus_id,
-            "lat": bus["lat"],
-            "lon": bus["lon"],
-            "speed_kmh": bus.get("speed_kmh", 25.0),
-            "distance_km": dist_km,
-            "eta_min": eta_min,
-            "arrived": bool(bus.get("arrived", False)),
-            "has_route": bool(bus.get("route")),
-            "distance_kind": distance_kind,
-            "is_dwell": bus.get("is_dwell", False),
-            "stops_total": total,
-            "stops_next_idx": nxt,
-
-            # 👇 CAMPOS OCUPACIÓN
-            "occ_count": occ_count,
-            "occ_capacity": occ_capacity if occ_count is not None else None,
-            "occ_pct": occ_pct,
-            "occ_status": occ_status
-        })
-
+    _ensure_sim_loop()
+    snap = SIM_SNAPSHOT
     return jsonify({
         "ok": True,
-        "destino": DESTINO,
-        "buses": out
+        "destino": snap["destino"],
+        "buses": list(snap["buses"])
     })
 
+@app.route("/sim/stream")
+def sim_stream():
+    """
+    Server-Sent Events con deltas: el primer evento trae todos los buses (full=true);
+    los siguientes solo los que cambiaron y los ids eliminados, a lo más uno cada
+    SSE_PUSH_SEC. El delta se arma y serializa una vez por evento en el loop de
+    simulación; cada cliente solo reenvía esos bytes (un cliente que se atrasó y
+    perdió eventos recibe de nuevo la instantánea completa).
+    """
+    _ensure_sim_loop()
+
+    def gen():
+        last_seq = None
+        while True:
+            with SSE_COND:
+                SSE_COND.wait_for(lambda: SSE_EVENT["seq"] != last_seq, timeout=SSE_KEEPALIVE_SEC)
+                ev = SSE_EVENT
+                if ev["seq"] == last_seq:
+                    data = None
+                elif last_seq is None or ev["seq"] != last_seq + 1:
+                    data = _sse_full(ev)
+                else:
+                    data = ev["data"]
+                last_seq = ev["seq"]
+            yield data if data is not None else b": keepalive\n\n"
+
+    return Response(gen(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/sim/stops/<int:stop_id>/arrivals")
+def sim_stop_arrivals(stop_id: int):
+    """Próximos buses simulados a un paradero OSM, desde el tablero del último tick."""
+    _ensure_sim_loop()
+    snap = SIM_SNAPSHOT
+    info = SIM_STOPS.get(stop_id)
+    if info is None:
+        return jsonify({"ok": False, "error": "paradero sin buses simulados"}), 404
+    arrivals = [{"bus_id": b, "eta_min": round(eta, 2), "distance_km": round(d, 3)}
+                for b, eta, d in snap["board"].get(stop_id, ())]
+    return jsonify({"ok": True, "stop_id": stop_id, "lat": info[0], "lon": info[1], "name": info[2],
+                    "ts": snap["ts"], "arrivals": arrivals})
+
+@app.route("/sim/clock", methods=["GET", "POST"])
+def sim_clock():
+    """
+    GET: modo y hora virtual. POST cambia el reloj y/o lo adelanta:
+      {"mode": "real"|"escalado"|"pasos", "speed": 100}
+      {"advance_s": 86400, "dt": 1.0, "loop": true}   (modo pasos: corre los ticks de inmediato;
+                                                       loop=true reinicia la ruta de los que llegan)
+    """
+    global _SIM_LAST_T
+    if request.method == "POST":
+        d = request.get_json(force=True, silent=True) or {}
+        try:
+            if "mode" in d or "speed" in d:
+                SIM_CLOCK.set_modo(str(d.get("mode", SIM_CLOCK.modo)),
+                                   float(d["speed"]) if d.get("speed") is not None else None)
+            advance_s = float(d.get("advance_s", 0))
+            dt = float(d.get("dt", SIM_TICK_SEC))
+        except (TypeError, ValueError) as e:
+            return jsonify({"ok": False, "error": str(e)}), 400
+        if advance_s > 0:
+            if SIM_CLOCK.modo != "pasos":
+                return jsonify({"ok": False, "error": "advance_s requiere mode=pasos"}), 409
+            if dt <= 0 or advance_s / dt > SIM_REPLAY_MAX_TICKS:
+                return jsonify({"ok": False, "error": f"dt inválido o más de {SIM_REPLAY_MAX_TICKS} ticks"}), 400
+            t0 = time.perf_counter()
+            with SIM_LOCK:
+                ticks = repetir(FLEET, SIM_CLOCK, advance_s, dt, circular=bool(d.get("loop")))
+                _SIM_LAST_T = SIM_CLOCK.now()     # el loop no debe volver a avanzar este tramo
+                buses = len(FLEET)
+            _sim_tick()
+            seg = time.perf_counter() - t0
+            return jsonify({"ok": True, **SIM_CLOCK.estado(), "ticks": ticks, "wall_s": round(seg, 3),
+                            "bus_ticks_per_s": round(ticks * buses / seg) if seg > 0 else None})
+    return jsonify({"ok": True, **SIM_CLOCK.estado()})
+
+@app.route("/sim/route_cache")
+def sim_route_cache():
+    return jsonify({"ok": True, "offline": ROUTE_CACHE_OFFLINE, **ROUTE_CACHE.stats()})
+
+@app.route("/sim/fleet")
+def sim_fleet():
+    with SIM_LOCK:
+        return jsonify({"ok": True, **FLEET.stats()})
+
+@app.route("/sim/stop_store")
+def sim_stop_store():
+    return jsonify({"ok": True, **STOP_STORE.stats()})
+
+# ==================== RED GTFS-Realtime ====================
+# Poller en segundo plano; solo si están las bindings y al menos una URL de feed
+# El poller no arranca al importar (lo importan bench, stop_store y el proceso padre del
+# reloader): arranca con la primera consulta /red/* o al servir desde __main__.
+RED_RT = None
+if _HAS_GTFS and (RED_VEH_POS_URL or RED_TRIP_UP_URL):
+    from red_client import RedRealtime
+    RED_RT = RedRealtime(RED_VEH_POS_URL or None, RED_TRIP_UP_URL or None, intervalo=RED_POLL_SEC, session=HTTP)
+_RED_RT_LOCK = threading.Lock()
+
+def _ensure_red_rt():
+    """Arranca el poller GTFS-RT la primera vez que se necesita (una vez por proceso)."""
+    if RED_RT is not None:
+        with _RED_RT_LOCK:
+            RED_RT.start()
+
+def _red_rt_off():
+    return jsonify({"ok": False, "error": "GTFS-RT no configurado (RED_VEH_POS_URL / RED_TRIP_UP_URL)"}), 503
+
+@app.route("/red/vehicles/route/<route_id>")
+def red_vehicles_route(route_id: str):
+    if RED_RT is None:
+        return _red_rt_off()
+    _ensure_red_rt()
+    return jsonify({"ok": True, "route_id": route_id, "vehicles": RED_RT.vehicles_on_route(route_id)})
+
+@app.route("/red/vehicles/trip/<trip_id>")
+def red_vehicle_trip(trip_id: str):
+    if RED_RT is None:
+        return _red_rt_off()
+    _ensure_red_rt()
+    return jsonify({"ok": True, "trip_id": trip_id, "vehicle": RED_RT.vehicle_for_trip(trip_id),
+                    "trip_update": RED_RT.trip_update(trip_id)})
+
+@app.route("/red/stops/<stop_id>/next")
+def red_stop_next(stop_id: str):
+    if RED_RT is None:
+        return _red_rt_off()
+    _ensure_red_rt()
+    try:
+        limit = max(1, min(int(request.args.get("limit", 10)), 100))
+    except ValueError:
+        return jsonify({"ok": False, "error": "limit must be an integer"}), 400
+    return jsonify({"ok": True, "stop_id": stop_id, "arrivals": RED_RT.next_arrivals(stop_id, limit=limit)})
+
+@app.route("/red/realtime")
+def red_realtime_stats():
+    if RED_RT is None:
+        return _red_rt_off()
+    _ensure_red_rt()
+    return jsonify({"ok": True, **RED_RT.stats()})
+
 # ==================== Fallback RED no oficial ====================
+def _xor_fetch(stop_id: str) -> Any:
+    r=HTTP.get(f"{XOR_URL}/{stop_id}",timeout=10)
+    r.raise_for_status()
+    return r.json()
+
+# Muchos usuarios mirando la misma parada comparten una sola llamada a api.xor.cl
+ARRIVALS_CACHE = ArrivalsCache(_xor_fetch, ttl_sec=ARRIVALS_TTL_SEC, stale_sec=ARRIVALS_STALE_SEC)
+
 @app.route("/red/arrivals/<stop_id>")
 def red_arrivals(stop_id:str):
     try:
-        r=requests.get(f"https://api.xor.cl/red/bus-stop/{stop_id}",timeout=10)
-        r.raise_for_status()
-        return jsonify({"ok":True,"data":r.json()})
+        data, estado, edad = ARRIVALS_CACHE.get(stop_id)
+        return jsonify({"ok":True,"data":data,"cache":estado,"age_s":round(edad,1)})
     except Exception as e:
         return jsonify({"ok":False,"error":str(e)}),500
 
+@app.route("/red/arrivals_cache")
+def red_arrivals_cache():
+    return jsonify({"ok": True, **ARRIVALS_CACHE.stats()})
+
 # ==================== Main ====================
 if __name__=="__main__":
     print("Servidor iniciado. Abre http://127.0.0.1:5000  (o http://<IP_LAN>:5000)")
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        _ensure_red_rt()        # solo el proceso hijo del reloader sirve requests
     app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file